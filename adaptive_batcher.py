@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 自适应批量大小控制
+按字节而不是行数划分写入批次，并根据实测吞吐量调整每张表的批次大小
+"""
+
+# pymysql 的 executemany 会把整批 INSERT 拼成一条多行语句，
+# 单批字节数必须低于服务器的 max_allowed_packet
+DEFAULT_PACKET_LIMIT = 64 * 1024 * 1024
+
+# 每行在SQL语句中除字段内容外的额外开销（引号、逗号、括号等）的估计值
+ROW_OVERHEAD_BYTES = 16
+
+
+def estimate_row_bytes(encoded_row, column_count):
+    """估计一行在多行INSERT语句中占用的字节数"""
+    return len(encoded_row) + column_count * 4 + ROW_OVERHEAD_BYTES
+
+
+class AdaptiveBatcher:
+    """
+    单张表的写入批次控制器
+
+    - 批次以字节为上限，上限不超过服务器单包大小的 safety 倍
+    - 每写入一批后记录 行数/耗时，按爬山法调整目标字节数：
+      吞吐量提升则继续沿当前方向调整，下降则反向
+    """
+
+    def __init__(self, packet_limit=DEFAULT_PACKET_LIMIT, initial_bytes=1024 * 1024,
+                 min_bytes=64 * 1024, max_rows=50000, safety=0.5, step=1.5):
+        self.packet_limit = packet_limit
+        self.limit_bytes = max(min_bytes, int(packet_limit * safety))
+        self.min_bytes = min_bytes
+        self.max_rows = max_rows
+        self.step = step
+        self.target_bytes = min(initial_bytes, self.limit_bytes)
+        self._direction = 1
+        self._last_rate = None
+        self.batches = 0
+        self.total_rows = 0
+        self.total_bytes = 0
+        self.total_seconds = 0.0
+        self.min_batch_rows = None
+        self.max_batch_rows = 0
+        self.target_history = [self.target_bytes]
+
+    def is_full(self, rows, nbytes):
+        """当前批次加入下一行后是否超出上限"""
+        return rows >= self.max_rows or nbytes > self.target_bytes
+
+    def iter_batches(self, items, sizes):
+        """按当前目标字节数把 items 切分为若干批"""
+        batch, batch_bytes = [], 0
+        for item, size in zip(items, sizes):
+            if batch and self.is_full(len(batch), batch_bytes + size):
+                yield batch, batch_bytes
+                batch, batch_bytes = [], 0
+            batch.append(item)
+            batch_bytes += size
+        if batch:
+            yield batch, batch_bytes
+
+    def record(self, rows, nbytes, seconds):
+        """记录一批的写入结果并调整下一批的目标字节数"""
+        if rows <= 0:
+            return
+        self.batches += 1
+        self.total_rows += rows
+        self.total_bytes += nbytes
+        self.total_seconds += seconds
+        self.min_batch_rows = rows if self.min_batch_rows is None else min(self.min_batch_rows, rows)
+        self.max_batch_rows = max(self.max_batch_rows, rows)
+
+        rate = rows / seconds if seconds > 0 else None
+        if rate is None:
+            return
+        if self._last_rate is not None and rate < self._last_rate * 0.95:
+            self._direction = -self._direction
+        self._last_rate = rate
+
+        if self._direction > 0:
+            target = int(self.target_bytes * self.step)
+        else:
+            target = int(self.target_bytes / self.step)
+        self.target_bytes = max(self.min_bytes, min(self.limit_bytes, target))
+        self.target_history.append(self.target_bytes)
+
+    def summary(self):
+        """批次大小和吞吐量统计，写入装载报告"""
+        return {
+            'packet_limit': self.packet_limit,
+            'batches': self.batches,
+            'rows': self.total_rows,
+            'bytes': self.total_bytes,
+            'avg_batch_rows': round(self.total_rows / self.batches, 1) if self.batches else 0,
+            'min_batch_rows': self.min_batch_rows or 0,
+            'max_batch_rows': self.max_batch_rows,
+            'final_target_bytes': self.target_bytes,
+            'target_bytes_history': self.target_history,
+            'rows_per_sec': round(self.total_rows / self.total_seconds, 1) if self.total_seconds else None,
+        }
@@ -0,0 +1,721 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 内存列式查询引擎
+把 data/*.csv 一次性读入按列存放的NumPy数组，不依赖数据库即可得到与 utils/database.js
+（DatabaseService）相同的看板结果：省份养分均值、pH区间分布、土壤类型分布、月度趋势和分页明细表。
+
+    数值列   - 整数列为int64（含空值时为float64，空值为NaN），小数列为float64
+    日期列   - datetime64，空值为NaT
+    文本列   - 字典编码：int32编码数组 + 去重后的取值数组，空值编码为 -1
+    连接     - 样本与地区、土壤类型、检测数据的左连接只计算一次行号映射并缓存；
+               键值范围紧凑时直接按键寻址，否则在排序后的键上二分查找
+    分组     - 在字典编码或月份编号上用 np.bincount 一次完成计数和求和
+
+用法:
+    python column_store.py --data-dir data
+    python column_store.py --data-dir data --scale 10000000      # 把样本复制到一千万个，测试查询耗时
+    python column_store.py --data-dir data --page 1 --location 四川 --ph-min 6
+    python column_store.py --snapshot snapshots/soil_data                   # 从列式快照读取
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+
+from summary_tables import PH_RANGES, SUMMARY_METRICS
+from table_schemas import TABLE_SCHEMAS, is_text_type
+
+# 看板查询用到的表和列，默认只读取这些列
+QUERY_COLUMNS = {
+    'regions': ['id', 'province', 'city', 'county'],
+    'soil_types': ['id', 'type_name'],
+    'soil_samples': ['id', 'sample_code', 'region_id', 'soil_type_id', 'sampling_date'],
+    'soil_test_data': ['id', 'sample_id'] + SUMMARY_METRICS,
+    'soil_quality_assessment': ['id', 'sample_id', 'comprehensive_grade'],
+}
+
+# 复制测试数据时需要偏移的外键：表 -> [(列, 被引用的表)]
+SCALE_KEYS = {
+    'soil_samples': [],
+    'soil_test_data': [('sample_id', 'soil_samples')],
+    'soil_quality_assessment': [('sample_id', 'soil_samples')],
+}
+
+# 排序时空日期的取值，降序时排在最后（与MySQL一致）
+NULL_DATE_KEY = -(1 << 62)
+
+# 键值范围不超过行数的这个倍数时直接寻址
+DENSE_KEY_FACTOR = 4
+
+
+def _column_kind(col_type):
+    """列类型 -> 'int' / 'float' / 'date' / 'datetime' / 'text'"""
+    upper = col_type.upper()
+    if upper.startswith(('INT', 'BIGINT', 'SMALLINT', 'TINYINT')):
+        return 'int'
+    if upper.startswith(('DECIMAL', 'DOUBLE', 'FLOAT', 'REAL')):
+        return 'float'
+    if upper == 'DATE':
+        return 'date'
+    if upper == 'DATETIME':
+        return 'datetime'
+    return 'text'
+
+
+def _to_column(kind, values):
+    """把数据库驱动返回的一列Python值转换为列数组"""
+    if kind in ('int', 'float'):
+        array = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+        if kind == 'int' and not np.isnan(array).any():
+            return array.astype(np.int64)
+        return array
+    if kind == 'date':
+        # SQLite返回文本，可能带有时间部分
+        return np.array([v[:10] if isinstance(v, str) else v for v in values], dtype='datetime64[D]')
+    if kind == 'datetime':
+        return np.array(values, dtype='datetime64[s]')
+    # PostgreSQL的JSON列返回Python对象，按文本保存
+    strings = [v if v is None or isinstance(v, str) else json.dumps(v, ensure_ascii=False) for v in values]
+    return DictColumn.encode(np.array(strings, dtype=object))
+
+
+# ----------------------------------------------------------------------
+# 列
+# ----------------------------------------------------------------------
+
+class DictColumn:
+    """字典编码的文本列：codes[i] 是第i行在 values 中的位置，-1 表示空值"""
+
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+    @classmethod
+    def encode(cls, strings):
+        codes, values = pd.factorize(strings)
+        return cls(codes.astype(np.int32), np.asarray(values, dtype=object))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def take(self, rows):
+        """按行号取值，行号 -1（左连接未匹配）得到空值；字典不变"""
+        codes = self.codes[rows]
+        if len(rows):
+            codes[rows < 0] = -1
+        return DictColumn(codes, self.values)
+
+    def concat(self, others):
+        """拼接共用同一字典的列"""
+        return DictColumn(np.concatenate([self.codes] + [o.codes for o in others]), self.values)
+
+    def match(self, predicate):
+        """对字典中每个取值求一次谓词，得到每行是否满足的布尔数组"""
+        hits = np.fromiter((bool(predicate(v)) for v in self.values), dtype=bool, count=len(self.values))
+        return (self.codes >= 0) & np.append(hits, False)[self.codes]
+
+    def decode(self, rows=None):
+        codes = self.codes if rows is None else self.codes[rows]
+        return [None if c < 0 else self.values[c] for c in codes]
+
+
+class StringColumn:
+    """
+    不做字典编码的文本列：第i行是 data[offsets[i]:offsets[i+1]] 的UTF-8字节，
+    nulls 为空值标记（没有空值时为 None）；几乎不重复的列（如样本编号）按这种方式存放。
+    整列首次解码后缓存解码结果
+    """
+
+    def __init__(self, offsets, data, nulls=None):
+        self.offsets = offsets
+        self.data = data
+        self.nulls = nulls
+        self._strings = None
+
+    @classmethod
+    def encode(cls, strings):
+        encoded = [b'' if v is None else v.encode('utf-8') for v in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(v) for v in encoded], out=offsets[1:])
+        nulls = np.fromiter((v is None for v in strings), dtype=bool, count=len(encoded))
+        return cls(offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8), nulls if nulls.any() else None)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def take(self, rows):
+        """按行号取值，行号 -1 得到空值"""
+        rows = np.asarray(rows)
+        missing = rows < 0
+        rows = np.where(missing, 0, rows)
+        starts = self.offsets[rows]
+        lengths = np.where(missing, 0, self.offsets[rows + 1] - starts)
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # 输出的第j个字节来自 data[starts[行] + (j - offsets[行])]
+        index = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        nulls = missing if self.nulls is None else missing | self.nulls[rows]
+        return StringColumn(offsets, np.asarray(self.data[index]), nulls if nulls.any() else None)
+
+    def concat(self, others):
+        """拼接多个文本列"""
+        columns = [self] + list(others)
+        lengths = [len(c.data) for c in columns]
+        starts = np.cumsum([0] + lengths[:-1])
+        offsets = np.concatenate([self.offsets[:1]] + [c.offsets[1:] - c.offsets[0] + start
+                                                        for c, start in zip(columns, starts)])
+        data = np.concatenate([np.asarray(c.data[c.offsets[0]:c.offsets[-1]]) for c in columns])
+        nulls = None
+        if any(c.nulls is not None for c in columns):
+            nulls = np.concatenate([np.zeros(len(c), dtype=bool) if c.nulls is None else c.nulls for c in columns])
+        return StringColumn(offsets - offsets[0], data, nulls)
+
+    def match(self, predicate):
+        values = self.decode()
+        return np.fromiter((v is not None and bool(predicate(v)) for v in values), dtype=bool, count=len(values))
+
+    def decode(self, rows=None):
+        if self._strings is not None:
+            return list(self._strings) if rows is None else [self._strings[i] for i in rows]
+        if rows is None:
+            # 整列解码时一次复制出全部字节，避免逐行切片 mmap 数组
+            blob, offsets = self.data.tobytes(), self.offsets.tolist()
+            nulls = [False] * len(self) if self.nulls is None else self.nulls.tolist()
+            self._strings = [None if null else blob[start:end].decode('utf-8')
+                             for start, end, null in zip(offsets, offsets[1:], nulls)]
+            return list(self._strings)
+        offsets, data, nulls = self.offsets, self.data, self.nulls
+        return [None if nulls is not None and nulls[i] else
+                bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8') for i in rows]
+
+
+def take_values(values, rows):
+    """按行号取数值/日期列，行号 -1（左连接未匹配）得到NaN/NaT"""
+    missing = rows < 0
+    if not missing.any():
+        return values[rows]
+    if values.dtype.kind in 'iu':
+        values = values.astype(np.float64)
+    result = values[rows]
+    result[missing] = np.datetime64('NaT') if result.dtype.kind == 'M' else np.nan
+    return result
+
+
+class ColumnTable:
+    """一张表的全部列，列名 -> NumPy数组或 DictColumn"""
+
+    def __init__(self, name, columns, num_rows):
+        self.name = name
+        self.columns = columns
+        self.num_rows = num_rows
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def take(self, column, rows):
+        values = self.columns[column]
+        return take_values(values, rows) if isinstance(values, np.ndarray) else values.take(rows)
+
+    @classmethod
+    def from_csv(cls, path, table_name, columns=None):
+        """按表结构读取CSV中的列；columns 为空时读取表结构中定义且CSV中存在的全部列"""
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            header = next(csv.reader(f))
+        schema = TABLE_SCHEMAS.get(table_name)
+        types = dict(schema['columns']) if schema else {name: 'TEXT' for name in header}
+        kinds = {name: _column_kind(types[name]) for name in header
+                 if name in types and (columns is None or name in columns)}
+
+        # 文本列保留空字符串（与装载到数据库的值一致），其余列的空字符串为空值
+        frame = pd.read_csv(
+            path, usecols=list(kinds), encoding='utf-8', keep_default_na=False,
+            dtype={name: (np.float64 if kind in ('int', 'float') else object) for name, kind in kinds.items()},
+            na_values={name: [''] for name, kind in kinds.items() if not is_text_type(types[name])},
+        )
+        data = {}
+        for name, kind in kinds.items():
+            series = frame[name]
+            if kind == 'int':
+                values = series.to_numpy(np.float64)
+                data[name] = values if np.isnan(values).any() else values.astype(np.int64)
+            elif kind == 'float':
+                data[name] = series.to_numpy(np.float64)
+            elif kind == 'date':
+                data[name] = pd.to_datetime(series.str.slice(0, 10), format='%Y-%m-%d',
+                                            errors='coerce').to_numpy('datetime64[D]')
+            elif kind == 'datetime':
+                data[name] = pd.to_datetime(series, format='%Y-%m-%d %H:%M:%S',
+                                            errors='coerce').to_numpy('datetime64[s]')
+            else:
+                data[name] = DictColumn.encode(series.to_numpy(object))
+        return cls(table_name, data, len(frame))
+
+    @classmethod
+    def from_database(cls, engine, table_name, columns=None, fetch_size=100000):
+        """从数据库流式读取一张表；columns 为空时读取表结构中定义且数据库中存在的全部列"""
+        existing = {c['name'] for c in inspect(engine).get_columns(table_name)}
+        types = dict(TABLE_SCHEMAS[table_name]['columns'])
+        names = [name for name in types if name in existing and (columns is None or name in columns)]
+        quote = engine.dialect.identifier_preparer.quote
+        values = {name: [] for name in names}
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(
+                text(f"SELECT {', '.join(quote(n) for n in names)} FROM {quote(table_name)}"))
+            while True:
+                rows = result.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for name, column in zip(names, zip(*rows)):
+                    values[name].extend(column)
+        data = {name: _to_column(_column_kind(types[name]), values.pop(name)) for name in names}
+        num_rows = len(next(iter(data.values()))) if data else 0
+        return cls(table_name, data, num_rows)
+
+    def replicate(self, factor, offsets):
+        """把整张表复制 factor 份，offsets 为 列名 -> 每份的键值偏移（用于生成测试数据）"""
+        columns = {}
+        for name, values in self.columns.items():
+            if isinstance(values, (DictColumn, StringColumn)):
+                columns[name] = values.concat([values] * (factor - 1))
+                continue
+            tiled = np.tile(values, factor)
+            if name in offsets:
+                tiled = tiled + np.repeat(np.arange(factor, dtype=tiled.dtype) * offsets[name], self.num_rows)
+            columns[name] = tiled
+        return ColumnTable(self.name, columns, self.num_rows * factor)
+
+
+# ----------------------------------------------------------------------
+# 连接
+# ----------------------------------------------------------------------
+
+class JoinIndex:
+    """
+    连接的构建侧：键值 -> 行号
+
+    键值范围紧凑时建立按键寻址的 起始位置/个数 数组，否则保存排序后的键做二分查找；
+    键值唯一（维表主键）时查找结果就是一个行号数组。
+    """
+
+    def __init__(self, keys):
+        valid = ~np.isnan(keys) if keys.dtype.kind == 'f' else np.ones(len(keys), dtype=bool)
+        rows = np.flatnonzero(valid)
+        keys = keys[valid].astype(np.int64)
+        self.low = int(keys.min()) if len(keys) else 0
+        span = int(keys.max()) - self.low + 1 if len(keys) else 0
+        self.dense = span <= max(len(keys), 1) * DENSE_KEY_FACTOR
+        if self.dense:
+            counts = np.bincount(keys - self.low, minlength=span)
+            self.unique = not len(counts) or counts.max() <= 1
+            if self.unique:
+                self.slots = np.full(span, -1, dtype=np.int64)
+                self.slots[keys - self.low] = rows
+                return
+            self.counts = counts
+            self.starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            self.rows = rows[np.argsort(keys, kind='stable')]
+        else:
+            order = np.argsort(keys, kind='stable')
+            self.sorted_keys = keys[order]
+            self.rows = rows[order]
+            self.unique = not np.any(self.sorted_keys[1:] == self.sorted_keys[:-1])
+
+    def _ranges(self, probe):
+        """每个探测键在 self.rows 中的 (起始位置, 个数)"""
+        if self.dense:
+            index = probe - self.low
+            inside = (index >= 0) & (index < len(self.counts))
+            index = np.where(inside, index, 0)
+            return self.starts[index], np.where(inside, self.counts[index], 0)
+        starts = np.searchsorted(self.sorted_keys, probe, side='left')
+        return starts, np.searchsorted(self.sorted_keys, probe, side='right') - starts
+
+    def _probe_keys(self, probe):
+        if probe.dtype.kind == 'f':
+            valid = ~np.isnan(probe)
+            return np.where(valid, probe, self.low - 1).astype(np.int64)
+        return probe.astype(np.int64, copy=False)
+
+    def lookup_unique(self, probe):
+        """唯一键的左连接：每个探测键匹配的行号，未匹配为 -1"""
+        if not self.unique:
+            raise ValueError("连接键不唯一")
+        probe = self._probe_keys(probe)
+        if self.dense:
+            index = probe - self.low
+            inside = (index >= 0) & (index < len(self.slots))
+            return np.where(inside, self.slots[np.where(inside, index, 0)], -1)
+        starts, counts = self._ranges(probe)
+        return np.where(counts > 0, self.rows[np.minimum(starts, len(self.rows) - 1)], -1) \
+            if len(self.rows) else np.full(len(probe), -1, dtype=np.int64)
+
+    def lookup(self, probe):
+        """
+        左连接：返回 (探测侧行号, 构建侧行号)，一个探测键匹配多行时探测侧行号重复，
+        未匹配的探测行保留一行，构建侧行号为 -1
+        """
+        if self.unique:
+            return np.arange(len(probe)), self.lookup_unique(probe)
+        starts, counts = self._ranges(self._probe_keys(probe))
+        out = np.maximum(counts, 1)
+        probe_rows = np.repeat(np.arange(len(probe)), out)
+        # 每个输出行在所属探测行中的序号
+        first = np.concatenate(([0], np.cumsum(out)[:-1]))
+        step = np.arange(len(probe_rows)) - np.repeat(first, out)
+        matched = np.repeat(counts > 0, out)
+        build_rows = np.full(len(probe_rows), -1, dtype=np.int64)
+        build_rows[matched] = self.rows[(np.repeat(starts, out) + step)[matched]]
+        return probe_rows, build_rows
+
+
+# ----------------------------------------------------------------------
+# 分组
+# ----------------------------------------------------------------------
+
+def group_stats(groups, num_groups, metrics):
+    """
+    按分组编号聚合，编号 -1 的行不参与
+
+    返回 (每组行数, {指标: (每组非空个数, 每组和)})
+    """
+    keep = groups >= 0
+    filtered = not keep.all()
+    # bincount 内部会把编号转换为intp，预先转换一次供各指标复用
+    groups = (groups[keep] if filtered else groups).astype(np.intp, copy=False)
+    counts = np.bincount(groups, minlength=num_groups)
+    stats = {}
+    for name, values in metrics.items():
+        if filtered:
+            values = values[keep]
+        valid = ~np.isnan(values)
+        if valid.all():
+            stats[name] = (counts, np.bincount(groups, weights=values, minlength=num_groups))
+        else:
+            stats[name] = (np.bincount(groups, weights=valid, minlength=num_groups),
+                           np.bincount(groups, weights=np.where(valid, values, 0.0), minlength=num_groups))
+    return counts, stats
+
+
+def _mean(stats, name, group):
+    n, total = stats[name]
+    return float(total[group] / n[group]) if n[group] else None
+
+
+def _months_before(today, months):
+    """today 往前 months 个月的同一天（月末按该月最后一天），与 DATE_SUB(.., INTERVAL n MONTH) 一致"""
+    index = today.year * 12 + today.month - 1 - months
+    year, month = index // 12, index % 12 + 1
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    last_day = (np.datetime64(next_month, 'D') - np.timedelta64(1, 'D')).astype(object).day
+    return date(year, month, min(today.day, last_day))
+
+
+def _number(value):
+    """与前端的 parseFloat(x) || 0 一致"""
+    return 0.0 if value is None or math.isnan(value) else float(value)
+
+
+# ----------------------------------------------------------------------
+# 查询引擎
+# ----------------------------------------------------------------------
+
+class ColumnStore:
+    """
+    内存列式存储及看板查询
+
+    load()           - 读取 data/*.csv 中的各表
+    load_snapshot()  - 以 mmap 打开 table_snapshot.py 生成的快照
+    scale(n)         - 把样本及其检测、评估数据复制到约 n 个样本（性能测试）
+    各查询方法的返回结构与 SummaryTables 的同名方法一致，soil_data_table 与 getSoilDataTable 一致
+    """
+
+    def __init__(self, data_dir="data"):
+        self.data_dir = data_dir
+        self.tables = {}
+        self._joins = {}
+
+    def load(self, columns=QUERY_COLUMNS):
+        """读取各表；columns 为 表名 -> 列名列表（None 表示全部列）"""
+        for table_name, names in columns.items():
+            path = os.path.join(self.data_dir, f"{table_name}.csv")
+            if not os.path.exists(path):
+                print(f"⚠️  {path} 不存在，跳过")
+                continue
+            self.tables[table_name] = ColumnTable.from_csv(path, table_name, names)
+        self._joins = {}
+        return self
+
+    def load_snapshot(self, path, tables=None):
+        """打开列式快照代替读取CSV；tables 为空时打开看板查询用到的表"""
+        # 延迟导入，table_snapshot 本身也引用本模块
+        from table_snapshot import open_snapshot
+
+        self.tables.update(open_snapshot(path, tables or list(QUERY_COLUMNS)))
+        self._joins = {}
+        return self
+
+    def scale(self, num_samples):
+        """复制样本表及引用样本的表，使样本数达到约 num_samples 个，ID按份偏移"""
+        samples = self.tables['soil_samples']
+        factor = max(1, -(-num_samples // len(samples)))
+        if factor == 1:
+            return len(samples)
+        id_offsets = {name: int(np.nanmax(self.tables[name]['id'])) for name in SCALE_KEYS if name in self.tables}
+        for table_name, keys in SCALE_KEYS.items():
+            if table_name not in self.tables:
+                continue
+            offsets = {'id': id_offsets[table_name]}
+            offsets.update({column: id_offsets[target] for column, target in keys})
+            self.tables[table_name] = self.tables[table_name].replicate(factor, offsets)
+        self._joins = {}
+        return len(self.tables['soil_samples'])
+
+    def _join(self, table_name, column='id'):
+        key = (table_name, column)
+        if key not in self._joins:
+            self._joins[key] = JoinIndex(self.tables[table_name][column])
+        return self._joins[key]
+
+    def _sample_rows(self):
+        """
+        看板的连接结果（样本 LEFT JOIN 地区、土壤类型、检测数据）中每一行对应的各表行号，
+        未匹配为 -1；一个样本有多条检测数据时样本行重复，与SQL一致
+        """
+        if 'sample_rows' not in self._joins:
+            samples = self.tables['soil_samples']
+            s_rows, t_rows = self._join('soil_test_data', 'sample_id').lookup(samples['id'])
+            region_rows = self._join('regions').lookup_unique(samples['region_id'])
+            type_rows = self._join('soil_types').lookup_unique(samples['soil_type_id'])
+            # 每个样本至多一条检测数据时连接结果与样本一一对应，不需要按样本行号展开
+            expanded = len(s_rows) != len(samples)
+            self._joins['sample_types'] = type_rows
+            self._joins['sample_rows'] = {
+                's': s_rows,
+                't': t_rows,
+                'r': region_rows[s_rows] if expanded else region_rows,
+                'st': type_rows[s_rows] if expanded else type_rows,
+            }
+        return self._joins['sample_rows']
+
+    def _test_metrics(self, t_rows, metrics):
+        tests = self.tables['soil_test_data']
+        return {m: tests.take(m, t_rows) for m in metrics}
+
+    # ------------------------------------------------------------------
+    # 看板查询
+    # ------------------------------------------------------------------
+
+    def region_nutrient_stats(self, limit=10):
+        """对应 getRegionNutrientStats：记录数最多的省份及其养分均值"""
+        rows = self._sample_rows()
+        province = self.tables['regions']['province'].take(rows['r'])
+        counts, stats = group_stats(province.codes, len(province.values),
+                                    self._test_metrics(rows['t'], SUMMARY_METRICS[1:]))
+        order = np.argsort(-counts, kind='stable')[:limit]
+        return [dict(province=province.values[g], sample_count=int(counts[g]),
+                     **{m: _mean(stats, m, g) for m in SUMMARY_METRICS[1:]})
+                for g in order if counts[g] > 0]
+
+    def ph_distribution(self):
+        """对应 getPhDistributionStats：各pH区间的检测记录数"""
+        ph = self.tables['soil_test_data']['ph_value']
+        # 区间编号为不小于的边界个数；NaN的比较结果都为假，落在第0个区间，计数时扣除
+        bucket = np.zeros(len(ph), dtype=np.intp)
+        for upper, _ in PH_RANGES[:-1]:
+            bucket += ph >= upper
+        counts = np.bincount(bucket, minlength=len(PH_RANGES))
+        counts[0] -= np.count_nonzero(np.isnan(ph))
+        return [{'ph_range': label, 'count': int(count)} for (_, label), count in zip(PH_RANGES, counts) if count]
+
+    def soil_texture_stats(self):
+        """对应 getSoilTextureStats：各土壤类型的样本数"""
+        self._sample_rows()
+        type_rows = self._joins['sample_types']
+        type_name = self.tables['soil_types']['type_name']
+        # 先按土壤类型表的行计数，再把几十行的计数按类型名称汇总
+        per_row = np.bincount(type_rows[type_rows >= 0], minlength=len(type_name))
+        named = type_name.codes >= 0
+        counts = np.bincount(type_name.codes[named], weights=per_row[named], minlength=len(type_name.values))
+        order = np.argsort(-counts, kind='stable')
+        return [{'texture': type_name.values[g], 'count': int(counts[g])} for g in order if counts[g] > 0]
+
+    def nutrient_trend(self, months=12, today=None):
+        """对应 getNutrientTrendData：采样日期在最近若干个月内的样本按月的养分均值"""
+        rows = self._sample_rows()
+        since = np.datetime64(_months_before(today or date.today(), months), 'D')
+        sampled = self.tables['soil_samples']['sampling_date'][rows['s']]
+        keep = sampled >= since
+        month = sampled[keep].astype('datetime64[M]').astype(np.int64)
+        if not len(month):
+            return []
+        first = int(month.min())
+        counts, stats = group_stats(month - first, int(month.max()) - first + 1,
+                                    self._test_metrics(rows['t'][keep], SUMMARY_METRICS[1:]))
+        return [dict(month=str(np.datetime64(int(first + g), 'M')), sample_count=int(counts[g]),
+                     **{m: _mean(stats, m, g) for m in SUMMARY_METRICS[1:]})
+                for g in np.flatnonzero(counts)]
+
+    def statistics_overview(self):
+        """对应 getStatisticsOverview：样本总数、覆盖省份数、pH均值（含标准差）和质量等级分布"""
+        ph = self.tables['soil_test_data']['ph_value']
+        valid = ~np.isnan(ph)
+        if not valid.all():
+            ph = ph[valid]
+        province = self.tables['regions']['province']
+        overview = {
+            'total_samples': len(self.tables['soil_samples']),
+            'provinces_covered': int(len(np.unique(province.codes[province.codes >= 0]))),
+            'average_ph': float(ph.mean()) if len(ph) else None,
+            'ph_std': float(ph.std()) if len(ph) else None,
+            'quality_distribution': [],
+        }
+        if 'soil_quality_assessment' in self.tables:
+            grade = self.tables['soil_quality_assessment']['comprehensive_grade']
+            codes = grade.codes[grade.codes >= 0].astype(np.intp)
+            counts = np.bincount(codes, minlength=len(grade.values))
+            overview['quality_distribution'] = [{'level': grade.values[g], 'count': int(counts[g])}
+                                                for g in np.flatnonzero(counts)]
+        return overview
+
+    def soil_data_table(self, page=1, page_size=10, filters=None):
+        """对应 getSoilDataTable：按地点、pH筛选后按采样日期倒序分页的明细"""
+        filters = filters or {}
+        rows = self._sample_rows()
+        regions = self.tables['regions']
+        tests = self.tables['soil_test_data']
+        keep = np.ones(len(rows['s']), dtype=bool)
+        if filters.get('location'):
+            # LIKE '%..%' 只需对每个字典取值判断一次，再按地区行号展开到连接结果
+            needle = filters['location'].casefold()
+            matched = np.zeros(len(regions), dtype=bool)
+            for column in ('province', 'city', 'county'):
+                matched |= regions[column].match(lambda v: needle in v.casefold())
+            keep &= (rows['r'] >= 0) & matched[np.maximum(rows['r'], 0)]
+        if filters.get('phMin') is not None:
+            keep &= tests.take('ph_value', rows['t']) >= float(filters['phMin'])
+        if filters.get('phMax') is not None:
+            keep &= tests.take('ph_value', rows['t']) <= float(filters['phMax'])
+        selected = np.flatnonzero(keep)
+        total = len(selected)
+
+        # 只对前 offset+page_size 个候选行排序：第k大的日期之前的行全部入选，与其相等的行按原顺序补足
+        offset = (page - 1) * page_size
+        wanted = min(offset + page_size, total)
+        page_rows = selected[:0]
+        if wanted > offset:
+            sampled = self.tables['soil_samples']['sampling_date'][rows['s'][selected]]
+            sort_key = np.where(np.isnat(sampled), NULL_DATE_KEY, sampled.astype(np.int64))
+            kth = np.partition(sort_key, total - wanted)[total - wanted]
+            above = np.flatnonzero(sort_key > kth)
+            ties = np.flatnonzero(sort_key == kth)[:wanted - len(above)]
+            candidates = np.concatenate([above, ties])
+            candidates = candidates[np.lexsort((candidates, -sort_key[candidates]))]
+            page_rows = selected[candidates[offset:wanted]]
+
+        samples = self.tables['soil_samples']
+        s_rows = rows['s'][page_rows]
+        r_rows = rows['r'][page_rows]
+        t_rows = rows['t'][page_rows]
+        parts = zip(*(regions.take(c, r_rows).decode() for c in ('province', 'city', 'county')))
+        # CONCAT 任一参数为NULL时结果为NULL
+        location = [None if None in p else ''.join(p) for p in parts]
+        codes = samples['sample_code'].decode(s_rows)
+        dates = samples['sampling_date'][s_rows]
+        texture = self.tables['soil_types']['type_name'].take(rows['st'][page_rows]).decode()
+        metric = {m: tests.take(m, t_rows) for m in
+                  ('ph_value', 'total_nitrogen', 'available_phosphorus', 'available_potassium', 'organic_matter')}
+        data = []
+        for i, s in enumerate(s_rows):
+            data.append({
+                'id': codes[i] or int(samples['id'][s]),
+                'time': None if np.isnat(dates[i]) else str(dates[i]),
+                'location': location[i],
+                'ph': _number(metric['ph_value'][i]),
+                'nitrogen': _number(metric['total_nitrogen'][i]),
+                'phosphorus': _number(metric['available_phosphorus'][i]),
+                'potassium': _number(metric['available_potassium'][i]),
+                'organic': _number(metric['organic_matter'][i]),
+                'texture': texture[i] or '未知',
+            })
+        return {
+            'data': data,
+            'total': total,
+            'page': page,
+            'pageSize': page_size,
+            'totalPages': math.ceil(total / page_size),
+        }
+
+
+def _timed(name, func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    print(f"  {name}: {(time.time() - start) * 1000:.1f}ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内存列式引擎计算看板结果")
+    parser.add_argument('--data-dir', default='data', help="CSV数据目录")
+    parser.add_argument('--snapshot', help="从 table_snapshot.py 生成的快照目录读取，代替CSV")
+    parser.add_argument('--scale', type=int, default=0, help="把样本复制到N个后再查询（性能测试）")
+    parser.add_argument('--page', type=int, default=1, help="明细表页码")
+    parser.add_argument('--page-size', type=int, default=10, help="明细表每页行数")
+    parser.add_argument('--location', help="明细表按省/市/县筛选")
+    parser.add_argument('--ph-min', type=float, help="明细表pH下限")
+    parser.add_argument('--ph-max', type=float, help="明细表pH上限")
+    args = parser.parse_args()
+
+    start = time.time()
+    store = ColumnStore(args.data_dir)
+    if args.snapshot:
+        store.load_snapshot(args.snapshot)
+    else:
+        store.load()
+    print(f"📥 读取{'快照' if args.snapshot else 'CSV'}耗时 {time.time() - start:.2f}s: "
+          + ", ".join(f"{name} {len(table):,}" for name, table in store.tables.items()))
+    if args.scale:
+        start = time.time()
+        count = store.scale(args.scale)
+        print(f"🧬 样本复制到 {count:,} 个，耗时 {time.time() - start:.2f}s")
+
+    print("⏱️  查询耗时:")
+    _timed("连接（首次查询时建立，之后复用）", store._sample_rows)
+    regions = _timed("省份养分均值", store.region_nutrient_stats)
+    ph = _timed("pH区间分布", store.ph_distribution)
+    _timed("土壤类型分布", store.soil_texture_stats)
+    _timed("月度趋势", store.nutrient_trend)
+    overview = _timed("统计概况", store.statistics_overview)
+    filters = {'location': args.location, 'phMin': args.ph_min, 'phMax': args.ph_max}
+    table = _timed("明细分页", store.soil_data_table, args.page, args.page_size, filters)
+
+    print(f"📊 样本 {overview['total_samples']:,} 个，覆盖 {overview['provinces_covered']} 个省份，"
+          f"平均pH {overview['average_ph'] or 0:.2f}")
+    print("🧪 pH分布: " + ", ".join(f"{r['ph_range']} {r['count']:,}" for r in ph))
+    print("🗺️  省份（前10）:")
+    for r in regions:
+        print(f"    {r['province']:<12} {r['sample_count']:>8,}  有机质 {r['organic_matter'] or 0:.2f}  "
+              f"全氮 {r['total_nitrogen'] or 0:.2f}")
+    print(f"📋 明细第 {table['page']}/{table['totalPages']} 页（共 {table['total']:,} 行）:")
+    for row in table['data']:
+        print(f"    {row['id']}  {row['time']}  {row['location']}  pH {row['ph']:.2f}  {row['texture']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
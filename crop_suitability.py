@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 作物适宜性评价
+对每个样本评价全部作物（crop_types），代替生成数据时每个样本随机5-8种作物、随机分数的 crop_suitability。
+
+    pH        - 以作物 suitable_ph_min/suitable_ph_max 为适宜区间的梯形隶属度，两侧各放宽 PH_TOLERANCE
+    养分      - 土壤速效养分供应量（mg/kg × 2.25 折算为 kg/hm²，再乘利用率）与作物 nutrient_requirements
+                中 N/P/K 需求量之比，比值达到1为满足
+    土壤基础  - 有机质、盐分、容重的隶属度（与作物无关，参数同 soil_quality_scoring）
+    suitability_score = 100 × 三者加权平均；缺少的部分不参与，权重按其余部分重新归一
+
+样本属性矩阵 (样本数, 1) 与作物需求矩阵 (1, 作物数) 广播计算，样本按块处理，
+每块大小由 --memory-mb 限定，使中间数组不超过内存上限。结果可以写成：
+
+    稠密矩阵  - --matrix DIR：scores.npy（样本数×作物数，float32，按块写入 mmap）、sample_ids.npy、crop_ids.npy
+    前K个作物 - 每个样本评分最高的K个作物，按 crop_suitability 的格式写入数据库或CSV（--top-k 0 为全部作物）
+
+适宜等级与生成数据时一致：≥80 高度适宜，≥70 中度适宜，≥60 勉强适宜，其余不适宜。
+没有气候数据，limiting_factors 中 climate_limitation 恒为 false。
+
+用法:
+    python crop_suitability.py --url sqlite:///soil_data.db --top-k 8
+    python crop_suitability.py --data-dir data --matrix matrices/crop_suitability
+    python crop_suitability.py --data-dir data --top-k 3 --output suitability.csv
+    python crop_suitability.py --synthetic 200000 --top-k 5 --dry-run             # 随机样本测试吞吐量
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+import soil_quality_scoring as quality
+
+# 速效养分 -> (土壤检测字段, 利用率)；mg/kg × 2.25 为 0-20cm 耕层的 kg/hm²
+NUTRIENTS = {
+    'N': ('available_nitrogen', 0.6),
+    'P': ('available_phosphorus', 0.4),
+    'K': ('available_potassium', 0.5),
+}
+SOIL_CONVERSION = 2.25
+NUTRIENT_WEIGHTS = {'N': 0.4, 'P': 0.3, 'K': 0.3}
+SUPPLY_MEMBERSHIP = (0.3, 1.0, np.inf, np.inf)   # 供需比从0.3到1线性升到满足
+BASE_FIELDS = ['organic_matter', 'salinity', 'bulk_density']
+SCORE_WEIGHTS = {'ph': 0.4, 'nutrient': 0.35, 'base': 0.25}
+PH_TOLERANCE = 1.0
+LIMIT_MEMBERSHIP = 0.6           # pH或养分隶属度低于此值时记为限制因子
+
+LEVEL_BOUNDS = ((80, '高度适宜'), (70, '中度适宜'), (60, '勉强适宜'))
+LOWEST_LEVEL = '不适宜'
+# 与各适宜等级对应
+RISK_TEXTS = ("风险较低，适宜种植", "风险中等，需要适当管理", "风险较高，需要重点关注", "风险很高，不建议种植")
+YIELD_PER_POINT = 12.0           # 产量潜力按评分线性折算（kg/亩）
+
+# (pH受限, 养分受限) -> 管理建议
+RECOMMENDATIONS = {
+    (False, False): "科学轮作，避免连作障碍",
+    (True, False): "改良土壤，提高地力",
+    (False, True): "加强田间管理，及时灌溉施肥",
+    (True, True): "改良土壤，提高地力；加强田间管理，及时灌溉施肥",
+}
+
+TOP_K = 8
+MEMORY_MB = 256
+WORK_ARRAYS = 8                  # 每个 (样本, 作物) 单元同时存在的float32中间数组个数（估计值）
+INSERT_BATCH = 5000
+
+
+def _numbers(frame, name):
+    if name not in frame:
+        return np.full(len(frame), np.nan)
+    return pd.to_numeric(frame[name], errors='coerce').to_numpy(np.float64)
+
+
+def nutrient_supply(frame):
+    """样本的 N/P/K 供应量（kg/hm²），(样本数, 3)"""
+    return np.column_stack([_numbers(frame, field) * SOIL_CONVERSION * rate
+                            for field, rate in NUTRIENTS.values()])
+
+
+def crop_requirements(crops):
+    """作物的 N/P/K 需求量（kg/hm²），(作物数, 3)；nutrient_requirements 缺项为 NaN"""
+    def parse(value):
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                return {}
+        return value if isinstance(value, dict) else {}
+
+    parsed = [parse(v) for v in crops['nutrient_requirements']]
+    return np.array([[float(r[n]) if r.get(n) is not None else np.nan for n in NUTRIENTS] for r in parsed],
+                    dtype=np.float64).reshape(len(parsed), len(NUTRIENTS))
+
+
+def _weighted_mean(parts):
+    """parts 为 (数组, 权重) 列表，忽略 NaN 后的加权平均；全部为 NaN 时为 NaN"""
+    total = weight_sum = 0
+    for values, weight in parts:
+        present = ~np.isnan(values)
+        total = total + np.where(present, values * weight, 0)
+        weight_sum = weight_sum + present * weight
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / weight_sum
+
+
+class SuitabilityEngine:
+    """
+    样本×作物适宜性评分
+
+    crops 为 crop_types 表（id、crop_name、suitable_ph_min、suitable_ph_max、nutrient_requirements）。
+    evaluate() 对一块样本返回 (评分, pH受限, 养分受限) 三个 (样本数, 作物数) 矩阵。
+    """
+
+    def __init__(self, crops, memory_mb=MEMORY_MB):
+        self.crop_ids = pd.to_numeric(crops['id']).to_numpy(np.int64)
+        ph_min = _numbers(crops, 'suitable_ph_min')
+        ph_max = _numbers(crops, 'suitable_ph_max')
+        self.ph_params = np.column_stack([ph_min - PH_TOLERANCE, ph_min, ph_max, ph_max + PH_TOLERANCE])
+        self.requirements = crop_requirements(crops)
+        self.base_params = {field: quality.trapezoid(*quality.MEMBERSHIP_RULES[field]) for field in BASE_FIELDS}
+
+        # 梯形隶属度写成两条直线 min(x×上升斜率+截距, x×下降斜率+截距) 截到 [0, 1]，
+        # 每个作物的斜率和截距预先算好，广播时只做乘加；作物没有适宜pH时斜率为0、截距为1，不限制
+        a, b, c, d = self.ph_params.T
+        no_ph = np.isnan(ph_min) | np.isnan(ph_max)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.ph_lines = np.array([np.where(no_ph, 0, 1 / (b - a)), np.where(no_ph, 1, -a / (b - a)),
+                                      np.where(no_ph, 0, -1 / (d - c)), np.where(no_ph, 1, d / (d - c))],
+                                     dtype=np.float32)
+            # 供需比 supply/requirement 从 lo 升到 hi：斜率 1/((hi-lo)×需求量)、截距 -lo/(hi-lo)；
+            # 作物对该养分没有需求时斜率为0、截距为1，视为满足
+            lo, hi = SUPPLY_MEMBERSHIP[:2]
+            missing = np.isnan(self.requirements)
+            self.nutrient_slopes = np.where(missing, 0, 1 / ((hi - lo) * self.requirements)).astype(np.float32)
+            self.nutrient_intercepts = np.where(missing, 1, -lo / (hi - lo)).astype(np.float32)
+        # 每块样本数：中间数组约 WORK_ARRAYS 个 float32 的 (块大小, 作物数) 矩阵
+        self.block_rows = max(1, memory_mb * 1024 * 1024 // (max(len(self.crop_ids), 1) * 4 * WORK_ARRAYS))
+
+    @staticmethod
+    def _lines(x, slope_up, intercept_up, slope_down, intercept_down):
+        """x 为 (样本数, 1)，其余为 (作物数,)；返回截到 [0, 1] 的 min(上升直线, 下降直线)"""
+        up = x * slope_up
+        up += intercept_up
+        down = x * slope_down
+        down += intercept_down
+        np.minimum(up, down, out=up)
+        return np.clip(up, 0, 1, out=up)
+
+    def evaluate(self, frame):
+        """
+        评分 = Σ 各部分隶属度 × 权重；缺少的部分按样本重新归一权重，
+        因此每个样本的权重不同，但每个部分只需一个 (样本数, 作物数) 矩阵
+        """
+        # ph_m、nutrient_m 为未加最低隶属度的 [0, 1] 值，隶属度 = floor + (1-floor)×值，
+        # 这一步并入每个样本的权重和常数项，限制因子的阈值相应换算
+        floor = quality.MIN_MEMBERSHIP
+        limit = np.float32((LIMIT_MEMBERSHIP - floor) / (1 - floor))
+        ph = _numbers(frame, 'ph_value')
+        has_ph = ~np.isnan(ph)
+        ph_m = self._lines(np.where(has_ph, ph, 0).astype(np.float32)[:, None], *self.ph_lines)
+
+        supply = nutrient_supply(frame)
+        present = ~np.isnan(supply)
+        nutrient_weights = present * np.array([NUTRIENT_WEIGHTS[n] for n in NUTRIENTS])
+        nutrient_total = nutrient_weights.sum(axis=1)
+        has_nutrient = nutrient_total > 0
+        nutrient_weights = (nutrient_weights / np.where(has_nutrient, nutrient_total, 1)[:, None]).astype(np.float32)
+        supply = np.where(present, supply, 0).astype(np.float32)
+        nutrient_m = np.zeros((len(frame), len(self.crop_ids)), dtype=np.float32)
+        for k in range(len(NUTRIENTS)):
+            m = supply[:, k][:, None] * self.nutrient_slopes[:, k]
+            m += self.nutrient_intercepts[:, k]
+            np.clip(m, 0, 1, out=m)
+            m *= nutrient_weights[:, k][:, None]
+            nutrient_m += m
+
+        base_m = _weighted_mean([(quality.membership(_numbers(frame, field), params), 1.0)
+                                 for field, params in self.base_params.items()])
+        has_base = ~np.isnan(base_m)
+        weights = np.column_stack([has_ph * SCORE_WEIGHTS['ph'], has_nutrient * SCORE_WEIGHTS['nutrient'],
+                                   has_base * SCORE_WEIGHTS['base']])
+        total = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weights = 100 * weights / total[:, None]
+        constant = (weights[:, 0] + weights[:, 1]) * floor + np.where(has_base, base_m, 0) * weights[:, 2]
+        weights = (weights * (1 - floor)).astype(np.float32)
+
+        scores = ph_m * weights[:, 0][:, None]
+        scores += nutrient_m * weights[:, 1][:, None]
+        scores += constant.astype(np.float32)[:, None]
+        np.round(scores, 2, out=scores)
+        return (scores, (ph_m < limit) & has_ph[:, None], (nutrient_m < limit) & has_nutrient[:, None])
+
+    def blocks(self, frames):
+        """把按块读出的样本再切成不超过内存上限的块"""
+        for frame in frames:
+            for start in range(0, len(frame), self.block_rows):
+                yield frame.iloc[start:start + self.block_rows]
+
+    def top_k(self, scores, k):
+        """每行评分最高的k列，按评分从高到低（同分按作物顺序）排列，返回列下标 (行数, k)"""
+        k = min(k, scores.shape[1]) if k else scores.shape[1]
+        # 取负后升序排列，NaN（无法评分的样本）排在最后
+        keys = np.negative(scores)
+        if k < scores.shape[1]:
+            candidates = np.argpartition(keys, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        values = np.take_along_axis(keys, candidates, axis=1)
+        order = np.lexsort((candidates, values), axis=1)
+        return np.take_along_axis(candidates, order, axis=1)
+
+    def rows(self, frame, scores, ph_limited, nutrient_limited, k):
+        """前k个作物的评价结果，crop_suitability 格式（不含 id、created_at）"""
+        columns = self.top_k(scores, k)
+        k = columns.shape[1]
+        picked = np.take_along_axis(scores, columns, axis=1).ravel().astype(np.float64)
+        ph_flag = np.take_along_axis(ph_limited, columns, axis=1).ravel()
+        nutrient_flag = np.take_along_axis(nutrient_limited, columns, axis=1).ravel()
+
+        thresholds = np.array([bound for bound, _ in LEVEL_BOUNDS])
+        levels = np.array([level for _, level in LEVEL_BOUNDS] + [LOWEST_LEVEL], dtype=object)
+        level_index = np.searchsorted(-thresholds, -np.nan_to_num(picked, nan=-np.inf), side='right')
+        code = ph_flag.astype(np.int64) * 2 + nutrient_flag
+        factor_texts = np.array([json.dumps({"ph_limitation": bool(c & 2), "nutrient_limitation": bool(c & 1),
+                                             "climate_limitation": False}, ensure_ascii=False)
+                                 for c in range(4)], dtype=object)
+        recommendation_texts = np.array([RECOMMENDATIONS[(bool(c & 2), bool(c & 1))] for c in range(4)], dtype=object)
+        rows = pd.DataFrame({
+            'sample_id': np.repeat(_numbers(frame, 'sample_id').astype(np.int64), k),
+            'crop_id': self.crop_ids[columns.ravel()],
+            'suitability_score': np.round(picked, 2),
+            'suitability_level': levels[level_index],
+            'limiting_factors': factor_texts[code],
+            'yield_potential': np.round(picked * YIELD_PER_POINT, 2),
+            'risk_assessment': np.asarray(RISK_TEXTS, dtype=object)[level_index],
+            'management_recommendations': recommendation_texts[code],
+            'assessment_date': np.repeat(quality.assessment_dates(frame), k),
+        })
+        # 没有任何检测值的样本无法评分，不输出
+        return rows[~np.isnan(picked)]
+
+
+# ----------------------------------------------------------------------
+# 读取与写入
+# ----------------------------------------------------------------------
+
+def load_crops(engine=None, data_dir="data"):
+    columns = ['id', 'crop_name', 'suitable_ph_min', 'suitable_ph_max', 'nutrient_requirements']
+    if engine is None:
+        return pd.read_csv(os.path.join(data_dir, 'crop_types.csv'), usecols=columns)
+    q = engine.dialect.identifier_preparer.quote
+    with engine.connect() as conn:
+        return pd.read_sql(text(f"SELECT {', '.join(q(c) for c in columns)} FROM {q('crop_types')} "
+                                f"ORDER BY {q('id')}"), conn)
+
+
+def count_samples(engine):
+    """read_database 会读出的样本数（有检测数据的样本）"""
+    q = engine.dialect.identifier_preparer.quote
+    with engine.connect() as conn:
+        return int(conn.execute(text(
+            f"SELECT COUNT(DISTINCT t.{q('sample_id')}) FROM {q('soil_test_data')} t "
+            f"JOIN {q('soil_samples')} s ON s.{q('id')} = t.{q('sample_id')}")).scalar())
+
+
+class MatrixWriter:
+    """把评分矩阵按块写入 scores.npy（mmap），样本数须预先知道"""
+
+    def __init__(self, path, sample_count, crop_ids):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.scores = np.lib.format.open_memmap(os.path.join(path, 'scores.npy'), mode='w+', dtype=np.float32,
+                                                shape=(sample_count, len(crop_ids)))
+        self.sample_ids = np.lib.format.open_memmap(os.path.join(path, 'sample_ids.npy'), mode='w+',
+                                                    dtype=np.int64, shape=(sample_count,))
+        np.save(os.path.join(path, 'crop_ids.npy'), crop_ids)
+        self.rows = 0
+
+    def write(self, sample_ids, scores):
+        end = self.rows + len(scores)
+        if end > len(self.scores):
+            raise ValueError(f"样本数超过预计的 {len(self.scores):,} 个")
+        self.scores[self.rows:end] = scores
+        self.sample_ids[self.rows:end] = sample_ids
+        self.rows = end
+
+    def close(self):
+        if self.rows != len(self.scores):
+            raise ValueError(f"只写入了 {self.rows:,} 个样本，预计 {len(self.scores):,} 个")
+        self.scores.flush()
+        self.sample_ids.flush()
+        del self.scores, self.sample_ids
+
+
+class SuitabilityWriter:
+    """
+    重建 crop_suitability：reset() 开启事务并清空表，write() 按顺序分配id后批量插入，
+    commit() 提交。清空和全部插入在同一个事务中，读者在提交前一直看到旧数据，
+    中途失败时 rollback() 保留旧数据
+    """
+
+    def __init__(self, engine, batch_size=INSERT_BATCH):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.next_id = 1
+        self.created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.conn = None
+        self.transaction = None
+
+    def _q(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def reset(self):
+        self.conn = self.engine.connect()
+        self.transaction = self.conn.begin()
+        self.conn.execute(text(f"DELETE FROM {self._q('crop_suitability')}"))
+
+    def commit(self):
+        self.transaction.commit()
+        self.conn.close()
+
+    def rollback(self):
+        self.transaction.rollback()
+        self.conn.close()
+
+    def write(self, rows):
+        if not len(rows):
+            return 0
+        rows = rows.assign(id=np.arange(self.next_id, self.next_id + len(rows)), created_at=self.created_at)
+        self.next_id += len(rows)
+        columns = ['id'] + [c for c in rows.columns if c != 'id']
+        sql = (f"INSERT INTO {self._q('crop_suitability')} ({', '.join(self._q(c) for c in columns)}) "
+               f"VALUES ({', '.join(f':{c}' for c in columns)})")
+        records = rows[columns].astype(object).where(rows[columns].notna(), None).to_dict('records')
+        for start in range(0, len(records), self.batch_size):
+            self.conn.execute(text(sql), records[start:start + self.batch_size])
+        return len(records)
+
+
+# ----------------------------------------------------------------------
+# 命令行
+# ----------------------------------------------------------------------
+
+def _synthetic_frames(n, chunk_rows, rng):
+    """随机样本，取值范围与生成数据一致"""
+    ranges = {'ph_value': (4.5, 9.0), 'organic_matter': (0.8, 4.5), 'available_phosphorus': (5, 80),
+              'available_potassium': (50, 300), 'available_nitrogen': (20, 150), 'salinity': (0.1, 5.0),
+              'bulk_density': (1.1, 1.6)}
+    for start in range(0, n, chunk_rows):
+        size = min(chunk_rows, n - start)
+        frame = {'sample_id': np.arange(start + 1, start + size + 1), 'test_date': '2024-05-01'}
+        for field, (lo, hi) in ranges.items():
+            frame[field] = rng.uniform(lo, hi, size).round(2)
+        yield pd.DataFrame(frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评价每个样本对全部作物的适宜性")
+    parser.add_argument('--url', help="数据库连接URL")
+    parser.add_argument('--data-dir', default='data', help="不指定 --url 时读取的CSV目录")
+    parser.add_argument('--top-k', type=int, default=TOP_K, help="每个样本保留评分最高的K个作物，0为全部")
+    parser.add_argument('--matrix', help="把稠密评分矩阵写入此目录")
+    parser.add_argument('--output', help="把前K个作物的结果写成CSV")
+    parser.add_argument('--memory-mb', type=int, default=MEMORY_MB, help="每块计算的内存上限（MB）")
+    parser.add_argument('--chunk-rows', type=int, default=quality.CHUNK_ROWS, help="每块读取的样本数")
+    parser.add_argument('--dry-run', action='store_true', help="只统计，不写入 crop_suitability")
+    parser.add_argument('--synthetic', type=int, default=0, help="用N个随机样本测试吞吐量（作物取自CSV）")
+    args = parser.parse_args()
+
+    engine = writer = matrix = None
+    if args.url and not args.synthetic:
+        from sqlalchemy import create_engine
+        engine = create_engine(args.url)
+    crops = load_crops(engine, args.data_dir)
+    suitability = SuitabilityEngine(crops, args.memory_mb)
+
+    if args.synthetic:
+        frames = _synthetic_frames(args.synthetic, args.chunk_rows, np.random.default_rng(42))
+        sample_count = args.synthetic
+    elif engine is not None:
+        frames = quality.read_database(engine, args.chunk_rows)
+        sample_count = count_samples(engine) if args.matrix else 0
+    else:
+        frames = list(quality.read_csv(args.data_dir, args.chunk_rows))
+        sample_count = sum(len(f) for f in frames)
+    if args.matrix:
+        matrix = MatrixWriter(args.matrix, sample_count, suitability.crop_ids)
+    if engine is not None and not args.dry_run:
+        writer = SuitabilityWriter(engine)
+        writer.reset()
+
+    start = time.time()
+    samples = written = 0
+    levels = {}
+    collected = []
+    try:
+        for frame in suitability.blocks(frames):
+            scores, ph_limited, nutrient_limited = suitability.evaluate(frame)
+            samples += len(frame)
+            if matrix is not None:
+                matrix.write(_numbers(frame, 'sample_id').astype(np.int64), scores)
+            rows = suitability.rows(frame, scores, ph_limited, nutrient_limited, args.top_k)
+            for level, count in rows['suitability_level'].value_counts().items():
+                levels[level] = levels.get(level, 0) + int(count)
+            if writer is not None:
+                written += writer.write(rows)
+            if args.output:
+                collected.append(rows)
+    except BaseException:
+        if writer is not None:
+            writer.rollback()
+        raise
+    if writer is not None:
+        writer.commit()
+    if matrix is not None:
+        matrix.close()
+    elapsed = time.time() - start
+
+    cells = samples * len(suitability.crop_ids)
+    print(f"🌾 样本 {samples:,} 个 × 作物 {len(suitability.crop_ids):,} 种 = {cells:,} 个评分，"
+          f"每块 {suitability.block_rows:,} 个样本，耗时 {elapsed:.2f}s（{cells / max(elapsed, 1e-9) / 1e6:,.1f} 百万/秒）")
+    order = [level for _, level in LEVEL_BOUNDS] + [LOWEST_LEVEL]
+    print(f"    前{args.top_k or len(suitability.crop_ids)}个作物: "
+          + "  ".join(f"{level} {levels.get(level, 0):,}" for level in order))
+    if matrix is not None:
+        print(f"    🧮 评分矩阵已写入 {args.matrix}")
+    if writer is not None:
+        print(f"    💾 写入 crop_suitability {written:,} 条")
+    if args.output:
+        pd.concat(collected, ignore_index=True).to_csv(args.output, index=False, encoding='utf-8')
+        print(f"💾 已写入 {args.output}")
+    if engine is not None:
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
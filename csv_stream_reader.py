@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 流式CSV读取器
+按固定行数分块读取 data/*.csv，并按表结构转换列类型，内存占用与文件大小无关
+"""
+
+import csv
+import json
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+
+from spatial_index import geohash_from_text
+from table_schemas import TABLE_SCHEMAS, is_text_type
+
+# 报告、异常等表中包含较长的文本字段
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+# 已编译的表结构缓存：(表名, 表头) -> TableSchema
+_SCHEMA_CACHE = {}
+
+# 派生列的计算函数，参数为来源列的原始CSV文本
+DERIVED_FUNCTIONS = {
+    'geohash': geohash_from_text,
+}
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value)
+
+
+def _parse_date(value):
+    return date.fromisoformat(value[:10])
+
+
+def _passthrough(value):
+    return value
+
+
+def _converter_for(col_type, parse_json):
+    """根据列类型返回值转换函数"""
+    upper = col_type.upper()
+    if upper.startswith(('INT', 'BIGINT', 'SMALLINT', 'TINYINT')):
+        return int
+    if upper.startswith('DECIMAL'):
+        return Decimal
+    if upper.startswith(('DOUBLE', 'FLOAT', 'REAL')):
+        return float
+    if upper == 'DATETIME':
+        return _parse_datetime
+    if upper == 'DATE':
+        return _parse_date
+    if upper == 'JSON':
+        # 数据库JSON列直接接收文本，只有调用方需要Python对象时才解析
+        return json.loads if parse_json else _passthrough
+    return _passthrough
+
+
+class TableSchema:
+    """单张表在某个CSV表头下的列类型及转换函数"""
+
+    def __init__(self, table_name, header, parse_json=False):
+        self.table_name = table_name
+        self.header = list(header)
+        schema = TABLE_SCHEMAS.get(table_name)
+        if schema:
+            types = dict(schema['columns'])
+        else:
+            # 未定义表结构的CSV按表头全部视为文本列
+            types = {name: 'TEXT' for name in header}
+        self.positions = [i for i, name in enumerate(header) if name in types]
+        self.columns = [header[i] for i in self.positions]
+        self.types = [types[name] for name in self.columns]
+        self.converters = [_converter_for(t, parse_json) for t in self.types]
+        self.keep_empty = [is_text_type(t) for t in self.types]
+        # CSV中没有、由其他列计算的派生列，排在 columns 末尾：[(函数, 来源列位置)]
+        self.derived = []
+        for name, (func, sources) in (schema or {}).get('derived_columns', {}).items():
+            if name not in header and all(s in header for s in sources):
+                self.columns.append(name)
+                self.types.append(types[name])
+                self.derived.append((DERIVED_FUNCTIONS[func], [header.index(s) for s in sources]))
+
+    def derive(self, raw):
+        """计算一行的派生列值"""
+        return [func(*(raw[pos] for pos in sources)) for func, sources in self.derived]
+
+    def convert(self, raw):
+        """将一行原始CSV值转换为按 columns 顺序排列的元组；非文本列的空字符串转换为NULL"""
+        values = []
+        for pos, converter, keep_empty in zip(self.positions, self.converters, self.keep_empty):
+            value = raw[pos]
+            if value == '':
+                values.append('' if keep_empty else None)
+            else:
+                values.append(converter(value))
+        if self.derived:
+            values.extend(self.derive(raw))
+        return tuple(values)
+
+
+def get_table_schema(table_name, header, parse_json=False):
+    """获取（并缓存）表结构，同一进程内每张表只编译一次"""
+    key = (table_name, tuple(header), parse_json)
+    schema = _SCHEMA_CACHE.get(key)
+    if schema is None:
+        schema = TableSchema(table_name, header, parse_json)
+        _SCHEMA_CACHE[key] = schema
+    return schema
+
+
+class CSVStreamReader:
+    """
+    流式读取一张表的CSV文件
+
+    每次产出一个分块 (原始行列表, 类型转换后的行元组列表)，
+    原始行用于计算内容哈希，转换后的行用于写入数据库或分析。
+    """
+
+    def __init__(self, path, table_name, chunk_size=1000, parse_json=False):
+        self.path = path
+        self.table_name = table_name
+        self.chunk_size = chunk_size
+        self.parse_json = parse_json
+        self.schema = None
+
+    @property
+    def columns(self):
+        return self.schema.columns if self.schema else None
+
+    def iter_chunks(self, convert=True):
+        """
+        分块读取；convert=False 时只产出原始行，转换后的行为 None，
+        由调用方对需要写入的行调用 schema.convert（例如增量装载中跳过未变化的分块）
+        """
+        with open(self.path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            self.schema = get_table_schema(self.table_name, header, self.parse_json)
+            convert_row = self.schema.convert
+            raw_rows = []
+            for raw in reader:
+                raw_rows.append(raw)
+                if len(raw_rows) >= self.chunk_size:
+                    yield raw_rows, [convert_row(r) for r in raw_rows] if convert else None
+                    raw_rows = []
+            if raw_rows:
+                yield raw_rows, [convert_row(r) for r in raw_rows] if convert else None
+
+    def iter_rows(self):
+        """逐行产出类型转换后的行元组"""
+        for _, rows in self.iter_chunks():
+            yield from rows
+
+    def __iter__(self):
+        return self.iter_chunks()
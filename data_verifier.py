@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 装载结果验证
+并行统计各表行数，并按主键区间计算与行顺序无关的校验和，对比CSV与数据库内容
+"""
+
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import inspect, text
+
+from csv_stream_reader import CSVStreamReader
+from table_schemas import TABLE_SCHEMAS, TABLE_LOAD_ORDER, column_types
+
+NULL_MARK = '\\N'
+SUM_MASK = (1 << 64) - 1
+
+
+def _canon_int(value):
+    return str(int(value))
+
+
+def _canon_decimal(value):
+    # 数据库按列精度补零（46.0 -> 46.00），SQLite可能返回float，统一去掉末尾的0
+    return format(Decimal(str(value)).normalize(), 'f')
+
+
+def _canon_float(value):
+    return repr(float(value))
+
+
+def _canon_date(value):
+    return value.isoformat() if isinstance(value, date) else str(value)[:10]
+
+
+def _canon_datetime(value):
+    return value.isoformat(' ') if isinstance(value, datetime) else str(value)
+
+
+def _canon_json(value):
+    # MySQL会重新格式化JSON文本，比较前统一解析并按键排序
+    if isinstance(value, (str, bytes)):
+        value = json.loads(value)
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def _canon_text(value):
+    return str(value)
+
+
+def _canonicalizer_for(col_type):
+    """返回把CSV值或数据库值转换为统一文本表示的函数"""
+    upper = col_type.upper()
+    if upper.startswith(('INT', 'BIGINT', 'SMALLINT', 'TINYINT')):
+        return _canon_int
+    if upper.startswith('DECIMAL'):
+        return _canon_decimal
+    if upper.startswith(('DOUBLE', 'FLOAT', 'REAL')):
+        return _canon_float
+    if upper == 'DATE':
+        return _canon_date
+    if upper == 'DATETIME':
+        return _canon_datetime
+    if upper == 'JSON':
+        return _canon_json
+    return _canon_text
+
+
+class RangeChecksum:
+    """一个主键区间内的行数、CRC32异或值和CRC32求和值，可任意顺序合并"""
+
+    __slots__ = ('rows', 'xor', 'sum')
+
+    def __init__(self):
+        self.rows = 0
+        self.xor = 0
+        self.sum = 0
+
+    def add(self, crc):
+        self.rows += 1
+        self.xor ^= crc
+        self.sum = (self.sum + crc) & SUM_MASK
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.xor ^= other.xor
+        self.sum = (self.sum + other.sum) & SUM_MASK
+
+    def key(self):
+        return (self.rows, self.xor, self.sum)
+
+    def hexdigest(self):
+        return f"{self.xor:08x}{self.sum:016x}"
+
+
+class DataVerifier:
+    """
+    装载结果验证引擎
+
+    fast     - 使用 information_schema / pg_class 中的行数估计值，适合快速冒烟检查
+    count    - 并行执行精确的 COUNT(*)
+    checksum - CSV侧与数据库侧分别按主键区间计算校验和，并行对比行数和内容
+    """
+
+    def __init__(self, engine, data_dir="data", max_workers=4, range_size=50000):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.data_dir = data_dir
+        self.max_workers = max_workers
+        self.range_size = range_size
+
+    def _q(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def _csv_path(self, table_name):
+        return os.path.join(self.data_dir, f"{table_name}.csv")
+
+    def existing_tables(self):
+        existing = set(inspect(self.engine).get_table_names())
+        return [t for t in TABLE_LOAD_ORDER if t in existing]
+
+    # ------------------------------------------------------------------
+    # 行数
+    # ------------------------------------------------------------------
+
+    def estimated_counts(self, tables):
+        """读取数据库统计信息中的行数估计值，不扫描表"""
+        if self.dialect == 'mysql':
+            sql = ("SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES "
+                   "WHERE TABLE_SCHEMA = DATABASE()")
+        elif self.dialect == 'postgresql':
+            sql = ("SELECT c.relname, c.reltuples::bigint FROM pg_class c "
+                   "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                   "WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema()")
+        else:
+            # SQLite没有行数估计值
+            return self.exact_counts(tables)
+        with self.engine.connect() as conn:
+            estimates = {name: int(rows or 0) for name, rows in conn.execute(text(sql))}
+        return {t: max(estimates.get(t, 0), 0) for t in tables}
+
+    def _count_table(self, table_name):
+        try:
+            with self.engine.connect() as conn:
+                return table_name, conn.execute(text(f"SELECT COUNT(*) FROM {self._q(table_name)}")).scalar()
+        except Exception as e:
+            return table_name, f"错误: {str(e)}"
+
+    def exact_counts(self, tables):
+        """并行统计各表的精确行数"""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = dict(pool.map(self._count_table, tables))
+        return {t: results[t] for t in tables}
+
+    # ------------------------------------------------------------------
+    # 校验和
+    # ------------------------------------------------------------------
+
+    def _row_checksummer(self, table_name, columns):
+        types = column_types(table_name)
+        canon = [_canonicalizer_for(types[c]) for c in columns]
+
+        def checksum(values):
+            parts = [NULL_MARK if v is None else f(v) for f, v in zip(canon, values)]
+            return zlib.crc32('\x1f'.join(parts).encode('utf-8'))
+
+        return checksum
+
+    def csv_checksums(self, table_name):
+        """按主键区间计算CSV侧校验和，返回 (列名, {区间号: RangeChecksum})"""
+        pk = TABLE_SCHEMAS[table_name]['primary_key']
+        reader = CSVStreamReader(self._csv_path(table_name), table_name, chunk_size=10000, parse_json=True)
+        ranges = {}
+        checksum = None
+        for _, rows in reader.iter_chunks():
+            if checksum is None:
+                columns = reader.columns
+                checksum = self._row_checksummer(table_name, columns)
+                pk_index = columns.index(pk)
+            for row in rows:
+                range_no = row[pk_index] // self.range_size
+                bucket = ranges.get(range_no)
+                if bucket is None:
+                    bucket = ranges[range_no] = RangeChecksum()
+                bucket.add(checksum(row))
+        return (reader.columns or []), ranges
+
+    def _db_range_checksum(self, table_name, columns, range_no):
+        pk = TABLE_SCHEMAS[table_name]['primary_key']
+        checksum = self._row_checksummer(table_name, columns)
+        col_sql = ", ".join(self._q(c) for c in columns)
+        lo = range_no * self.range_size
+        result = RangeChecksum()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"SELECT {col_sql} FROM {self._q(table_name)} "
+                     f"WHERE {self._q(pk)} >= :lo AND {self._q(pk)} < :hi"),
+                {'lo': lo, 'hi': lo + self.range_size},
+            )
+            for row in rows:
+                result.add(checksum(row))
+        return range_no, result
+
+    def _db_range_numbers(self, table_name):
+        pk = self._q(TABLE_SCHEMAS[table_name]['primary_key'])
+        with self.engine.connect() as conn:
+            lo, hi = conn.execute(text(f"SELECT MIN({pk}), MAX({pk}) FROM {self._q(table_name)}")).first()
+        if lo is None:
+            return []
+        return list(range(int(lo) // self.range_size, int(hi) // self.range_size + 1))
+
+    def checksum_tables(self, tables):
+        """并行对比CSV与数据库的行数和校验和"""
+        tables = [t for t in tables if os.path.exists(self._csv_path(t))]
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            csv_futures = {t: pool.submit(self.csv_checksums, t) for t in tables}
+            range_numbers = {t: self._db_range_numbers(t) for t in tables}
+
+            db_futures = {}
+            for table_name in tables:
+                columns, _ = csv_futures[table_name].result()
+                db_futures[table_name] = [
+                    pool.submit(self._db_range_checksum, table_name, columns, n)
+                    for n in range_numbers[table_name]
+                ]
+
+            for table_name in tables:
+                _, csv_ranges = csv_futures[table_name].result()
+                db_ranges = dict(f.result() for f in db_futures[table_name])
+                results[table_name] = self._compare(csv_ranges, db_ranges)
+        return results
+
+    def _compare(self, csv_ranges, db_ranges):
+        csv_total, db_total = RangeChecksum(), RangeChecksum()
+        mismatched = []
+        for range_no in sorted(set(csv_ranges) | set(db_ranges)):
+            csv_part = csv_ranges.get(range_no, RangeChecksum())
+            db_part = db_ranges.get(range_no, RangeChecksum())
+            csv_total.merge(csv_part)
+            db_total.merge(db_part)
+            if csv_part.key() != db_part.key():
+                lo = range_no * self.range_size
+                mismatched.append((lo, lo + self.range_size - 1))
+        return {
+            'csv_rows': csv_total.rows,
+            'db_rows': db_total.rows,
+            'csv_checksum': csv_total.hexdigest(),
+            'db_checksum': db_total.hexdigest(),
+            'mismatched_ranges': mismatched,
+            'ok': not mismatched,
+        }
+
+    def verify(self, mode='count', tables=None):
+        """按模式验证各表，fast/count 返回 {表名: 行数}，checksum 返回 {表名: 对比结果}"""
+        tables = tables or self.existing_tables()
+        if mode == 'fast':
+            return self.estimated_counts(tables)
+        if mode == 'checksum':
+            return self.checksum_tables(tables)
+        return self.exact_counts(tables)
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 最低成本施肥方案
+为每个 (样本, 作物) 求满足 N/P/K 缺口的最低成本肥料组合，代替生成数据时随机的 fertilizer_plans。
+
+    养分缺口  - 作物 nutrient_requirements 减去土壤速效养分供应量（与 crop_suitability 的折算相同），kg/hm²
+    线性规划  - min Σ 价格×用量，约束 Σ 含量×用量 ≥ 缺口，用量 ≥ 0；
+                含量取 fertilizer_products 的 nitrogen/phosphorus/potassium_content（%），价格取 price_per_ton
+
+只有3个约束，最优解是某个基（3列，取自肥料和3个松弛变量）的基本解。求解分三步：
+    1. 剪枝   - 每元养分量被另一种肥料逐项不低于的肥料不会出现在最优解中，800种肥料通常只剩二三十种
+    2. 枚举基 - 对剩余肥料和松弛变量的全部3列组合求对偶解，只保留对偶可行的基（一次性计算）
+    3. 批量求解 - 对偶目标 缺口·y 最大的基即最优基，一批缺口只需一次矩阵乘法和取最大值；
+                退化情况下最大值对应多个基，再从中找原问题可行（用量均非负）的基
+缺口按 DEFICIT_STEP 向上取整后作为缓存键，相同缺口只求解一次，跨批次保留。
+
+方案写入 fertilizer_plans：用量按 kg/亩，按肥料类型分为基肥和追肥，total_cost 为元/亩，
+target_yield 与 crop_suitability 的 yield_potential 相同。重新运行时只替换本程序生成的方案（creator 为 PLAN_CREATOR）。
+
+用法:
+    python fertilizer_optimizer.py --url sqlite:///soil_data.db                    # 每个样本的种植作物
+    python fertilizer_optimizer.py --url ... --pairs suitability                   # crop_suitability 中的作物
+    python fertilizer_optimizer.py --data-dir data --pairs all --dry-run           # 每个样本 × 全部作物
+    python fertilizer_optimizer.py --data-dir data --output plans.csv
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+import soil_quality_scoring as quality
+from crop_suitability import (NUTRIENTS, YIELD_PER_POINT, SuitabilityEngine, crop_requirements, load_crops,
+                              nutrient_supply)
+
+CONTENT_COLUMNS = ['nitrogen_content', 'phosphorus_content', 'potassium_content']
+MU_PER_HECTARE = 15
+DEFICIT_STEP = 0.1               # 缺口取整的步长（kg/hm²），也是缓存键的精度
+KEY_BITS = 21                    # 缓存键中每种养分占的位数
+CACHE_MAX = 5_000_000            # 缓存的缺口数超过时清空
+TOLERANCE = 1e-9
+VALUE_COST_RATIO = 3.0           # 估算 expected_benefit 的产投比
+
+# 肥料类型 -> (基肥比例, [(追肥时期, 比例), ...])；未列出的类型全部作基肥
+APPLICATION_SPLIT = {
+    '氮肥': (0.4, [("生长期", 0.4), ("开花期", 0.2)]),
+    '复合肥': (0.7, [("生长期", 0.3)]),
+    '叶面肥': (0.0, [("生长期", 0.5), ("开花期", 0.5)]),
+}
+INSTRUCTIONS = {
+    'base': "基肥在播种前7-10天施入，深翻入土",
+    'topdressing': "追肥根据作物生长情况调整，施肥后及时浇水，促进养分吸收",
+    '有机肥': "有机肥需充分腐熟后使用",
+    '叶面肥': "叶面肥在早晨或傍晚喷施效果最佳",
+    'none': "土壤养分可满足作物需求，本季无需施用氮磷钾肥料",
+}
+PLAN_CREATOR = '系统优化'
+PLAN_STATUS = 'active'
+INSERT_BATCH = 5000
+
+
+class FertilizerOptimizer:
+    """
+    批量求解最低成本施肥的线性规划
+
+    products 为 fertilizer_products 表。solve() 对 (n, 3) 的缺口返回每行所用肥料的下标（products 中的行号，
+    未用为 -1）、用量（kg/hm²）和成本（元/hm²）；无法满足的缺口（某种养分没有任何肥料含有）成本为 NaN。
+    """
+
+    def __init__(self, products):
+        self.products = products.reset_index(drop=True)
+        content = np.column_stack([quality._numbers(products, c) for c in CONTENT_COLUMNS]) / 100
+        price = quality._numbers(products, 'price_per_ton') / 1000
+        content = np.nan_to_num(content)
+        self.price = price
+        usable = (content.sum(axis=1) > 0) & (price > 0)
+        self.supplied = content[usable].sum(axis=0) > 0
+
+        # 每元养分量被另一种肥料逐项不低于（完全相同时保留靠前的一种）的肥料不会出现在最优解中
+        candidates = np.flatnonzero(usable)
+        per_yuan = content[candidates] / price[candidates, None]
+        at_least = (per_yuan[:, None, :] >= per_yuan[None, :, :]).all(axis=2)
+        better = (per_yuan[:, None, :] > per_yuan[None, :, :]).any(axis=2)
+        order = np.arange(len(candidates))
+        dominated = (at_least & (better | (order[:, None] < order[None, :]))
+                     & ~np.eye(len(candidates), dtype=bool)).any(axis=0)
+        self.pareto = candidates[~dominated]
+
+        # 列：剩余肥料和3个松弛变量（含量为 -e_k，价格为0）
+        columns = np.vstack([content[self.pareto], -np.eye(len(NUTRIENTS))])
+        costs = np.concatenate([price[self.pareto], np.zeros(len(NUTRIENTS))])
+        bases = np.array(list(itertools.combinations(range(len(columns)), len(NUTRIENTS))), dtype=np.int64)
+        matrices = np.transpose(columns[bases], (0, 2, 1))       # (基数, 养分, 列)
+        regular = np.abs(np.linalg.det(matrices)) > 1e-12
+        bases, matrices = bases[regular], matrices[regular]
+        # 对偶解 y 满足 yᵀB = c_B；对偶可行：所有列的检验数 c_j - yᵀa_j ≥ 0
+        duals = np.linalg.solve(np.transpose(matrices, (0, 2, 1)), costs[bases][:, :, None])[:, :, 0]
+        feasible = ((costs[None, :] - duals @ columns.T) >= -TOLERANCE).all(axis=1)
+        self.bases = bases[feasible]
+        self.inverses = np.linalg.inv(matrices[feasible])
+        self.duals = duals[feasible]
+        self.column_products = np.concatenate([self.pareto, np.full(len(NUTRIENTS), -1)])
+
+        self.cache_keys = np.zeros(0, dtype=np.int64)
+        self.cache_products = np.zeros((0, len(NUTRIENTS)), dtype=np.int64)
+        self.cache_amounts = np.zeros((0, len(NUTRIENTS)))
+        self.solved = self.cache_hits = 0
+
+    def _solve(self, deficits):
+        """deficits 为非负 (n, 3)；返回 (基下标, 基变量取值)"""
+        values = deficits @ self.duals.T
+        best = values.argmax(axis=1)
+        amounts = np.einsum('nij,nj->ni', self.inverses[best], deficits)
+        # 退化：最优值对应多个基时 argmax 选中的基可能原问题不可行，在最优值相同的基中另找
+        retry = np.flatnonzero((amounts < -TOLERANCE * (1 + deficits.max(axis=1, keepdims=True))).any(axis=1))
+        if len(retry):
+            d = deficits[retry]
+            all_amounts = np.einsum('bij,nj->nbi', self.inverses, d)
+            scale = TOLERANCE * (1 + d.max(axis=1))
+            ok = ((all_amounts >= -scale[:, None, None]).all(axis=2)
+                  & (values[retry] >= values[retry, best[retry]][:, None] - scale[:, None] * 1e3))
+            best[retry] = ok.argmax(axis=1)
+            amounts[retry] = all_amounts[np.arange(len(retry)), best[retry]]
+        return best, np.maximum(amounts, 0)
+
+    def solve(self, deficits):
+        deficits = np.maximum(np.nan_to_num(np.asarray(deficits, dtype=np.float64)), 0)
+        steps = np.minimum(np.ceil(deficits / DEFICIT_STEP - 1e-9), (1 << KEY_BITS) - 1).astype(np.int64)
+        keys = (steps[:, 0] << (2 * KEY_BITS)) | (steps[:, 1] << KEY_BITS) | steps[:, 2]
+        unique, inverse = np.unique(keys, return_inverse=True)
+
+        pos = np.clip(np.searchsorted(self.cache_keys, unique), 0, max(len(self.cache_keys) - 1, 0))
+        hit = (self.cache_keys[pos] == unique) if len(self.cache_keys) else np.zeros(len(unique), dtype=bool)
+        products = np.empty((len(unique), len(NUTRIENTS)), dtype=np.int64)
+        amounts = np.empty((len(unique), len(NUTRIENTS)))
+        products[hit] = self.cache_products[pos[hit]]
+        amounts[hit] = self.cache_amounts[pos[hit]]
+        miss = np.flatnonzero(~hit)
+        if len(miss):
+            rounded = np.column_stack([(unique[miss] >> (shift * KEY_BITS)) & ((1 << KEY_BITS) - 1)
+                                       for shift in (2, 1, 0)]) * DEFICIT_STEP
+            best, solution = self._solve(rounded)
+            columns = self.bases[best]
+            chosen = self.column_products[columns]
+            # 松弛变量和用量为0的列不算所用肥料
+            chosen[solution <= TOLERANCE] = -1
+            products[miss] = chosen
+            amounts[miss] = np.where(chosen >= 0, solution, 0)
+            self.solved += len(miss)
+            self._remember(unique[miss], products[miss], amounts[miss])
+        self.cache_hits += len(keys) - len(miss)
+
+        products, amounts = products[inverse], amounts[inverse]
+        cost = (np.where(products >= 0, self.price[np.maximum(products, 0)], 0) * amounts).sum(axis=1)
+        # 某种养分有缺口但没有任何肥料含有时无解
+        cost[((deficits > 0) & ~self.supplied).any(axis=1)] = np.nan
+        return products, amounts, cost
+
+    def _remember(self, keys, products, amounts):
+        if len(self.cache_keys) + len(keys) > CACHE_MAX:
+            self.cache_keys = self.cache_keys[:0]
+            self.cache_products = self.cache_products[:0]
+            self.cache_amounts = self.cache_amounts[:0]
+        keys = np.concatenate([self.cache_keys, keys])
+        order = np.argsort(keys, kind='stable')
+        self.cache_keys = keys[order]
+        self.cache_products = np.concatenate([self.cache_products, products])[order]
+        self.cache_amounts = np.concatenate([self.cache_amounts, amounts])[order]
+
+
+class PlanBuilder:
+    """把求解结果整理为 fertilizer_plans 格式"""
+
+    def __init__(self, optimizer, crops):
+        self.optimizer = optimizer
+        self.crops = crops.reset_index(drop=True)
+        self.crop_names = dict(zip(pd.to_numeric(crops['id']).astype(int), crops['crop_name'].astype(str)))
+        products = optimizer.products
+        self.names = products['product_name'].astype(str).to_numpy(object)
+        self.types = products['fertilizer_type'].astype(str).to_numpy(object)
+        self._texts = {}
+
+    def _texts_for(self, used, amounts):
+        """used、amounts 为一个方案所用肥料的下标和 kg/亩 用量（已去掉未用列）"""
+        key = (tuple(used), tuple(amounts))
+        if key in self._texts:
+            return self._texts[key]
+        base, topdressing, notes = {}, [], []
+        for product, amount in zip(used, amounts):
+            name, kind = self.names[product], self.types[product]
+            base_share, splits = APPLICATION_SPLIT.get(kind, (1.0, []))
+            if base_share > 0:
+                base[name] = f"{amount * base_share:.1f}kg/亩"
+            for period, share in splits:
+                topdressing.append({"时期": period, "肥料": name, "用量": f"{amount * share:.1f}kg/亩"})
+            if kind in INSTRUCTIONS and INSTRUCTIONS[kind] not in notes:
+                notes.append(INSTRUCTIONS[kind])
+        if not used:
+            notes = [INSTRUCTIONS['none']]
+        else:
+            if base:
+                notes.insert(0, INSTRUCTIONS['base'])
+            if topdressing:
+                notes.append(INSTRUCTIONS['topdressing'])
+        texts = (json.dumps(base, ensure_ascii=False), json.dumps(topdressing, ensure_ascii=False), "；".join(notes))
+        self._texts[key] = texts
+        return texts
+
+    def build(self, sample_ids, crop_ids, products, amounts, cost, target_yield, dates):
+        per_mu = np.round(amounts / MU_PER_HECTARE, 1)
+        texts = [self._texts_for([p for p, a in zip(row_products, row_amounts) if p >= 0 and a > 0],
+                                 [a for p, a in zip(row_products, row_amounts) if p >= 0 and a > 0])
+                 for row_products, row_amounts in zip(products.tolist(), per_mu.tolist())]
+        base, topdressing, instructions = zip(*texts) if texts else ((), (), ())
+        total_cost = np.round(cost / MU_PER_HECTARE, 2)
+        return pd.DataFrame({
+            'sample_id': sample_ids,
+            'crop_id': crop_ids,
+            'plan_name': [f"{self.crop_names.get(int(c), '')}最低成本施肥方案" for c in crop_ids],
+            'target_yield': np.round(target_yield, 2),
+            'base_fertilizer': base,
+            'topdressing_plan': topdressing,
+            'total_cost': total_cost,
+            'expected_benefit': np.round(total_cost * VALUE_COST_RATIO, 2),
+            'application_instructions': instructions,
+            'created_date': dates,
+            'creator': PLAN_CREATOR,
+            'status': PLAN_STATUS,
+        })[~np.isnan(cost)]
+
+
+def plan_pairs(frame, crop_rows, mode, suitability_pairs=None):
+    """
+    本块要制定方案的 (样本行号, 作物行号)
+
+    sample       - 样本的种植作物（soil_samples.crop_id）
+    suitability  - suitability_pairs（crop_suitability 的 sample_id、crop_id）中该样本的作物
+    all          - 全部作物
+    crop_rows 把 crop_id 映射到作物行号，未知作物为 -1
+    """
+    crop_count = crop_rows.max() + 1
+    if mode == 'all':
+        return (np.repeat(np.arange(len(frame)), crop_count), np.tile(np.arange(crop_count), len(frame)))
+    if mode == 'sample':
+        sample_rows = np.arange(len(frame))
+        crop_ids = quality._numbers(frame, 'crop_id')
+    else:
+        merged = pd.DataFrame({'sample_id': quality._numbers(frame, 'sample_id'), 'row': np.arange(len(frame))}) \
+            .merge(suitability_pairs, on='sample_id', how='inner').sort_values(['row', 'crop_id'], kind='stable')
+        sample_rows = merged['row'].to_numpy(np.int64)
+        crop_ids = merged['crop_id'].to_numpy(np.float64)
+    ids = np.nan_to_num(crop_ids, nan=-1).astype(np.int64)
+    known = (ids >= 0) & (ids < len(crop_rows))
+    rows = np.where(known, crop_rows[np.clip(ids, 0, len(crop_rows) - 1)], -1)
+    keep = rows >= 0
+    return sample_rows[keep], rows[keep]
+
+
+# ----------------------------------------------------------------------
+# 读取与写入
+# ----------------------------------------------------------------------
+
+def load_products(engine=None, data_dir="data"):
+    columns = ['id', 'product_name', 'fertilizer_type'] + CONTENT_COLUMNS + ['price_per_ton']
+    if engine is None:
+        return pd.read_csv(os.path.join(data_dir, 'fertilizer_products.csv'), usecols=columns)
+    q = engine.dialect.identifier_preparer.quote
+    with engine.connect() as conn:
+        return pd.read_sql(text(f"SELECT {', '.join(q(c) for c in columns)} FROM {q('fertilizer_products')} "
+                                f"ORDER BY {q('id')}"), conn)
+
+
+def load_suitability_pairs(engine):
+    q = engine.dialect.identifier_preparer.quote
+    with engine.connect() as conn:
+        pairs = pd.read_sql(text(f"SELECT {q('sample_id')}, {q('crop_id')} FROM {q('crop_suitability')}"), conn)
+    return pairs.astype(np.float64).drop_duplicates()
+
+
+class PlanWriter:
+    """
+    写入 fertilizer_plans
+
+    reset()    - 开启事务，删除上次由本程序生成的方案（creator 为 PLAN_CREATOR），人工制定的方案保留
+    write()    - 从现有最大id之后分配id并批量插入
+    commit()   - 提交。删除和全部插入在同一个事务中，读者在提交前一直看到上次的方案，
+                 中途失败时 rollback() 保留上次的方案
+    """
+
+    def __init__(self, engine, batch_size=INSERT_BATCH):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.next_id = 1
+        self.created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.conn = None
+        self.transaction = None
+
+    def _q(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def reset(self):
+        q = self._q
+        self.conn = self.engine.connect()
+        self.transaction = self.conn.begin()
+        self.conn.execute(text(f"DELETE FROM {q('fertilizer_plans')} WHERE {q('creator')} = :creator"),
+                          {'creator': PLAN_CREATOR})
+        self.next_id = int(self.conn.execute(text(
+            f"SELECT COALESCE(MAX({q('id')}), 0) FROM {q('fertilizer_plans')}")).scalar()) + 1
+
+    def commit(self):
+        self.transaction.commit()
+        self.conn.close()
+
+    def rollback(self):
+        self.transaction.rollback()
+        self.conn.close()
+
+    def write(self, plans):
+        if not len(plans):
+            return 0
+        plans = plans.assign(id=np.arange(self.next_id, self.next_id + len(plans)), created_at=self.created_at)
+        self.next_id += len(plans)
+        columns = ['id'] + [c for c in plans.columns if c != 'id']
+        sql = (f"INSERT INTO {self._q('fertilizer_plans')} ({', '.join(self._q(c) for c in columns)}) "
+               f"VALUES ({', '.join(f':{c}' for c in columns)})")
+        records = plans[columns].astype(object).where(plans[columns].notna(), None).to_dict('records')
+        for start in range(0, len(records), self.batch_size):
+            self.conn.execute(text(sql), records[start:start + self.batch_size])
+        return len(records)
+
+
+# ----------------------------------------------------------------------
+# 命令行
+# ----------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="为样本和作物求最低成本施肥方案并写入 fertilizer_plans")
+    parser.add_argument('--url', help="数据库连接URL")
+    parser.add_argument('--data-dir', default='data', help="不指定 --url 时读取的CSV目录")
+    parser.add_argument('--pairs', choices=['sample', 'suitability', 'all'], default='sample',
+                        help="sample: 样本的种植作物；suitability: crop_suitability 中的作物；all: 全部作物")
+    parser.add_argument('--chunk-rows', type=int, default=quality.CHUNK_ROWS, help="每块读取的样本数")
+    parser.add_argument('--output', help="把方案写成CSV")
+    parser.add_argument('--dry-run', action='store_true', help="只统计，不写入 fertilizer_plans")
+    args = parser.parse_args()
+
+    engine = writer = suitability_pairs = None
+    if args.url:
+        from sqlalchemy import create_engine
+        engine = create_engine(args.url)
+    if args.pairs == 'suitability':
+        if engine is None:
+            parser.error("--pairs suitability 需要 --url")
+        suitability_pairs = load_suitability_pairs(engine)
+
+    start = time.time()
+    crops = load_crops(engine, args.data_dir)
+    optimizer = FertilizerOptimizer(load_products(engine, args.data_dir))
+    print(f"🧪 肥料 {len(optimizer.products):,} 种，剪枝后 {len(optimizer.pareto):,} 种，"
+          f"对偶可行基 {len(optimizer.bases):,} 个，预处理 {time.time() - start:.2f}s")
+    suitability = SuitabilityEngine(crops)
+    requirements = np.nan_to_num(crop_requirements(crops))
+    crop_ids = suitability.crop_ids
+    crop_rows = np.full(int(crop_ids.max()) + 1 if len(crop_ids) else 1, -1, dtype=np.int64)
+    crop_rows[crop_ids] = np.arange(len(crop_ids))
+    builder = PlanBuilder(optimizer, crops)
+    if engine is not None and not args.dry_run:
+        writer = PlanWriter(engine)
+        writer.reset()
+
+    frames = quality.read_database(engine, args.chunk_rows) if engine is not None \
+        else quality.read_csv(args.data_dir, args.chunk_rows)
+    start = time.time()
+    plans_total = written = infeasible = 0
+    costs = []
+    collected = []
+    try:
+        for frame in suitability.blocks(frames):
+            sample_rows, pair_crops = plan_pairs(frame, crop_rows, args.pairs, suitability_pairs)
+            if not len(sample_rows):
+                continue
+            deficits = np.maximum(requirements[pair_crops] - np.nan_to_num(nutrient_supply(frame))[sample_rows], 0)
+            products, amounts, cost = optimizer.solve(deficits)
+            scores = suitability.evaluate(frame)[0]
+            plans = builder.build(quality._numbers(frame, 'sample_id').astype(np.int64)[sample_rows],
+                                  crop_ids[pair_crops], products, amounts, cost,
+                                  scores[sample_rows, pair_crops].astype(np.float64) * YIELD_PER_POINT,
+                                  quality.assessment_dates(frame)[sample_rows])
+            plans_total += len(plans)
+            infeasible += int(np.isnan(cost).sum())
+            costs.append(plans['total_cost'].to_numpy())
+            if writer is not None:
+                written += writer.write(plans)
+            if args.output:
+                collected.append(plans)
+    except BaseException:
+        if writer is not None:
+            writer.rollback()
+        raise
+    if writer is not None:
+        writer.commit()
+    elapsed = time.time() - start
+
+    costs = np.concatenate(costs) if costs else np.zeros(0)
+    print(f"🌱 施肥方案 {plans_total:,} 个（无解 {infeasible:,} 个），求解不同缺口 {optimizer.solved:,} 个、"
+          f"缓存命中 {optimizer.cache_hits:,} 次，耗时 {elapsed:.2f}s"
+          f"（{plans_total / max(elapsed, 1e-9) * 60:,.0f} 个/分钟）")
+    if len(costs):
+        print(f"    成本（元/亩）: 平均 {costs.mean():.2f}  中位数 {np.median(costs):.2f}  最高 {costs.max():.2f}，"
+              f"无需施肥 {int((costs == 0).sum()):,} 个")
+    if writer is not None:
+        print(f"    💾 写入 fertilizer_plans {written:,} 条")
+    if args.output:
+        pd.concat(collected, ignore_index=True).to_csv(args.output, index=False, encoding='utf-8')
+        print(f"💾 已写入 {args.output}")
+    if engine is not None:
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
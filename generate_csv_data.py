@@ -13,6 +13,8 @@ import os
 import hashlib
 from faker import Faker
 
+from table_schemas import ANOMALY_MANUAL_SOURCE, ANOMALY_SOURCES, anomaly_field
+
 # 设置中文本地化
 fake = Faker('zh_CN')
 
@@ -31,6 +33,10 @@ class SoilDataCSVGenerator:
         self.monitoring_stations = []
         self.soil_samples = []
         
+        # 表数据输出目标：为None时写入CSV文件，否则调用 sink(表名, 数据行列表)，
+        # 供流水线装载直接消费，不经过中间文件
+        self.sink = None
+        
     def generate_regions(self):
         """生成行政区域数据"""
         print("生成行政区域数据...")
@@ -896,7 +902,9 @@ class SoilDataCSVGenerator:
         
         data = []
         anomaly_types = ["数值异常", "缺失值", "逻辑错误", "重复数据", "超出范围"]
-        data_sources = ["soil_test_data", "monitoring_data", "manual_input"]
+        data_sources = list(ANOMALY_SOURCES.values()) + [ANOMALY_MANUAL_SOURCE]
+        anomaly_fields = [anomaly_field(c) for c in ['ph_value', 'organic_matter', 'available_nitrogen',
+                                                     'available_phosphorus', 'available_potassium']]
         severity_levels = ["低", "中", "高", "严重"]
         detection_methods = ["自动检测", "人工发现", "系统校验", "专家审核"]
         
@@ -906,7 +914,7 @@ class SoilDataCSVGenerator:
                 'data_source': random.choice(data_sources),
                 'source_id': random.randint(1, 10000),
                 'anomaly_type': random.choice(anomaly_types),
-                'anomaly_field': random.choice(['ph_value', 'organic_matter', 'nitrogen', 'phosphorus', 'potassium']),
+                'anomaly_field': random.choice(anomaly_fields),
                 'original_value': str(round(random.uniform(-1, 15), 2)),
                 'expected_range': random.choice(['4.5-8.5', '0.8-4.5', '20-150', '5-80', '50-300']),
                 'severity_level': random.choice(severity_levels),
@@ -1038,11 +1046,45 @@ class SoilDataCSVGenerator:
         ]
         return random.choice(instructions)
     
+    def generate_all(self):
+        """按依赖关系生成所有表的数据"""
+        
+        # 基础数据
+        self.generate_regions()
+        self.generate_soil_types()
+        self.generate_crop_types()
+        self.generate_fertilizer_products()
+        self.generate_data_dictionary()
+        
+        # 用户和站点
+        self.generate_users()
+        self.generate_monitoring_stations()
+        
+        # 土壤样本和检测数据
+        self.generate_soil_samples()
+        self.generate_soil_test_data()
+        self.generate_trace_elements()
+        
+        # 评估和分析数据
+        self.generate_soil_quality_assessment()
+        self.generate_crop_suitability()
+        self.generate_fertilizer_plans()
+        
+        # 监测和日志数据
+        self.generate_historical_monitoring_data()
+        self.generate_operation_logs()
+        self.generate_statistical_reports()
+        self.generate_anomaly_data()
+    
     def save_csv(self, filename, data):
         """保存数据到CSV文件"""
         if not data:
             return
         
+        if self.sink is not None:
+            self.sink(os.path.splitext(filename)[0], data)
+            return
+        
         filepath = os.path.join(self.data_dir, filename)
         with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
             fieldnames = data[0].keys()
@@ -1057,33 +1099,7 @@ def main():
     
     # 按依赖关系生成数据
     print("开始生成CSV数据文件...")
-    
-    # 基础数据
-    generator.generate_regions()
-    generator.generate_soil_types()
-    generator.generate_crop_types()
-    generator.generate_fertilizer_products()
-    generator.generate_data_dictionary()
-    
-    # 用户和站点
-    generator.generate_users()
-    generator.generate_monitoring_stations()
-    
-    # 土壤样本和检测数据
-    generator.generate_soil_samples()
-    generator.generate_soil_test_data()
-    generator.generate_trace_elements()
-    
-    # 评估和分析数据
-    generator.generate_soil_quality_assessment()
-    generator.generate_crop_suitability()
-    generator.generate_fertilizer_plans()
-    
-    # 监测和日志数据
-    generator.generate_historical_monitoring_data()
-    generator.generate_operation_logs()
-    generator.generate_statistical_reports()
-    generator.generate_anomaly_data()
+    generator.generate_all()
     
     print("所有CSV文件生成完成！")
 
@@ -0,0 +1,1215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 数据库装载器
+将 data/ 目录下的CSV文件装载到数据库，支持全量装载和增量装载
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import create_engine, create_mock_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
+
+from adaptive_batcher import DEFAULT_PACKET_LIMIT, AdaptiveBatcher, estimate_row_bytes
+from csv_stream_reader import DERIVED_FUNCTIONS, CSVStreamReader
+from data_verifier import DataVerifier
+from load_metrics import LoadMetrics
+from summary_tables import SUMMARY_STATE_TABLE, SUMMARY_TABLES, SummaryTables
+from table_schemas import TABLE_SCHEMAS, TABLE_LOAD_ORDER, partition_column, render_column_type
+
+# SQLite批量写入参数：WAL日志、内存临时表、较大的页缓存和内存映射，
+# 并在写锁冲突时等待而不是立即报错
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 60000",
+]
+
+# 增量装载使用的状态表：文件摘要、分块摘要和逐行内容哈希
+STATE_TABLES = {
+    '_load_table_digests': (
+        "table_name VARCHAR(64) NOT NULL, "
+        "file_digest CHAR(32) NOT NULL, "
+        "row_count BIGINT NOT NULL, "
+        "loaded_at {timestamp} NULL, "
+        "PRIMARY KEY (table_name)"
+    ),
+    '_load_chunk_digests': (
+        "table_name VARCHAR(64) NOT NULL, "
+        "chunk_no INT NOT NULL, "
+        "first_id BIGINT NOT NULL, "
+        "last_id BIGINT NOT NULL, "
+        "digest CHAR(32) NOT NULL, "
+        "PRIMARY KEY (table_name, chunk_no)"
+    ),
+    '_load_row_hashes': (
+        "table_name VARCHAR(64) NOT NULL, "
+        "row_id BIGINT NOT NULL, "
+        "row_hash CHAR(32) NOT NULL, "
+        "PRIMARY KEY (table_name, row_id)"
+    ),
+}
+
+
+def _register_sqlite_adapters():
+    """sqlite3驱动不直接支持Decimal和日期类型的绑定参数"""
+    sqlite3.register_adapter(Decimal, str)
+    sqlite3.register_adapter(date, date.isoformat)
+    sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+
+
+def _apply_sqlite_pragmas(dbapi_conn, connection_record):
+    """新建SQLite连接时设置适合批量写入的参数"""
+    cursor = dbapi_conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def sqlite_url(path):
+    """SQLite数据库文件路径转换为连接URL"""
+    return f"sqlite:///{os.path.abspath(path)}"
+
+
+def file_digest(path, block_size=1024 * 1024):
+    """计算文件内容的MD5摘要"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def encode_row(raw_row):
+    """将一行CSV原始值编码为字节串，用于计算内容哈希和估计行大小"""
+    return '\x1f'.join(raw_row).encode('utf-8')
+
+
+def row_hash(raw_row):
+    """计算一行CSV原始值的内容哈希"""
+    return hashlib.md5(encode_row(raw_row)).hexdigest()
+
+
+def chunk_digest(row_hashes):
+    """由分块内各行哈希计算分块摘要"""
+    return hashlib.md5(''.join(row_hashes).encode('ascii')).hexdigest()
+
+
+def id_chunk_bounds(ids, span):
+    """
+    按固定的主键区间 [k*span, (k+1)*span) 切分主键列表，产生 (k, 起始下标, 结束下标)。
+    分块边界只由主键决定，插入或删除行只改变所在区间的分块摘要，其后的分块不受影响
+    """
+    start = 0
+    for end in range(1, len(ids) + 1):
+        if end == len(ids) or ids[end] // span != ids[start] // span:
+            yield ids[start] // span, start, end
+            start = end
+
+
+def next_month(month):
+    """'YYYY-MM' 的下一个月"""
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+
+def month_range(first, last):
+    """first 到 last（含）之间的所有月份"""
+    months = []
+    month = first
+    while month <= last:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def shift_month(month, delta):
+    """'YYYY-MM' 向后（delta为负时向前）移动若干个月"""
+    index = int(month[:4]) * 12 + int(month[5:7]) - 1 + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+class DatabaseLoader:
+    def __init__(self, database_url, data_dir="data", metrics=None, max_retries=3, local_infile=False,
+                 summaries=False, offline=False):
+        """offline=True 时不连接数据库，只按URL的方言生成建表、建索引语句"""
+        self.database_url = database_url
+        self.data_dir = data_dir
+        self.metrics = metrics or LoadMetrics()
+        self.max_retries = max_retries
+        connect_args = {}
+        if local_infile and database_url.startswith('mysql'):
+            # 流水线装载使用 LOAD DATA LOCAL INFILE，需要在客户端显式开启
+            connect_args['local_infile'] = True
+        if offline:
+            self.engine = create_mock_engine(database_url, executor=None)
+        else:
+            self.engine = create_engine(database_url, pool_pre_ping=True, pool_recycle=3600,
+                                        connect_args=connect_args)
+        self.dialect = self.engine.dialect.name
+        if self.dialect == 'sqlite' and not offline:
+            _register_sqlite_adapters()
+            event.listen(self.engine, 'connect', _apply_sqlite_pragmas)
+        self.load_report = {'tables': {}, 'phases': {}}
+        # 以无索引、无外键形式创建、等待装载后再建索引的表
+        self.deferred_tables = []
+        self._relaxed_checks = False
+        # 已存在的表是否已补齐到当前表结构
+        self._migrated = False
+        self._packet_limit = None
+        self._row_alias = None
+        self._table_conn = None
+        # 覆盖 TABLE_SCHEMAS 的列类型 {表名: {列名: 类型}}，例如 schema_profiler 给出的紧凑类型
+        self.column_types = {}
+        # 按月分区的表及其已有分区月份；None 表示尚未从数据库读取，不连接数据库时视为没有分区表
+        self._partitioned = set() if offline else None
+        self._partition_months = {}
+        self._partition_lock = threading.Lock()
+        # 看板汇总表：全量装载后重建，增量装载时随写入批次维护
+        self.summary = SummaryTables(self) if summaries else None
+
+    def _q(self, name):
+        """按数据库方言引用标识符"""
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def _csv_path(self, table_name):
+        return os.path.join(self.data_dir, f"{table_name}.csv")
+
+    # ------------------------------------------------------------------
+    # 表结构
+    # ------------------------------------------------------------------
+
+    def _create_table_sql(self, table_name, bare=False):
+        """
+        生成建表语句；bare=True 时只包含主键，索引和外键在装载后补建。
+        按月分区的表主键包含分区列（MySQL和PostgreSQL的要求），初始只有一个兜底分区，
+        按月的分区在装载时按数据所在月份创建
+        """
+        schema = TABLE_SCHEMAS[table_name]
+        pk = schema['primary_key']
+        part_col = partition_column(table_name) if table_name in self.partitioned_tables else None
+        key_cols = [pk, part_col] if part_col else [pk]
+        overrides = self.column_types.get(table_name, {})
+        parts = []
+        for name, col_type in schema['columns']:
+            col_type = overrides.get(name, col_type)
+            null = "NOT NULL" if name in key_cols else "NULL"
+            parts.append(f"{self._q(name)} {render_column_type(col_type, self.dialect)} {null}")
+        parts.append("PRIMARY KEY (" + ", ".join(self._q(c) for c in key_cols) + ")")
+        # SQLite无法事后添加外键，且默认不检查外键，因此始终在建表时声明
+        if not bare or self.dialect == 'sqlite':
+            for fk_col, ref_table, ref_col in self._foreign_keys(table_name):
+                parts.append(
+                    f"CONSTRAINT {self._q(f'fk_{table_name}_{fk_col}')} FOREIGN KEY ({self._q(fk_col)}) "
+                    f"REFERENCES {self._q(ref_table)} ({self._q(ref_col)})"
+                )
+        sql = f"CREATE TABLE IF NOT EXISTS {self._q(table_name)} (\n  " + ",\n  ".join(parts) + "\n)"
+        if self.dialect == 'mysql':
+            sql += " ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+            if part_col:
+                sql += (f" PARTITION BY RANGE COLUMNS({self._q(part_col)}) "
+                        f"(PARTITION pmax VALUES LESS THAN (MAXVALUE))")
+        elif part_col:
+            sql += f" PARTITION BY RANGE ({self._q(part_col)})"
+        return sql
+
+    def _foreign_keys(self, table_name):
+        """
+        表上实际创建的外键。MySQL分区表不支持外键；PostgreSQL分区表的唯一键必须包含分区列，
+        无法被只按id引用。涉及分区表的外键不创建，由 validate_foreign_keys 在装载后校验
+        """
+        partitioned = self.partitioned_tables
+        if table_name in partitioned:
+            return []
+        return [fk for fk in TABLE_SCHEMAS[table_name]['foreign_keys'] if fk[1] not in partitioned]
+
+    def _create_index_sqls(self, table_name, index_names=None):
+        """生成二级索引语句；MySQL合并为一条ALTER TABLE，只重建一次表。index_names 限定只生成其中的索引"""
+        indexes = TABLE_SCHEMAS[table_name]['indexes']
+        if index_names is not None:
+            indexes = {name: cols for name, cols in indexes.items() if name in index_names}
+        if not indexes:
+            return []
+        if self.dialect == 'mysql':
+            clauses = [
+                f"ADD INDEX {self._q(index_name)} (" + ", ".join(self._q(c) for c in cols) + ")"
+                for index_name, cols in indexes.items()
+            ]
+            return [f"ALTER TABLE {self._q(table_name)} " + ", ".join(clauses)]
+        sqls = []
+        for index_name, cols in indexes.items():
+            col_sql = ", ".join(self._q(c) for c in cols)
+            sqls.append(f"CREATE INDEX IF NOT EXISTS {self._q(index_name)} ON {self._q(table_name)} ({col_sql})")
+        return sqls
+
+    def _add_foreign_key_sqls(self, table_name):
+        """生成补建外键的语句（SQLite不支持ALTER TABLE添加约束）"""
+        foreign_keys = self._foreign_keys(table_name)
+        if not foreign_keys or self.dialect == 'sqlite':
+            return []
+        clauses = [
+            f"ADD CONSTRAINT {self._q(f'fk_{table_name}_{fk_col}')} FOREIGN KEY ({self._q(fk_col)}) "
+            f"REFERENCES {self._q(ref_table)} ({self._q(ref_col)})"
+            for fk_col, ref_table, ref_col in foreign_keys
+        ]
+        return [f"ALTER TABLE {self._q(table_name)} " + ", ".join(clauses)]
+
+    def _ensure_state_tables(self):
+        """创建增量装载状态表"""
+        timestamp = 'TIMESTAMP' if self.dialect == 'postgresql' else 'DATETIME'
+        with self.engine.begin() as conn:
+            for name, columns in STATE_TABLES.items():
+                conn.execute(text(f"CREATE TABLE IF NOT EXISTS {self._q(name)} ({columns.format(timestamp=timestamp)})"))
+
+    def create_tables(self, defer_indexes=False, partition_by_month=False, column_types=None):
+        """
+        按依赖顺序创建所有表
+
+        defer_indexes      - 只创建带主键的空表，二级索引和外键在 load_all_tables
+                             装载完成后由 build_deferred_indexes 补建
+        partition_by_month - 将定义了 partition_column 的时间序列表按月RANGE分区（SQLite不支持，忽略）
+        column_types       - {表名: {列名: 类型}}，覆盖默认列类型，例如 SchemaProfiler.compact_types()
+        """
+        start = time.time()
+        if column_types:
+            self.column_types = column_types
+        existing = set(inspect(self.engine).get_table_names())
+        if partition_by_month and self.dialect in ('mysql', 'postgresql'):
+            new_partitioned = {t for t in TABLE_LOAD_ORDER if partition_column(t) and t not in existing}
+            self._partitioned = self.partitioned_tables | new_partitioned
+        with self.engine.begin() as conn:
+            for table_name in TABLE_LOAD_ORDER:
+                if table_name in existing:
+                    print(f"  ⏭️  {table_name} 已存在")
+                    continue
+                conn.execute(text(self._create_table_sql(table_name, bare=defer_indexes)))
+                if self.dialect == 'postgresql' and table_name in self.partitioned_tables:
+                    conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {self._q(f'{table_name}_pdefault')} "
+                        f"PARTITION OF {self._q(table_name)} DEFAULT"
+                    ))
+                if defer_indexes:
+                    self.deferred_tables.append(table_name)
+                else:
+                    for sql in self._create_index_sqls(table_name):
+                        conn.execute(text(sql))
+                print(f"  ✅ 创建表 {table_name}")
+        self._ensure_state_tables()
+        self.migrate_tables()
+        if self.summary is not None:
+            self.summary.create_tables()
+            self.summary.invalidate('create_tables')
+        self.load_report['phases']['create_tables'] = round(time.time() - start, 3)
+
+    def migrate_tables(self, backfill_batch=5000):
+        """
+        把已存在的表补齐到 TABLE_SCHEMAS 的当前结构：CREATE TABLE IF NOT EXISTS 不会修改旧表，
+        缺少的列用 ALTER TABLE ADD COLUMN 补上，并创建包含这些列的索引；
+        派生列（如geohash）按来源列回填已有的行。返回 {表名: [补上的列]}
+        """
+        if self._migrated:
+            return {}
+        inspector = inspect(self.engine)
+        existing = set(inspector.get_table_names())
+        added = {}
+        for table_name in TABLE_LOAD_ORDER:
+            if table_name not in existing:
+                continue
+            schema = TABLE_SCHEMAS[table_name]
+            present = {column['name'] for column in inspector.get_columns(table_name)}
+            missing = [(name, col_type) for name, col_type in schema['columns'] if name not in present]
+            if not missing:
+                continue
+            names = [name for name, _ in missing]
+            overrides = self.column_types.get(table_name, {})
+            with self.engine.begin() as conn:
+                for name, col_type in missing:
+                    col_type = render_column_type(overrides.get(name, col_type), self.dialect)
+                    conn.execute(text(f"ALTER TABLE {self._q(table_name)} ADD COLUMN {self._q(name)} {col_type} NULL"))
+            derived = {name: spec for name, spec in schema.get('derived_columns', {}).items() if name in names}
+            filled = self._backfill_derived(table_name, derived, backfill_batch) if derived else 0
+            # 回填之后再建索引，避免逐行维护索引
+            index_names = [index_name for index_name, cols in schema['indexes'].items()
+                           if any(c in names for c in cols)]
+            if index_names and table_name not in self.deferred_tables:
+                with self.engine.begin() as conn:
+                    for sql in self._create_index_sqls(table_name, index_names):
+                        conn.execute(text(sql))
+            added[table_name] = names
+            print(f"  🔧 {table_name} 补充列 {', '.join(names)}"
+                  + (f"，回填 {filled:,} 行" if derived else ""))
+        self._migrated = True
+        return added
+
+    def _backfill_derived(self, table_name, derived, batch_size):
+        """按主键分批读取来源列，计算派生列并写回，返回更新的行数"""
+        pk = TABLE_SCHEMAS[table_name]['primary_key']
+        specs = [(name, DERIVED_FUNCTIONS[func], sources) for name, (func, sources) in derived.items()]
+        source_columns = [c for _, _, sources in specs for c in sources]
+        select_sql = text(
+            f"SELECT {self._q(pk)}, " + ", ".join(self._q(c) for c in source_columns)
+            + f" FROM {self._q(table_name)} WHERE {self._q(pk)} > :last_id "
+            f"ORDER BY {self._q(pk)} LIMIT {int(batch_size)}")
+        update_sql = text(
+            f"UPDATE {self._q(table_name)} SET "
+            + ", ".join(f"{self._q(name)} = :v{i}" for i, (name, _, _) in enumerate(specs))
+            + f" WHERE {self._q(pk)} = :id")
+        with self.engine.connect() as conn:
+            last_id = conn.execute(text(f"SELECT MIN({self._q(pk)}) FROM {self._q(table_name)}")).scalar()
+        if last_id is None:
+            return 0
+        last_id -= 1
+        filled = 0
+        while True:
+            with self.engine.begin() as conn:
+                rows = conn.execute(select_sql, {'last_id': last_id}).fetchall()
+                if not rows:
+                    return filled
+                params = []
+                for row in rows:
+                    # 与装载时一样，派生函数的参数为来源列的文本
+                    values = dict(zip(source_columns, (None if v is None else str(v) for v in row[1:])))
+                    param = {'id': row[0]}
+                    for i, (_, func, sources) in enumerate(specs):
+                        param[f"v{i}"] = func(*(values[c] for c in sources))
+                    params.append(param)
+                conn.execute(update_sql, params)
+            filled += len(params)
+            last_id = rows[-1][0]
+
+    def drop_all_tables(self):
+        """按依赖逆序删除所有表（包括增量装载状态表和看板汇总表）"""
+        existing = set(inspect(self.engine).get_table_names())
+        with self.engine.begin() as conn:
+            tables = list(reversed(TABLE_LOAD_ORDER)) + list(STATE_TABLES) + list(SUMMARY_TABLES) + [SUMMARY_STATE_TABLE]
+            for table_name in tables:
+                if table_name in existing:
+                    conn.execute(text(f"DROP TABLE {self._q(table_name)}"))
+                    print(f"  🗑️  删除表 {table_name}")
+        self._partitioned = None
+        self._partition_months = {}
+        if self.summary is not None:
+            self.summary = SummaryTables(self)
+
+    # ------------------------------------------------------------------
+    # 批量装载期间的约束检查
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _begin(self):
+        """
+        开启事务；批量装载期间在MySQL会话上关闭外键和唯一性检查，
+        在SQLite连接上关闭同步写盘。处于整表事务中时直接复用该事务
+        """
+        if self._table_conn is not None:
+            yield self._table_conn
+            return
+        with self.engine.begin() as conn:
+            if self._relaxed_checks and self.dialect == 'mysql':
+                conn.execute(text("SET foreign_key_checks = 0"))
+                conn.execute(text("SET unique_checks = 0"))
+            elif self._relaxed_checks and self.dialect == 'sqlite':
+                conn.execute(text("PRAGMA synchronous = OFF"))
+            yield conn
+
+    @contextmanager
+    def _table_transaction(self):
+        """SQLite整表在一个大事务中写入；其他数据库每个写入批次单独提交，避免长事务"""
+        if self.dialect != 'sqlite':
+            yield
+            return
+        with self._begin() as conn:
+            self._table_conn = conn
+            try:
+                yield
+            finally:
+                self._table_conn = None
+
+    @contextmanager
+    def relaxed_checks(self):
+        """批量装载期间关闭约束检查，结束后丢弃连接池中已修改会话变量的连接"""
+        self._relaxed_checks = True
+        try:
+            yield
+        finally:
+            self._relaxed_checks = False
+            self.engine.dispose()
+
+    def _build_table_indexes(self, table_name, statements):
+        start = time.time()
+        with self._begin() as conn:
+            for sql in statements:
+                conn.execute(text(sql))
+        return table_name, time.time() - start
+
+    def _run_parallel(self, statements_by_table, max_workers):
+        """各表之间相互独立，按表并行执行DDL"""
+        timings = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(self._build_table_indexes, table_name, statements)
+                for table_name, statements in statements_by_table.items() if statements
+            ]
+            for future in futures:
+                table_name, elapsed = future.result()
+                timings[table_name] = round(elapsed, 3)
+        return timings
+
+    def build_deferred_indexes(self, max_workers=4):
+        """装载完成后并行补建二级索引和外键"""
+        tables = list(self.deferred_tables)
+        if not tables:
+            return {}
+        if self.dialect == 'sqlite':
+            # SQLite同一时间只允许一个写入者，并行建索引没有收益
+            max_workers = 1
+
+        start = time.time()
+        index_timings = self._run_parallel(
+            {t: self._create_index_sqls(t) for t in tables}, max_workers)
+        self.load_report['phases']['build_indexes'] = round(time.time() - start, 3)
+
+        # 外键在装载后统一校验，添加时无需逐行检查
+        start = time.time()
+        with self.relaxed_checks():
+            fk_timings = self._run_parallel(
+                {t: self._add_foreign_key_sqls(t) for t in tables}, max_workers)
+        self.load_report['phases']['build_foreign_keys'] = round(time.time() - start, 3)
+
+        self.deferred_tables = []
+        for table_name in tables:
+            self.load_report['tables'].setdefault(table_name, {})['index_build_seconds'] = (
+                index_timings.get(table_name, 0) + fk_timings.get(table_name, 0))
+        return index_timings
+
+    def validate_foreign_keys(self, tables=None):
+        """检查外键引用完整性，返回 {表.列: 孤立行数}"""
+        results = {}
+        existing = set(inspect(self.engine).get_table_names())
+        start = time.time()
+        with self.engine.connect() as conn:
+            for table_name in tables or TABLE_LOAD_ORDER:
+                if table_name not in existing:
+                    continue
+                for fk_col, ref_table, ref_col in TABLE_SCHEMAS[table_name]['foreign_keys']:
+                    if ref_table not in existing:
+                        continue
+                    orphans = conn.execute(text(
+                        f"SELECT COUNT(*) FROM {self._q(table_name)} c "
+                        f"LEFT JOIN {self._q(ref_table)} p ON c.{self._q(fk_col)} = p.{self._q(ref_col)} "
+                        f"WHERE c.{self._q(fk_col)} IS NOT NULL AND p.{self._q(ref_col)} IS NULL"
+                    )).scalar()
+                    results[f"{table_name}.{fk_col}"] = orphans
+        self.load_report['phases']['validate'] = round(time.time() - start, 3)
+        self.load_report['validation'] = results
+        return results
+
+    # ------------------------------------------------------------------
+    # 按月分区
+    # ------------------------------------------------------------------
+
+    @property
+    def partitioned_tables(self):
+        """已按月分区的表；首次访问时从数据库读取"""
+        if self._partitioned is None:
+            self._partitioned = self._detect_partitioned_tables()
+        return self._partitioned
+
+    def _detect_partitioned_tables(self):
+        if self.dialect == 'mysql':
+            sql = ("SELECT DISTINCT TABLE_NAME FROM information_schema.PARTITIONS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND PARTITION_NAME IS NOT NULL")
+        elif self.dialect == 'postgresql':
+            sql = ("SELECT c.relname FROM pg_partitioned_table p "
+                   "JOIN pg_class c ON c.oid = p.partrelid "
+                   "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = current_schema()")
+        else:
+            return set()
+        with self.engine.connect() as conn:
+            names = {name for (name,) in conn.execute(text(sql))}
+        return {t for t in TABLE_LOAD_ORDER if t in names and partition_column(t)}
+
+    def _partition_name(self, table_name, month):
+        """MySQL分区名为 pYYYYMM；PostgreSQL每个分区是一张子表，名为 表名_pYYYYMM"""
+        suffix = f"p{month[:4]}{month[5:7]}"
+        return suffix if self.dialect == 'mysql' else f"{table_name}_{suffix}"
+
+    def existing_partitions(self, table_name):
+        """表现有的按月分区，返回升序的 'YYYY-MM' 列表（不含兜底分区）"""
+        if self.dialect == 'mysql':
+            sql = ("SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL")
+        else:
+            sql = ("SELECT c.relname FROM pg_inherits i "
+                   "JOIN pg_class c ON c.oid = i.inhrelid "
+                   "JOIN pg_class p ON p.oid = i.inhparent "
+                   "JOIN pg_namespace n ON n.oid = p.relnamespace "
+                   "WHERE p.relname = :t AND n.nspname = current_schema()")
+        with self.engine.connect() as conn:
+            names = [name for (name,) in conn.execute(text(sql), {'t': table_name})]
+        months = []
+        for name in names:
+            digits = name.rsplit('p', 1)[-1]
+            if len(digits) == 6 and digits.isdigit():
+                months.append(f"{digits[:4]}-{digits[4:]}")
+        return sorted(months)
+
+    def _mysql_partition_clause(self, month):
+        return f"PARTITION {self._partition_name(None, month)} VALUES LESS THAN ('{next_month(month)}-01')"
+
+    def ensure_partitions(self, table_name, months):
+        """
+        确保表上存在给定月份的分区，返回新建的月份
+
+        MySQL的RANGE分区必须连续：新月份高于现有分区时拆分兜底分区 pmax，
+        低于现有分区时拆分最早的分区；PostgreSQL逐月创建子表，
+        若默认分区中已有该月的数据则先移入新子表再挂载
+        """
+        months = {m for m in months if m}
+        if not months or table_name not in self.partitioned_tables:
+            return []
+        with self._partition_lock:
+            known = self._partition_months.get(table_name)
+            if known is None:
+                known = set(self.existing_partitions(table_name))
+                self._partition_months[table_name] = known
+            missing = months - known
+            if not missing:
+                return []
+
+            table = self._q(table_name)
+            statements = []
+            if self.dialect == 'mysql':
+                lo, hi = (min(known), max(known)) if known else (None, None)
+                wanted = month_range(min(missing | ({lo} if lo else set())),
+                                     max(missing | ({hi} if hi else set())))
+                new = [m for m in wanted if m not in known]
+                below = [m for m in new if lo and m < lo]
+                above = [m for m in new if not lo or m > hi]
+                if below:
+                    clauses = [self._mysql_partition_clause(m) for m in below + [lo]]
+                    statements.append(f"ALTER TABLE {table} REORGANIZE PARTITION "
+                                      f"{self._partition_name(table_name, lo)} INTO ({', '.join(clauses)})")
+                if above:
+                    clauses = [self._mysql_partition_clause(m) for m in above]
+                    clauses.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+                    statements.append(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({', '.join(clauses)})")
+            else:
+                new = sorted(missing)
+                col = self._q(partition_column(table_name))
+                default = self._q(f"{table_name}_pdefault")
+                for m in new:
+                    child = self._q(self._partition_name(table_name, m))
+                    bounds = f"'{m}-01'", f"'{next_month(m)}-01'"
+                    where = f"{col} >= {bounds[0]} AND {col} < {bounds[1]}"
+                    statements += [
+                        f"CREATE TABLE {child} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+                        f"INSERT INTO {child} SELECT * FROM {default} WHERE {where}",
+                        f"DELETE FROM {default} WHERE {where}",
+                        f"ALTER TABLE {table} ATTACH PARTITION {child} FOR VALUES FROM ({bounds[0]}) TO ({bounds[1]})",
+                    ]
+
+            with self.engine.begin() as conn:
+                for sql in statements:
+                    conn.execute(text(sql))
+            known.update(new)
+            return new
+
+    def _route_partitions(self, table_name, header, raw_rows):
+        """写入一个分块之前，为分块中出现的月份准备好分区"""
+        if table_name not in self.partitioned_tables:
+            return
+        index = header.index(partition_column(table_name))
+        self.ensure_partitions(table_name, {raw[index][:7] for raw in raw_rows if raw[index]})
+
+    def create_future_partitions(self, months_ahead=3, tables=None):
+        """预先创建从本月起未来 months_ahead 个月的分区，返回 {表名: 新建的月份}"""
+        current = date.today().strftime('%Y-%m')
+        months = month_range(current, shift_month(current, months_ahead))
+        return {t: self.ensure_partitions(t, months) for t in (tables or sorted(self.partitioned_tables))}
+
+    def drop_old_partitions(self, keep_months=24, archive=False, tables=None):
+        """
+        删除早于最近 keep_months 个月的分区，返回 {表名: 删除的月份}
+
+        archive=True 时不删除数据，而是把分区转为独立的归档表：PostgreSQL直接解除挂载，
+        子表 表名_pYYYYMM 保留；MySQL先将分区交换到同名归档表 表名_pYYYYMM 再删除空分区。
+        被移出的行同时从增量装载的行哈希中删除
+        """
+        cutoff = shift_month(date.today().strftime('%Y-%m'), -(keep_months - 1))
+        removed = {}
+        for table_name in (tables or sorted(self.partitioned_tables)):
+            old = [m for m in self.existing_partitions(table_name) if m < cutoff]
+            table = self._q(table_name)
+            pk = self._q(TABLE_SCHEMAS[table_name]['primary_key'])
+            for month in old:
+                name = self._partition_name(table_name, month)
+                if self.dialect == 'mysql':
+                    source = f"{table} PARTITION ({self._q(name)})"
+                    archive_table = self._q(f"{table_name}_{name}")
+                    if archive:
+                        statements = [
+                            f"CREATE TABLE {archive_table} LIKE {table}",
+                            f"ALTER TABLE {archive_table} REMOVE PARTITIONING",
+                            f"ALTER TABLE {table} EXCHANGE PARTITION {self._q(name)} WITH TABLE {archive_table}",
+                            f"ALTER TABLE {table} DROP PARTITION {self._q(name)}",
+                        ]
+                    else:
+                        statements = [f"ALTER TABLE {table} DROP PARTITION {self._q(name)}"]
+                else:
+                    source = self._q(name)
+                    if archive:
+                        statements = [f"ALTER TABLE {table} DETACH PARTITION {self._q(name)}"]
+                    else:
+                        statements = [f"DROP TABLE {self._q(name)}"]
+                with self.engine.begin() as conn:
+                    conn.execute(
+                        text(f"DELETE FROM {self._q('_load_row_hashes')} WHERE table_name = :t "
+                             f"AND row_id IN (SELECT {pk} FROM {source})"),
+                        {'t': table_name},
+                    )
+                for sql in statements:
+                    with self.engine.begin() as conn:
+                        conn.execute(text(sql))
+                with self._partition_lock:
+                    self._partition_months.get(table_name, set()).discard(month)
+            removed[table_name] = old
+        return removed
+
+    # ------------------------------------------------------------------
+    # 写入批次
+    # ------------------------------------------------------------------
+
+    def server_packet_limit(self):
+        """读取服务器单个数据包的上限（MySQL的max_allowed_packet），其他数据库使用默认值"""
+        if self._packet_limit is None:
+            limit = DEFAULT_PACKET_LIMIT
+            if self.dialect == 'mysql':
+                with self.engine.connect() as conn:
+                    limit = int(conn.execute(text("SELECT @@max_allowed_packet")).scalar())
+            self._packet_limit = limit
+        return self._packet_limit
+
+    def mysql_row_alias(self):
+        """
+        MySQL 8.0.19 起可以用 INSERT ... AS new 引用待插入的行，VALUES(col) 的写法已弃用；
+        MariaDB 和更早的MySQL不支持行别名，仍使用 VALUES(col)
+        """
+        if self._row_alias is None:
+            with self.engine.connect():
+                # 连接后方言才取得服务器版本
+                pass
+            dialect = self.engine.dialect
+            version = tuple(dialect.server_version_info or ())
+            self._row_alias = not dialect.is_mariadb and version >= (8, 0, 19)
+        return self._row_alias
+
+    def _new_batcher(self):
+        return AdaptiveBatcher(packet_limit=self.server_packet_limit())
+
+    # ------------------------------------------------------------------
+    # CSV读取
+    # ------------------------------------------------------------------
+
+    def _open_reader(self, table_name, chunk_size):
+        """按表结构流式读取CSV，列类型来自缓存的表结构"""
+        return CSVStreamReader(self._csv_path(table_name), table_name, chunk_size)
+
+    @staticmethod
+    def _as_params(columns, rows):
+        """行元组转换为SQL绑定参数字典"""
+        return [dict(zip(columns, row)) for row in rows]
+
+    # ------------------------------------------------------------------
+    # SQL构造
+    # ------------------------------------------------------------------
+
+    def _insert_sql(self, table_name, columns):
+        col_sql = ", ".join(self._q(c) for c in columns)
+        val_sql = ", ".join(f":{c}" for c in columns)
+        return f"INSERT INTO {self._q(table_name)} ({col_sql}) VALUES ({val_sql})"
+
+    def _upsert_sql(self, table_name, columns, key_columns):
+        """生成按主键插入或更新的语句"""
+        sql = self._insert_sql(table_name, columns)
+        updates = [c for c in columns if c not in key_columns]
+        if self.dialect == 'mysql':
+            if self.mysql_row_alias():
+                set_sql = ", ".join(f"{self._q(c)} = new.{self._q(c)}" for c in updates)
+                return f"{sql} AS new ON DUPLICATE KEY UPDATE {set_sql}"
+            set_sql = ", ".join(f"{self._q(c)} = VALUES({self._q(c)})" for c in updates)
+            return f"{sql} ON DUPLICATE KEY UPDATE {set_sql}"
+        key_sql = ", ".join(self._q(c) for c in key_columns)
+        set_sql = ", ".join(f"{self._q(c)} = EXCLUDED.{self._q(c)}" for c in updates)
+        return f"{sql} ON CONFLICT ({key_sql}) DO UPDATE SET {set_sql}"
+
+    # ------------------------------------------------------------------
+    # 装载状态
+    # ------------------------------------------------------------------
+
+    def _save_row_hashes(self, conn, table_name, ids, hashes):
+        if not ids:
+            return
+        sql = self._upsert_sql('_load_row_hashes', ['table_name', 'row_id', 'row_hash'], ['table_name', 'row_id'])
+        conn.execute(text(sql), [
+            {'table_name': table_name, 'row_id': row_id, 'row_hash': h}
+            for row_id, h in zip(ids, hashes)
+        ])
+
+    def _save_chunk_digest(self, conn, table_name, chunk_no, first_id, last_id, digest):
+        sql = self._upsert_sql(
+            '_load_chunk_digests',
+            ['table_name', 'chunk_no', 'first_id', 'last_id', 'digest'],
+            ['table_name', 'chunk_no'],
+        )
+        conn.execute(text(sql), {
+            'table_name': table_name, 'chunk_no': chunk_no,
+            'first_id': first_id, 'last_id': last_id, 'digest': digest,
+        })
+
+    def _save_table_digest(self, table_name, digest, row_count, last_chunk_no):
+        sql = self._upsert_sql(
+            '_load_table_digests',
+            ['table_name', 'file_digest', 'row_count', 'loaded_at'],
+            ['table_name'],
+        )
+        with self._begin() as conn:
+            conn.execute(
+                text(f"DELETE FROM {self._q('_load_chunk_digests')} WHERE table_name = :t AND chunk_no > :n"),
+                {'t': table_name, 'n': last_chunk_no},
+            )
+            conn.execute(text(sql), {
+                'table_name': table_name, 'file_digest': digest,
+                'row_count': row_count, 'loaded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            })
+
+    def _stored_table_digest(self, table_name):
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text(f"SELECT file_digest, row_count FROM {self._q('_load_table_digests')} WHERE table_name = :t"),
+                {'t': table_name},
+            ).first()
+        return tuple(row) if row else None
+
+    def _stored_chunk_digests(self, table_name):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"SELECT chunk_no, first_id, last_id, digest FROM {self._q('_load_chunk_digests')} "
+                     f"WHERE table_name = :t"),
+                {'t': table_name},
+            )
+            return {r[0]: (r[1], r[2], r[3]) for r in rows}
+
+    # ------------------------------------------------------------------
+    # 全量装载
+    # ------------------------------------------------------------------
+
+    def _run_batch(self, table_name, rows, write):
+        """
+        执行一个写入批次并记录数据库耗时；连接中断、死锁等可重试错误按指数退避重试。
+        处于整表事务中时无法单独重试，直接抛出
+        """
+        retries = 0
+        while True:
+            start = time.time()
+            try:
+                write()
+                break
+            except OperationalError:
+                if self._table_conn is not None or retries >= self.max_retries:
+                    raise
+                retries += 1
+                time.sleep(min(0.5 * 2 ** retries, 10))
+        elapsed = time.time() - start
+        self.metrics.record_batch(table_name, rows, elapsed, retries)
+        return elapsed
+
+    def _id_chunks(self, reader, span, convert=True):
+        """
+        把CSV分块按主键区间重新切分（见 id_chunk_bounds），产生 (k, 主键, 原始行, 转换后的行)；
+        跨越CSV分块的区间先缓存，读到下一个区间再产出
+        """
+        pk = TABLE_SCHEMAS[reader.table_name]['primary_key']
+        pk_index = None
+        ids, raw_rows, rows = [], [], []
+        for chunk_raw, chunk_rows in reader.iter_chunks(convert=convert):
+            if pk_index is None:
+                pk_index = reader.schema.header.index(pk)
+            ids.extend(int(raw[pk_index]) for raw in chunk_raw)
+            raw_rows.extend(chunk_raw)
+            if convert:
+                rows.extend(chunk_rows)
+            bounds = list(id_chunk_bounds(ids, span))
+            for k, start, end in bounds[:-1]:
+                yield k, ids[start:end], raw_rows[start:end], rows[start:end] if convert else None
+            # 最后一个区间可能在下一个CSV分块中继续
+            cut = bounds[-1][1]
+            ids, raw_rows, rows = ids[cut:], raw_rows[cut:], rows[cut:]
+        if ids:
+            yield ids[0] // span, ids, raw_rows, rows if convert else None
+
+    def load_table(self, table_name, batch_size=1000):
+        """
+        全量装载单张表，同时记录增量装载所需的摘要
+
+        batch_size 为读取CSV的行数和分块摘要的主键区间宽度；实际写入批次由 AdaptiveBatcher
+        按字节数决定，可以跨越多个分块
+        """
+        path = self._csv_path(table_name)
+        digest = file_digest(path)
+        batcher = self._new_batcher()
+        metrics = self.metrics.start_table(table_name, os.path.getsize(path))
+        if self.summary is not None:
+            self.summary.invalidate(table_name)
+        total = 0
+        chunk_no = -1
+        sql = None
+        reader = self._open_reader(table_name, batch_size)
+
+        pending_rows, pending_ids, pending_hashes, pending_chunks = [], [], [], []
+        pending_bytes = 0
+
+        def write():
+            with self._begin() as conn:
+                if pending_rows:
+                    conn.execute(text(sql), self._as_params(columns, pending_rows))
+                self._save_row_hashes(conn, table_name, pending_ids, pending_hashes)
+                for chunk in pending_chunks:
+                    self._save_chunk_digest(conn, table_name, *chunk)
+
+        def flush():
+            elapsed = self._run_batch(table_name, len(pending_rows), write)
+            batcher.record(len(pending_rows), pending_bytes, elapsed)
+            pending_rows.clear()
+            pending_ids.clear()
+            pending_hashes.clear()
+            pending_chunks.clear()
+
+        mark = time.time()
+        for chunk_no, ids, raw_rows, rows in self._id_chunks(reader, batch_size):
+            if sql is None:
+                columns = reader.columns
+                sql = self._insert_sql(table_name, columns)
+            self._route_partitions(table_name, reader.schema.header, raw_rows)
+            db_before = metrics.db_seconds
+            chunk_bytes = 0
+            hashes = []
+            for raw, row, row_id in zip(raw_rows, rows, ids):
+                encoded = encode_row(raw)
+                size = estimate_row_bytes(encoded, len(columns))
+                if pending_rows and batcher.is_full(len(pending_rows), pending_bytes + size):
+                    flush()
+                    pending_bytes = 0
+                h = hashlib.md5(encoded).hexdigest()
+                pending_rows.append(row)
+                pending_ids.append(row_id)
+                pending_hashes.append(h)
+                pending_bytes += size
+                chunk_bytes += len(encoded)
+                hashes.append(h)
+            # 分块摘要随分块最后一行一起提交
+            pending_chunks.append((chunk_no, ids[0], ids[-1], chunk_digest(hashes)))
+            total += len(rows)
+
+            now = time.time()
+            db_seconds = metrics.db_seconds - db_before
+            self.metrics.record_chunk(table_name, chunk_no, len(rows), chunk_bytes,
+                                      now - mark - db_seconds, db_seconds)
+            mark = now
+
+        if pending_rows or pending_chunks:
+            flush()
+
+        self._save_table_digest(table_name, digest, total, chunk_no)
+        self.metrics.finish_table(table_name)
+        self.load_report['tables'][table_name] = {
+            'mode': 'full', 'inserted': total, 'batching': batcher.summary(),
+        }
+        return total
+
+    def load_all_tables(self, batch_size=1000, incremental=False, delete_missing=False, index_workers=4):
+        """
+        按依赖顺序装载所有表
+
+        incremental    - 增量装载：按主键和内容哈希比对，只写入新增或变化的行
+        delete_missing - 增量装载时删除CSV中已不存在的行
+        index_workers  - 装载后并行补建索引的线程数（用于 create_tables(defer_indexes=True) 创建的表）
+
+        全量装载期间关闭外键和唯一性检查，装载完成后补建索引并校验外键完整性。
+        """
+        self.begin_load()
+        pending_deletes = {}
+        loaded_tables = []
+        success = True
+
+        load_start = time.time()
+        with self.relaxed_checks() if not incremental else nullcontext():
+            for table_name in TABLE_LOAD_ORDER:
+                if not os.path.exists(self._csv_path(table_name)):
+                    print(f"  ⏭️  {table_name}.csv 不存在，跳过")
+                    continue
+
+                start = time.time()
+                try:
+                    if incremental:
+                        with self._table_transaction():
+                            stats, missing_ids = self.load_table_incremental(table_name, batch_size, delete_missing)
+                        if missing_ids:
+                            pending_deletes[table_name] = missing_ids
+                        print(f"  ✅ {table_name}: 新增 {stats['inserted']:,}，更新 {stats['updated']:,}，"
+                              f"未变化 {stats['unchanged']:,}"
+                              + ("（文件未变化，已跳过）" if stats.get('skipped') else "")
+                              + f"，耗时 {time.time() - start:.2f}s")
+                    else:
+                        with self._table_transaction():
+                            count = self.load_table(table_name, batch_size)
+                        batching = self.load_report['tables'][table_name]['batching']
+                        print(f"  ✅ {table_name}: {count:,} 条，{batching['batches']} 批"
+                              f"（平均每批 {batching['avg_batch_rows']:,.0f} 行），耗时 {time.time() - start:.2f}s")
+                    self.load_report['tables'][table_name]['load_seconds'] = round(time.time() - start, 3)
+                    loaded_tables.append(table_name)
+                except Exception as e:
+                    print(f"  ❌ {table_name} 装载失败: {str(e)}")
+                    success = False
+
+        # 按依赖逆序删除，避免违反外键约束
+        for table_name in reversed(TABLE_LOAD_ORDER):
+            if table_name in pending_deletes:
+                try:
+                    deleted = self._delete_rows(table_name, pending_deletes[table_name], batch_size)
+                    self.load_report['tables'][table_name]['deleted'] = deleted
+                    print(f"  🗑️  {table_name}: 删除 {deleted:,} 条")
+                except Exception as e:
+                    print(f"  ❌ {table_name} 删除失败: {str(e)}")
+                    success = False
+        self.load_report['phases']['load'] = round(time.time() - load_start, 3)
+        return self.finish_load(loaded_tables, success, validate=not incremental, index_workers=index_workers)
+
+    def begin_load(self):
+        """装载之前的准备：创建状态表，保留 create_tables 阶段的计时并清除上一次装载的结果"""
+        self._ensure_state_tables()
+        self.migrate_tables()
+        if self.summary is None:
+            # 不维护汇总表的装载：已有的汇总表在下次重建之前视为过期
+            summary = SummaryTables(self)
+            if summary.exists():
+                summary.mark_stale()
+        create_seconds = self.load_report['phases'].get('create_tables')
+        self.load_report = {'tables': {}, 'phases': {}}
+        if create_seconds is not None:
+            self.load_report['phases']['create_tables'] = create_seconds
+        self.metrics.reset()
+
+    def finish_load(self, loaded_tables, success=True, validate=True, index_workers=4):
+        """装载之后的收尾：补建索引和外键、校验外键完整性、输出阶段耗时并写入装载报告"""
+        if self.deferred_tables:
+            print("🔨 补建索引和外键...")
+            try:
+                self.build_deferred_indexes(max_workers=index_workers)
+            except Exception as e:
+                print(f"  ❌ 补建索引失败: {str(e)}")
+                success = False
+
+        if validate and loaded_tables:
+            print("🔍 校验外键完整性...")
+            for key, orphans in self.validate_foreign_keys(loaded_tables).items():
+                if orphans:
+                    print(f"  ⚠️  {key}: {orphans:,} 条记录引用不存在")
+                    success = False
+
+        if self.summary is not None and success:
+            try:
+                seconds = self.summary.refresh()
+                if seconds is not None:
+                    print("📊 重建看板汇总表...")
+                    self.load_report['phases']['summaries'] = round(seconds, 3)
+            except Exception as e:
+                print(f"  ❌ 重建看板汇总表失败: {str(e)}")
+                success = False
+
+        for phase, seconds in self.load_report['phases'].items():
+            self.metrics.record_phase(phase, seconds)
+            print(f"  ⏱️  {phase}: {seconds:.2f}s")
+        self.load_report['metrics'] = self.metrics.to_dict()
+        report_path = self.metrics.write_report(self.load_report)
+        if report_path:
+            print(f"📝 装载报告已写入: {report_path}")
+        return success
+
+    # ------------------------------------------------------------------
+    # 增量装载
+    # ------------------------------------------------------------------
+
+    def load_table_incremental(self, table_name, batch_size=1000, delete_missing=False):
+        """
+        增量装载单张表
+
+        文件摘要未变化时整表跳过；分块按固定的主键区间切分，摘要未变化时跳过该分块，
+        因此修改、插入或删除行只需要比对所在区间；
+        其余分块逐行比对内容哈希，新增行插入，变化行按主键更新。
+        返回 (统计信息, CSV中已不存在的主键列表)
+        """
+        stats = {'mode': 'incremental', 'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped_chunks': 0}
+        pk = TABLE_SCHEMAS[table_name]['primary_key']
+        path = self._csv_path(table_name)
+        digest = file_digest(path)
+        stored = self._stored_table_digest(table_name)
+        if stored and stored[0] == digest:
+            stats['unchanged'] = stored[1]
+            stats['skipped'] = True
+            self.load_report['tables'][table_name] = stats
+            return stats, []
+
+        stored_chunks = self._stored_chunk_digests(table_name)
+        batcher = self._new_batcher()
+        metrics = self.metrics.start_table(table_name, os.path.getsize(path))
+        seen_ids = set() if delete_missing else None
+        total = 0
+        chunk_no = -1
+        insert_sql = None
+        reader = self._open_reader(table_name, batch_size)
+
+        mark = time.time()
+        for chunk_no, ids, raw_rows, _ in self._id_chunks(reader, batch_size, convert=False):
+            if insert_sql is None:
+                columns = reader.columns
+                convert = reader.schema.convert
+                insert_sql = self._insert_sql(table_name, columns)
+                # 分区表无法只按id做冲突判断，且分区列可能变化，变化行先删除再插入
+                partitioned = table_name in self.partitioned_tables
+                upsert_sql = insert_sql if partitioned else self._upsert_sql(table_name, columns, [pk])
+
+            db_before = metrics.db_seconds
+            encoded_rows = [encode_row(raw) for raw in raw_rows]
+            hashes = [hashlib.md5(encoded).hexdigest() for encoded in encoded_rows]
+            digest_of_chunk = chunk_digest(hashes)
+            total += len(ids)
+            if seen_ids is not None:
+                seen_ids.update(ids)
+
+            if stored_chunks.get(chunk_no) == (ids[0], ids[-1], digest_of_chunk):
+                stats['unchanged'] += len(ids)
+                stats['skipped_chunks'] += 1
+            else:
+                result = {}
+                self._route_partitions(table_name, reader.schema.header, raw_rows)
+
+                def apply_chunk():
+                    with self._begin() as conn:
+                        existing = dict(conn.execute(
+                            text(f"SELECT row_id, row_hash FROM {self._q('_load_row_hashes')} "
+                                 f"WHERE table_name = :t AND row_id BETWEEN :lo AND :hi"),
+                            {'t': table_name, 'lo': min(ids), 'hi': max(ids)},
+                        ).all())
+
+                        new_rows, changed_rows, changed_ids, changed_hashes = [], [], [], []
+                        updated_ids, changed_raw = [], []
+                        for raw, encoded, row_id, h in zip(raw_rows, encoded_rows, ids, hashes):
+                            old = existing.get(row_id)
+                            if old == h:
+                                continue
+                            size = estimate_row_bytes(encoded, len(columns))
+                            (new_rows if old is None else changed_rows).append((convert(raw), size))
+                            if old is not None:
+                                updated_ids.append(row_id)
+                            changed_ids.append(row_id)
+                            changed_hashes.append(h)
+                            changed_raw.append(raw)
+
+                        with self._summary_delta(conn, table_name, changed_ids, reader.schema.header, changed_raw):
+                            if partitioned and updated_ids:
+                                params = {f"id{i}": row_id for i, row_id in enumerate(updated_ids)}
+                                in_sql = ", ".join(f":{key}" for key in params)
+                                conn.execute(text(f"DELETE FROM {self._q(table_name)} "
+                                                  f"WHERE {self._q(pk)} IN ({in_sql})"), params)
+
+                            for sql, items in ((insert_sql, new_rows), (upsert_sql, changed_rows)):
+                                sizes = [size for _, size in items]
+                                for batch, nbytes in batcher.iter_batches([row for row, _ in items], sizes):
+                                    start = time.time()
+                                    conn.execute(text(sql), self._as_params(columns, batch))
+                                    batcher.record(len(batch), nbytes, time.time() - start)
+                        self._save_row_hashes(conn, table_name, changed_ids, changed_hashes)
+                        self._save_chunk_digest(conn, table_name, chunk_no, ids[0], ids[-1], digest_of_chunk)
+                    result.update(inserted=len(new_rows), updated=len(changed_rows))
+
+                self._run_batch(table_name, len(ids), apply_chunk)
+                stats['inserted'] += result['inserted']
+                stats['updated'] += result['updated']
+                stats['unchanged'] += len(ids) - result['inserted'] - result['updated']
+
+            now = time.time()
+            db_seconds = metrics.db_seconds - db_before
+            self.metrics.record_chunk(table_name, chunk_no, len(ids), sum(map(len, encoded_rows)),
+                                      now - mark - db_seconds, db_seconds)
+            mark = now
+
+        missing_ids = []
+        if seen_ids is not None:
+            with self.engine.connect() as conn:
+                result = conn.execute(
+                    text(f"SELECT row_id FROM {self._q('_load_row_hashes')} WHERE table_name = :t"),
+                    {'t': table_name},
+                )
+                missing_ids = [row_id for (row_id,) in result if row_id not in seen_ids]
+
+        self._save_table_digest(table_name, digest, total, chunk_no)
+        self.metrics.finish_table(table_name)
+        stats['batching'] = batcher.summary()
+        self.load_report['tables'][table_name] = stats
+        return stats, missing_ids
+
+    def _summary_delta(self, conn, table_name, row_ids, header=None, raw_rows=()):
+        """写入批次对看板汇总表的增量维护；未启用汇总表时为空操作"""
+        if self.summary is None:
+            return nullcontext()
+        return self.summary.delta(conn, table_name, row_ids, header, raw_rows)
+
+    def _delete_rows(self, table_name, ids, batch_size=1000):
+        """按主键批量删除行及其内容哈希"""
+        pk = TABLE_SCHEMAS[table_name]['primary_key']
+        with self._begin() as conn:
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                params = {f"id{i}": row_id for i, row_id in enumerate(batch)}
+                in_sql = ", ".join(f":{key}" for key in params)
+                with self._summary_delta(conn, table_name, batch):
+                    conn.execute(text(f"DELETE FROM {self._q(table_name)} WHERE {self._q(pk)} IN ({in_sql})"),
+                                 params)
+                conn.execute(
+                    text(f"DELETE FROM {self._q('_load_row_hashes')} WHERE table_name = :t AND row_id IN ({in_sql})"),
+                    dict(params, t=table_name),
+                )
+                # 行重新出现时所在分块需要重新比对
+                conn.execute(
+                    text(f"DELETE FROM {self._q('_load_chunk_digests')} WHERE table_name = :t "
+                         f"AND last_id >= :lo AND first_id <= :hi"),
+                    {'t': table_name, 'lo': min(batch), 'hi': max(batch)},
+                )
+        return len(ids)
+
+    # ------------------------------------------------------------------
+    # 数据验证
+    # ------------------------------------------------------------------
+
+    def verify_data(self, mode='count', max_workers=4):
+        """
+        验证装载结果
+
+        mode='fast'     - 读取数据库统计信息中的行数估计值，返回 {表名: 行数}
+        mode='count'    - 并行统计精确行数，返回 {表名: 行数}
+        mode='checksum' - 按主键区间并行对比CSV与数据库的行数和校验和，返回 {表名: 对比结果}
+        """
+        verifier = DataVerifier(self.engine, self.data_dir, max_workers=max_workers)
+        return verifier.verify(mode)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 装载过程指标
+按表、按分块统计吞吐量、解析耗时、数据库等待耗时、重试次数和批次大小，
+并输出进度条、Prometheus文本文件和JSON装载报告
+"""
+
+import json
+import os
+import sys
+import time
+
+from tqdm import tqdm
+
+
+class TableMetrics:
+    """单张表的装载指标"""
+
+    def __init__(self, table_name, total_bytes=0):
+        self.table_name = table_name
+        self.total_bytes = total_bytes
+        self.started_at = time.time()
+        self.finished_at = None
+        self.rows = 0
+        self.bytes = 0
+        self.parse_seconds = 0.0
+        self.db_seconds = 0.0
+        self.retries = 0
+        self.batches = 0
+        self.last_batch_rows = 0
+        self.max_batch_rows = 0
+        self.chunks = []
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_sec(self):
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self):
+        busy = self.parse_seconds + self.db_seconds
+        return {
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+            'bytes_per_sec': round(self.bytes_per_sec, 1),
+            'parse_seconds': round(self.parse_seconds, 3),
+            'db_seconds': round(self.db_seconds, 3),
+            'db_wait_ratio': round(self.db_seconds / busy, 3) if busy else 0.0,
+            'retries': self.retries,
+            'batches': self.batches,
+            'max_batch_rows': self.max_batch_rows,
+            'chunks': self.chunks,
+        }
+
+
+class LoadMetrics:
+    """
+    装载指标收集器
+
+    progress      - 是否在终端显示进度条（默认仅在交互终端中显示）
+    textfile_path - Prometheus node_exporter textfile 采集目录下的 .prom 文件，装载期间定期重写
+    report_path   - 装载结束后写入的JSON报告
+    interval      - 重写 textfile 的最小间隔（秒）
+    """
+
+    def __init__(self, progress=None, textfile_path=None, report_path=None, interval=5.0):
+        self.progress = sys.stderr.isatty() if progress is None else progress
+        self.textfile_path = textfile_path
+        self.report_path = report_path
+        self.interval = interval
+        self.tables = {}
+        self.phases = {}
+        self._bar = None
+        self._last_write = 0.0
+
+    # ------------------------------------------------------------------
+    # 采集
+    # ------------------------------------------------------------------
+
+    def reset(self):
+        """清除上一次装载的指标"""
+        self.tables = {}
+        self.phases = {}
+
+    def start_table(self, table_name, total_bytes=0):
+        metrics = TableMetrics(table_name, total_bytes)
+        self.tables[table_name] = metrics
+        if self.progress:
+            self._bar = tqdm(total=total_bytes or None, desc=f"  {table_name}", unit='B',
+                             unit_scale=True, leave=False, file=sys.stderr)
+        return metrics
+
+    def record_batch(self, table_name, rows, seconds, retries=0):
+        """记录一次写入批次：行数、等待数据库的耗时、重试次数"""
+        metrics = self.tables[table_name]
+        metrics.batches += 1
+        metrics.db_seconds += seconds
+        metrics.retries += retries
+        metrics.last_batch_rows = rows
+        metrics.max_batch_rows = max(metrics.max_batch_rows, rows)
+
+    def record_chunk(self, table_name, chunk_no, rows, nbytes, parse_seconds, db_seconds):
+        """记录一个读取分块：行数、字节数、解析耗时、数据库耗时"""
+        metrics = self.tables[table_name]
+        metrics.rows += rows
+        metrics.bytes += nbytes
+        metrics.parse_seconds += parse_seconds
+        metrics.chunks.append({
+            'chunk': chunk_no,
+            'rows': rows,
+            'bytes': nbytes,
+            'parse_seconds': round(parse_seconds, 4),
+            'db_seconds': round(db_seconds, 4),
+        })
+        if self._bar is not None:
+            self._bar.update(nbytes)
+            self._bar.set_postfix_str(
+                f"{metrics.rows_per_sec:,.0f} 行/秒, 批次 {metrics.last_batch_rows} 行, "
+                f"等待数据库 {metrics.db_seconds / max(metrics.elapsed, 1e-9):.0%}"
+            )
+        self.maybe_write_textfile()
+
+    def finish_table(self, table_name):
+        metrics = self.tables.get(table_name)
+        if metrics is not None:
+            metrics.finished_at = time.time()
+        if self._bar is not None:
+            self._bar.close()
+            self._bar = None
+        self.maybe_write_textfile(force=True)
+
+    def record_phase(self, phase, seconds):
+        self.phases[phase] = seconds
+        self.maybe_write_textfile(force=True)
+
+    # ------------------------------------------------------------------
+    # 输出
+    # ------------------------------------------------------------------
+
+    def maybe_write_textfile(self, force=False):
+        if not self.textfile_path:
+            return
+        now = time.time()
+        if force or now - self._last_write >= self.interval:
+            self.write_textfile()
+            self._last_write = now
+
+    def render_prometheus(self):
+        """生成 Prometheus 文本格式的指标"""
+        lines = []
+
+        def metric(name, help_text, metric_type, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+
+        tables = list(self.tables.values())
+        metric('soil_loader_rows_total', 'Rows loaded per table.', 'counter',
+               [({'table': t.table_name}, t.rows) for t in tables])
+        metric('soil_loader_bytes_total', 'CSV bytes loaded per table.', 'counter',
+               [({'table': t.table_name}, t.bytes) for t in tables])
+        metric('soil_loader_parse_seconds_total', 'Seconds spent reading and parsing CSV.', 'counter',
+               [({'table': t.table_name}, round(t.parse_seconds, 4)) for t in tables])
+        metric('soil_loader_db_seconds_total', 'Seconds spent waiting on the database.', 'counter',
+               [({'table': t.table_name}, round(t.db_seconds, 4)) for t in tables])
+        metric('soil_loader_retries_total', 'Write batch retries per table.', 'counter',
+               [({'table': t.table_name}, t.retries) for t in tables])
+        metric('soil_loader_batches_total', 'Write batches per table.', 'counter',
+               [({'table': t.table_name}, t.batches) for t in tables])
+        metric('soil_loader_batch_rows', 'Rows in the most recent write batch.', 'gauge',
+               [({'table': t.table_name}, t.last_batch_rows) for t in tables])
+        metric('soil_loader_rows_per_second', 'Average load throughput per table.', 'gauge',
+               [({'table': t.table_name}, round(t.rows_per_sec, 1)) for t in tables])
+        metric('soil_loader_phase_seconds', 'Duration of each load phase.', 'gauge',
+               [({'phase': phase}, seconds) for phase, seconds in self.phases.items()])
+        metric('soil_loader_last_update_timestamp_seconds', 'Time the metrics were last written.', 'gauge',
+               [({}, round(time.time(), 3))])
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self):
+        """原子地重写 textfile，避免采集端读到写了一半的文件"""
+        tmp_path = f"{self.textfile_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, self.textfile_path)
+
+    def to_dict(self):
+        return {
+            'tables': {name: m.to_dict() for name, m in self.tables.items()},
+            'phases': dict(self.phases),
+        }
+
+    def write_report(self, load_report):
+        """写入最终的JSON装载报告"""
+        if not self.report_path:
+            return None
+        report = dict(load_report)
+        report['metrics'] = self.to_dict()
+        report['generated_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        return self.report_path
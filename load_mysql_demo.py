@@ -8,6 +8,9 @@ import os
 import sys
 import getpass
 from load_data_to_database import DatabaseLoader
+from load_metrics import LoadMetrics
+from schema_profiler import SchemaProfiler
+from staged_loader import StagedLoader
 
 def get_mysql_connection():
     """获取MySQL数据库连接信息"""
@@ -109,21 +112,57 @@ def main():
     try:
         # 创建装载器
         print("\n🔧 初始化数据库装载器...")
-        loader = DatabaseLoader(database_url, data_dir)
+        # 装载报告写入 load_report.json；设置 SOIL_LOADER_PROM_TEXTFILE 后同时输出Prometheus指标
+        metrics = LoadMetrics(report_path='load_report.json',
+                              textfile_path=os.environ.get('SOIL_LOADER_PROM_TEXTFILE'))
+        # 同时维护看板汇总表，看板统计只需读取汇总结果
+        loader = DatabaseLoader(database_url, data_dir, metrics=metrics, summaries=True)
         
-        # 询问是否重新创建表
-        recreate = input("是否重新创建所有表？(y/n): ").lower().strip()
-        if recreate in ['y', 'yes', '是']:
-            print("🗑️  删除现有表...")
-            loader.drop_all_tables()
+        # 询问装载模式：增量装载只写入变化的数据，无需删除重建
+        incremental = input("是否使用增量装载（仅写入新增和变化的数据）？(y/n): ").lower().strip() in ['y', 'yes', '是']
+        delete_missing = False
+        partition_by_month = False
+        staged = False
+        column_types = None
+        if incremental:
+            delete_missing = input("是否删除CSV中已不存在的记录？(y/n): ").lower().strip() in ['y', 'yes', '是']
+        else:
+            # 零停机装载：先装载到影子库并验证，再原子切换，装载期间看板不受影响
+            staged = input("是否零停机重新装载（装载到影子库，验证后原子切换）？(y/n): ").lower().strip() in ['y', 'yes', '是']
+            if not staged:
+                # 询问是否重新创建表
+                recreate = input("是否重新创建所有表？(y/n): ").lower().strip()
+                if recreate in ['y', 'yes', '是']:
+                    print("🗑️  删除现有表...")
+                    loader.drop_all_tables()
+            # 历史监测、操作日志、土壤样本按月分区，按日期窗口的查询只扫描相关分区
+            partition_by_month = input("是否将时间序列表按月分区？(y/n): ").lower().strip() in ['y', 'yes', '是']
+            # 按CSV实际取值收窄列类型（TINYINT、ENUM等），行越小缓冲池能缓存的数据越多
+            if input("是否根据数据分布使用紧凑列类型？(y/n): ").lower().strip() in ['y', 'yes', '是']:
+                print("🔎 分析CSV列取值...")
+                profiler = SchemaProfiler(data_dir)
+                profiler.profile()
+                column_types = profiler.compact_types()
+                print(f"  {sum(len(c) for c in column_types.values())} 列将使用更紧凑的类型")
         
-        # 创建表结构
-        print("🏗️  创建数据库表结构...")
-        loader.create_tables()
+        if staged:
+            print("📊 开始装载影子库...")
+            success = StagedLoader(database_url, data_dir, metrics=metrics, summaries=True).run(
+                batch_size=1000, partition_by_month=partition_by_month, column_types=column_types)
+        else:
+            # 创建表结构（新建的表先不建索引和外键，装载完成后再补建）
+            print("🏗️  创建数据库表结构...")
+            loader.create_tables(defer_indexes=True, partition_by_month=partition_by_month,
+                                 column_types=column_types)
+            
+            # 装载数据
+            print("📊 开始装载数据...")
+            success = loader.load_all_tables(batch_size=1000, incremental=incremental, delete_missing=delete_missing)
         
-        # 装载数据
-        print("📊 开始装载数据...")
-        success = loader.load_all_tables(batch_size=1000)
+        # 预建未来三个月的分区，避免新数据写入时再拆分兜底分区
+        for table_name, months in loader.create_future_partitions(months_ahead=3).items():
+            if months:
+                print(f"📅 {table_name}: 预建分区 {', '.join(months)}")
         
         if success:
             print("\n✅ 数据装载完成！")
@@ -145,6 +184,18 @@ def main():
             print("-" * 50)
             print(f"{'总计':<30}: {total_records:>10,} 条")
             
+            # 可选：逐行对比CSV与数据库内容
+            deep_check = input("\n是否校验数据内容（按主键区间对比校验和，较慢）？(y/n): ").lower().strip()
+            if deep_check in ['y', 'yes', '是']:
+                print("🔍 计算校验和...")
+                checksums = loader.verify_data(mode='checksum')
+                for table_name, result in checksums.items():
+                    status = "✅" if result['ok'] else "❌"
+                    print(f"{status} {table_name:<28}: CSV {result['csv_rows']:>10,} 条 / "
+                          f"数据库 {result['db_rows']:>10,} 条  校验和 {result['db_checksum']}")
+                    for lo, hi in result['mismatched_ranges']:
+                        print(f"     ⚠️  主键区间 {lo}-{hi} 内容不一致")
+            
             print(f"\n🎉 数据已成功装载到MySQL数据库!")
             print(f"📊 数据库: {connection_info['database']}")
             
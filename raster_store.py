@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 分块栅格存储
+保存插值、汇总得到的全国尺度格网（多个指标 × 多个日期），数据按块压缩存放在目录中，
+读取时只解压与请求范围相交的块，整幅栅格不需要放进内存。
+
+目录结构（与Zarr类似）:
+    raster.json                               - 地理参考（EPSG:4326，左上角和格子大小）、尺寸、块大小、数据类型、
+                                                空值、指标列表、金字塔层数
+    <指标>/<日期>/<层级>/<块行>.<块列>.z        - 一个块：chunk×chunk 的小端数组，zlib压缩；边缘块补齐到完整大小，
+                                                不存在的块全部为空值
+
+    - 写入按块进行：覆盖整块时直接写，部分覆盖时加文件锁读出、合并后再写；每个块先写临时文件再替换，
+      多个进程可以同时写不同的窗口
+    - 第1层起为金字塔（概览）层，每层由上一层 2×2 个格子取非空均值得到，用于小比例尺显示
+    - 按经纬度范围读取窗口时可以指定最大尺寸，自动选择满足尺寸的最精细层级
+    - 可导出为分块、Deflate压缩、带内部概览的GeoTIFF（块数据直接复用），GIS软件可以直接打开
+
+用法:
+    python raster_store.py --store rasters/soil --info
+    python raster_store.py --store rasters/soil --overviews ph_value --date 2025-06
+    python raster_store.py --store rasters/soil --read ph_value --bbox 30 103 31 104
+    python raster_store.py --store rasters/soil --export ph_value --date 2025-06 --output ph_2025-06.tif
+"""
+
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，部分块写入不加锁
+    fcntl = None
+
+RASTER_VERSION = 1
+METADATA_FILE = 'raster.json'
+DEFAULT_CHUNK = 256
+DEFAULT_DATE = 'default'
+COMPRESSION_LEVEL = 6
+
+
+def _nodata_value(dtype, nodata):
+    return np.nan if nodata is None and np.dtype(dtype).kind == 'f' else nodata
+
+
+def _mean_2x2(array, nodata):
+    """每 2×2 个格子取非空值的均值（奇数边补空值），全为空时结果为空值"""
+    height, width = array.shape
+    padded = np.full((height + height % 2, width + width % 2), np.nan)
+    padded[:height, :width] = array
+    if nodata is not None and not (isinstance(nodata, float) and math.isnan(nodata)):
+        padded[padded == nodata] = np.nan
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    valid = ~np.isnan(blocks)
+    count = valid.sum(axis=(1, 3))
+    total = np.where(valid, blocks, 0.0).sum(axis=(1, 3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+class RasterStore:
+    """
+    分块栅格目录
+
+    create()         - 新建存储（地理参考可直接使用 soil_interpolation.GridSpec.metadata()）
+    write_window()   - 写入某个指标、日期在第0层的一个像素窗口
+    read_window()    - 按像素窗口读取；read_bbox() 按经纬度范围读取
+    build_overviews()- 逐层生成金字塔
+    export_geotiff() - 导出为GeoTIFF
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, METADATA_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != RASTER_VERSION:
+            raise ValueError(f"{path} 的栅格版本 {self.meta.get('version')} 与当前版本 {RASTER_VERSION} 不一致")
+        self.chunk = self.meta['chunk']
+        self.dtype = np.dtype(self.meta['dtype']).newbyteorder('<')
+        self.nodata = _nodata_value(self.dtype, self.meta['nodata'])
+
+    @classmethod
+    def create(cls, path, georef, bands, chunk=DEFAULT_CHUNK, dtype='float32', nodata=None,
+               compression_level=COMPRESSION_LEVEL, overwrite=False):
+        """
+        新建存储；georef 包含 west, north, dlon, dlat, width, height（以及可选的 crs）。
+        已存在时 overwrite=False 直接打开（地理参考必须一致）
+        """
+        meta_path = os.path.join(path, METADATA_FILE)
+        if os.path.exists(meta_path) and not overwrite:
+            store = cls(path)
+            for key in ('west', 'north', 'dlon', 'dlat', 'width', 'height'):
+                if not math.isclose(store.meta[key], georef[key]):
+                    raise ValueError(f"{path} 已存在且 {key} 不一致")
+            return store
+        if chunk % 16:
+            raise ValueError("块大小必须是16的倍数（GeoTIFF分块的要求）")
+        levels = 1
+        while max(georef['width'], georef['height']) > chunk << (levels - 1):
+            levels += 1
+        meta = {
+            'version': RASTER_VERSION,
+            'crs': georef.get('crs', 'EPSG:4326'),
+            'west': georef['west'],
+            'north': georef['north'],
+            'dlon': georef['dlon'],
+            'dlat': georef['dlat'],
+            'width': georef['width'],
+            'height': georef['height'],
+            'chunk': chunk,
+            'dtype': np.dtype(dtype).newbyteorder('<').str,
+            'nodata': nodata,
+            'compression': 'zlib',
+            'compression_level': compression_level,
+            'levels': levels,
+            'bands': list(bands),
+        }
+        os.makedirs(path, exist_ok=True)
+        temp_path = f"{meta_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, meta_path)
+        return cls(path)
+
+    # ------------------------------------------------------------------
+    # 几何
+    # ------------------------------------------------------------------
+
+    @property
+    def levels(self):
+        return self.meta['levels']
+
+    def level_shape(self, level=0):
+        """某层的 (高, 宽)"""
+        return -(-self.meta['height'] // (1 << level)), -(-self.meta['width'] // (1 << level))
+
+    def level_georef(self, level=0):
+        """某层的 (west, north, dlon, dlat)"""
+        scale = 1 << level
+        return self.meta['west'], self.meta['north'], self.meta['dlon'] * scale, self.meta['dlat'] * scale
+
+    def chunk_grid(self, level=0):
+        """某层的 (块行数, 块列数)"""
+        height, width = self.level_shape(level)
+        return -(-height // self.chunk), -(-width // self.chunk)
+
+    def bbox_window(self, min_lat, min_lon, max_lat, max_lon, level=0):
+        """经纬度范围对应的像素窗口 (row0, row1, col0, col1)，已裁剪到栅格范围内"""
+        west, north, dlon, dlat = self.level_georef(level)
+        height, width = self.level_shape(level)
+        row0 = int(np.clip(math.floor((north - max_lat) / dlat), 0, height))
+        row1 = int(np.clip(math.ceil((north - min_lat) / dlat), 0, height))
+        col0 = int(np.clip(math.floor((min_lon - west) / dlon), 0, width))
+        col1 = int(np.clip(math.ceil((max_lon - west) / dlon), 0, width))
+        return row0, row1, col0, col1
+
+    # ------------------------------------------------------------------
+    # 块读写
+    # ------------------------------------------------------------------
+
+    def _chunk_dir(self, band, date, level):
+        return os.path.join(self.path, band, date or DEFAULT_DATE, str(level))
+
+    def chunk_path(self, band, date, level, row, col):
+        return os.path.join(self._chunk_dir(band, date, level), f"{row}.{col}.z")
+
+    def _empty_chunk(self):
+        return np.full((self.chunk, self.chunk), self.nodata, dtype=self.dtype)
+
+    def read_chunk_bytes(self, band, date, level, row, col):
+        """块的压缩数据，块不存在时返回 None"""
+        try:
+            with open(self.chunk_path(band, date, level, row, col), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def read_chunk(self, band, date, level, row, col):
+        data = self.read_chunk_bytes(band, date, level, row, col)
+        if data is None:
+            return self._empty_chunk()
+        return np.frombuffer(zlib.decompress(data), dtype=self.dtype).reshape(self.chunk, self.chunk)
+
+    def write_chunk(self, band, date, level, row, col, array):
+        """写入一个完整的块（临时文件 + 替换，读取方不会读到写了一半的块）"""
+        if band not in self.meta['bands']:
+            raise KeyError(f"未定义的指标: {band}")
+        path = self.chunk_path(band, date, level, row, col)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(np.ascontiguousarray(array, dtype=self.dtype).tobytes(), self.meta['compression_level'])
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    @contextmanager
+    def _chunk_lock(self, band, date, level, row, col):
+        """部分写入一个块时的进程间排他锁"""
+        if fcntl is None:
+            yield
+            return
+        path = self.chunk_path(band, date, level, row, col) + '.lock'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ------------------------------------------------------------------
+    # 窗口读写
+    # ------------------------------------------------------------------
+
+    def write_window(self, band, date, row0, col0, array, level=0):
+        """把二维数组写到 (row0, col0) 开始的窗口；与块对齐的部分整块写入，其余按块合并"""
+        array = np.asarray(array)
+        height, width = self.level_shape(level)
+        row1, col1 = min(row0 + array.shape[0], height), min(col0 + array.shape[1], width)
+        size = self.chunk
+        for chunk_row in range(row0 // size, -(-row1 // size)):
+            for chunk_col in range(col0 // size, -(-col1 // size)):
+                # 块在栅格内的范围，以及与窗口相交的部分
+                top, left = chunk_row * size, chunk_col * size
+                bottom, right = min(top + size, height), min(left + size, width)
+                r0, r1 = max(top, row0), min(bottom, row1)
+                c0, c1 = max(left, col0), min(right, col1)
+                piece = array[r0 - row0:r1 - row0, c0 - col0:c1 - col0]
+                if (r0, r1, c0, c1) == (top, bottom, left, right):
+                    chunk = self._empty_chunk()
+                    chunk[:r1 - r0, :c1 - c0] = piece
+                    self.write_chunk(band, date, level, chunk_row, chunk_col, chunk)
+                    continue
+                with self._chunk_lock(band, date, level, chunk_row, chunk_col):
+                    chunk = self.read_chunk(band, date, level, chunk_row, chunk_col).copy()
+                    chunk[r0 - top:r1 - top, c0 - left:c1 - left] = piece
+                    self.write_chunk(band, date, level, chunk_row, chunk_col, chunk)
+
+    def read_window(self, band, date, row0, row1, col0, col1, level=0):
+        """按像素窗口读取，窗口超出栅格的部分为空值"""
+        result = np.full((max(row1 - row0, 0), max(col1 - col0, 0)), self.nodata, dtype=self.dtype)
+        height, width = self.level_shape(level)
+        r_lo, r_hi = max(row0, 0), min(row1, height)
+        c_lo, c_hi = max(col0, 0), min(col1, width)
+        size = self.chunk
+        for chunk_row in range(r_lo // size, -(-r_hi // size)):
+            for chunk_col in range(c_lo // size, -(-c_hi // size)):
+                top, left = chunk_row * size, chunk_col * size
+                r0, r1 = max(top, r_lo), min(top + size, r_hi)
+                c0, c1 = max(left, c_lo), min(left + size, c_hi)
+                if r0 >= r1 or c0 >= c1:
+                    continue
+                chunk = self.read_chunk(band, date, level, chunk_row, chunk_col)
+                result[r0 - row0:r1 - row0, c0 - col0:c1 - col0] = chunk[r0 - top:r1 - top, c0 - left:c1 - left]
+        return result
+
+    def read_bbox(self, band, date, min_lat, min_lon, max_lat, max_lon, level=None, max_size=None):
+        """
+        按经纬度范围读取，返回 (数组, 窗口地理参考)。
+        level 为空时选择窗口宽高都不超过 max_size 的最精细层级（max_size 也为空时取第0层）
+        """
+        if level is None:
+            level = 0
+            while max_size and level < self.levels - 1:
+                row0, row1, col0, col1 = self.bbox_window(min_lat, min_lon, max_lat, max_lon, level)
+                if max(row1 - row0, col1 - col0) <= max_size:
+                    break
+                level += 1
+        row0, row1, col0, col1 = self.bbox_window(min_lat, min_lon, max_lat, max_lon, level)
+        west, north, dlon, dlat = self.level_georef(level)
+        georef = {'level': level, 'west': west + col0 * dlon, 'north': north - row0 * dlat,
+                  'dlon': dlon, 'dlat': dlat, 'width': col1 - col0, 'height': row1 - row0}
+        return self.read_window(band, date, row0, row1, col0, col1, level), georef
+
+    def dates(self, band):
+        """某个指标已写入的日期"""
+        directory = os.path.join(self.path, band)
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    # ------------------------------------------------------------------
+    # 金字塔
+    # ------------------------------------------------------------------
+
+    def build_overviews(self, band, date=None):
+        """由第0层逐层生成金字塔：每个输出块读取上一层对应的 2×2 个块"""
+        size = self.chunk
+        for level in range(1, self.levels):
+            chunk_rows, chunk_cols = self.chunk_grid(level)
+            height, width = self.level_shape(level)
+            for chunk_row in range(chunk_rows):
+                for chunk_col in range(chunk_cols):
+                    top, left = chunk_row * size, chunk_col * size
+                    source = self.read_window(band, date, top * 2, min(top + size, height) * 2,
+                                              left * 2, min(left + size, width) * 2, level - 1)
+                    if np.dtype(self.dtype).kind == 'f' and np.isnan(source).all():
+                        continue
+                    reduced = _mean_2x2(source.astype(np.float64), self.nodata)
+                    if np.dtype(self.dtype).kind != 'f':
+                        reduced = np.where(np.isnan(reduced), self.nodata, np.round(reduced))
+                    chunk = self._empty_chunk()
+                    chunk[:reduced.shape[0], :reduced.shape[1]] = reduced
+                    self.write_chunk(band, date, level, chunk_row, chunk_col, chunk)
+
+    # ------------------------------------------------------------------
+    # GeoTIFF导出
+    # ------------------------------------------------------------------
+
+    def export_geotiff(self, band, date, path, overviews=True):
+        """
+        导出为分块GeoTIFF：Deflate压缩的块直接复用存储中的数据，第1层起作为内部概览（需先 build_overviews）。
+        文件超过4GB时使用BigTIFF
+        """
+        levels = list(range(self.levels if overviews else 1))
+        empty = zlib.compress(self._empty_chunk().tobytes(), self.meta['compression_level'])
+        tiles = {level: [self.read_chunk_bytes(band, date, level, r, c)
+                         for r in range(self.chunk_grid(level)[0]) for c in range(self.chunk_grid(level)[1])]
+                 for level in levels}
+        payload = len(empty) + sum(len(t) for level_tiles in tiles.values() for t in level_tiles if t)
+        writer = _TiffWriter(path, bigtiff=payload > 0xF0000000)
+        try:
+            empty_offset = writer.append(empty)
+            ifds = []
+            for level in levels:
+                offsets, counts = [], []
+                for data in tiles[level]:
+                    if data is None:
+                        offsets.append(empty_offset)
+                        counts.append(len(empty))
+                    else:
+                        offsets.append(writer.append(data))
+                        counts.append(len(data))
+                ifds.append(self._tiff_tags(level, offsets, counts))
+            writer.write_ifds(ifds)
+        finally:
+            writer.close()
+
+    def _tiff_tags(self, level, offsets, counts):
+        height, width = self.level_shape(level)
+        kind = np.dtype(self.dtype).kind
+        tags = [
+            (254, 'LONG', [1 if level else 0]),                 # NewSubfileType：概览层为缩小的图像
+            (256, 'LONG', [width]),
+            (257, 'LONG', [height]),
+            (258, 'SHORT', [self.dtype.itemsize * 8]),
+            (259, 'SHORT', [8]),                                # Deflate（zlib）
+            (262, 'SHORT', [1]),                                # BlackIsZero
+            (277, 'SHORT', [1]),
+            (284, 'SHORT', [1]),
+            (322, 'LONG', [self.chunk]),
+            (323, 'LONG', [self.chunk]),
+            (324, 'OFFSET', offsets),
+            (325, 'OFFSET', counts),
+            (339, 'SHORT', [3 if kind == 'f' else 2 if kind == 'i' else 1]),
+        ]
+        if level == 0:
+            west, north, dlon, dlat = self.level_georef(0)
+            epsg = int(self.meta['crs'].split(':')[-1])
+            tags += [
+                (33550, 'DOUBLE', [dlon, dlat, 0.0]),           # ModelPixelScale
+                (33922, 'DOUBLE', [0.0, 0.0, 0.0, west, north, 0.0]),  # ModelTiepoint：左上角
+                # GeoKeyDirectory：地理坐标系、像素表示面积、EPSG代码
+                (34735, 'SHORT', [1, 1, 0, 3, 1024, 0, 1, 2, 1025, 0, 1, 1, 2048, 0, 1, epsg]),
+            ]
+        nodata = 'nan' if self.nodata is None or (isinstance(self.nodata, float) and math.isnan(self.nodata)) \
+            else str(self.nodata)
+        tags.append((42113, 'ASCII', nodata))                   # GDAL_NODATA
+        return tags
+
+
+class _TiffWriter:
+    """按顺序追加块数据，最后写出各IFD（小端，经典TIFF或BigTIFF）"""
+
+    TYPES = {'SHORT': (3, 'H'), 'LONG': (4, 'I'), 'DOUBLE': (12, 'd'), 'ASCII': (2, 's'), 'LONG8': (16, 'Q')}
+
+    def __init__(self, path, bigtiff=False):
+        self.path = path
+        self.bigtiff = bigtiff
+        self.temp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.f = open(self.temp_path, 'wb')
+        header = b'II' + (struct.pack('<HHHQ', 43, 8, 0, 0) if bigtiff else struct.pack('<HI', 42, 0))
+        self.f.write(header)
+        self.done = False
+
+    def append(self, data):
+        offset = self.f.tell()
+        self.f.write(data)
+        if self.f.tell() % 2:
+            self.f.write(b'\0')
+        return offset
+
+    def _entry_value(self, type_name, values):
+        if type_name == 'OFFSET':
+            type_name = 'LONG8' if self.bigtiff else 'LONG'
+        code, fmt = self.TYPES[type_name]
+        if type_name == 'ASCII':
+            data = values.encode('ascii') + b'\0'
+            return code, len(data), data
+        return code, len(values), struct.pack(f"<{len(values)}{fmt}", *values)
+
+    def write_ifds(self, ifds):
+        inline = 8 if self.bigtiff else 4
+        entry_fmt, count_fmt, next_fmt = ('<HHQ', '<Q', '<Q') if self.bigtiff else ('<HHI', '<H', '<I')
+        previous_next = 8 if self.bigtiff else 4         # 头部中第一个IFD偏移的位置
+        for tags in ifds:
+            # 超过内联长度的值先写在IFD之前
+            entries = []
+            for tag, type_name, values in sorted(tags, key=lambda t: t[0]):
+                code, count, data = self._entry_value(type_name, values)
+                if len(data) > inline:
+                    entries.append((tag, code, count, struct.pack('<Q' if self.bigtiff else '<I', self.append(data))))
+                else:
+                    entries.append((tag, code, count, data.ljust(inline, b'\0')))
+            ifd_offset = self.append(b'')
+            self.f.write(struct.pack(count_fmt, len(entries)))
+            for tag, code, count, value in entries:
+                self.f.write(struct.pack(entry_fmt, tag, code, count) + value)
+            next_position = self.f.tell()
+            self.f.write(struct.pack(next_fmt, 0))
+            # 回填上一个IFD（或头部）指向本IFD的偏移
+            end = self.f.tell()
+            self.f.seek(previous_next)
+            self.f.write(struct.pack(next_fmt, ifd_offset))
+            self.f.seek(end)
+            previous_next = next_position
+        self.done = True
+
+    def close(self):
+        self.f.close()
+        if self.done:
+            os.replace(self.temp_path, self.path)
+        else:
+            os.remove(self.temp_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分块栅格存储：查看、生成金字塔、窗口读取、导出GeoTIFF")
+    parser.add_argument('--store', required=True, help="栅格目录")
+    parser.add_argument('--info', action='store_true', help="显示地理参考、指标和日期")
+    parser.add_argument('--overviews', metavar='BAND', help="为该指标生成金字塔")
+    parser.add_argument('--read', metavar='BAND', help="按 --bbox 读取该指标")
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('MIN_LAT', 'MIN_LON', 'MAX_LAT', 'MAX_LON'))
+    parser.add_argument('--max-size', type=int, help="读取窗口的最大宽高（自动选择金字塔层级）")
+    parser.add_argument('--export', metavar='BAND', help="把该指标导出为GeoTIFF")
+    parser.add_argument('--date', help="日期（不指定时为 default）")
+    parser.add_argument('--output', help="GeoTIFF文件路径")
+    args = parser.parse_args()
+
+    store = RasterStore(args.store)
+    meta = store.meta
+    if args.info:
+        print(f"🗺️  {meta['width']}×{meta['height']} 格，左上角 ({meta['north']:.4f}, {meta['west']:.4f})，"
+              f"格子 {meta['dlon']:.6f}°×{meta['dlat']:.6f}°，块 {meta['chunk']}，{meta['levels']} 层")
+        for band in meta['bands']:
+            print(f"    {band:<22} 日期: {', '.join(store.dates(band)) or '无'}")
+    if args.overviews:
+        start = time.time()
+        store.build_overviews(args.overviews, args.date)
+        print(f"🔺 {args.overviews} 金字塔已生成（{store.levels - 1} 层），耗时 {time.time() - start:.2f}s")
+    if args.read:
+        if not args.bbox:
+            parser.error("--read 需要 --bbox")
+        start = time.time()
+        array, georef = store.read_bbox(args.read, args.date, *args.bbox, max_size=args.max_size)
+        elapsed = (time.time() - start) * 1000
+        valid = array[~np.isnan(array)] if array.dtype.kind == 'f' else array
+        print(f"📖 第 {georef['level']} 层窗口 {georef['width']}×{georef['height']}，耗时 {elapsed:.1f}ms，"
+              + (f"平均 {valid.mean():.3f}" if len(valid) else "无数据"))
+    if args.export:
+        output = args.output or f"{args.export}_{args.date or DEFAULT_DATE}.tif"
+        start = time.time()
+        store.export_geotiff(args.export, args.date, output)
+        print(f"💾 已导出 {output}（{os.path.getsize(output) / 1024 / 1024:.1f}MB），耗时 {time.time() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 样本坐标与所属地区核对
+生成的样本坐标在所属地区中心点 ±2°、监测站点在 ±1° 范围内随机分布，region_id 与坐标经常不符，
+按省份的统计因此出现偏差。本程序对 soil_samples、monitoring_stations 的每个点找出
+最近的省级、市级、县级地区中心点（regions 表中 level 为 1/2/3 的经纬度），报告不一致的记录，
+并可以把 region_id 改为与原地区同一层级的最近地区（或指定层级）。
+
+最近中心点的查询（精确、向量化）:
+    - 点和中心点都换算为单位球面上的三维向量，球面距离最近即点积最大
+    - 点的范围划分为规则格子（默认0.5°），每个有点的格子预先计算候选中心点：
+      设格子中心到最近中心点的距离为 d，格子中心到格子内任一点的最大距离为 r，
+      则格子内任一点的最近中心点一定在格子中心 d+2r 范围内（三角不等式），候选之外的中心点不必计算
+    - 点按格子排序后连续存放（省、市、县三个层级共用），每个格子的点与其候选做一次矩阵乘法取最大值
+
+用法:
+    python region_reconcile.py --url sqlite:///soil_data.db
+    python region_reconcile.py --url ... --tables soil_samples --output mismatches.csv
+    python region_reconcile.py --url ... --apply                 # 把 region_id 改为同一层级的最近地区
+    python region_reconcile.py --url ... --apply --level 3       # 全部改为最近的县级地区
+    python region_reconcile.py --data-dir data                   # 只读CSV核对，不修改
+    python region_reconcile.py --data-dir data --synthetic 10000000   # 随机点测试耗时
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from spatial_index import EARTH_RADIUS_KM, haversine_km
+
+RECONCILE_TABLES = ('soil_samples', 'monitoring_stations')
+REGION_LEVELS = {1: '省级', 2: '市级', 3: '县级'}
+CELL_DEGREES = 0.5
+# 规则格子总数上限，点的范围过大时自动加大格子
+MAX_CELLS = 1_000_000
+# 批量改写 region_id 时每条 UPDATE 的id个数
+UPDATE_CHUNK = 5000
+
+
+def _unit_vectors(lats, lons):
+    lat, lon = np.radians(lats), np.radians(lons)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+class PointCells:
+    """
+    一批点按规则格子分组：点按格子编号排序后连续存放，各层级的最近地区查询共用同一分组
+
+    positions[i]                 - 排序后第i个点在原数组中的下标（不含坐标为空的点）
+    bounds[j]:bounds[j+1]        - 第j个有点的格子在排序后数组中的区间
+    cell_lats, cell_lons         - 各格子中心坐标
+    """
+
+    def __init__(self, lats, lons, cell_degrees=CELL_DEGREES):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        self.count = len(lats)
+        self.size = cell_degrees
+        valid = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+        if not len(valid):
+            self.positions = valid
+            self.bounds = np.zeros(1, dtype=np.int64)
+            self.cell_lats = self.cell_lons = np.empty(0)
+            self.vectors = np.empty((0, 3))
+            return
+        lats, lons = lats[valid], lons[valid]
+        min_lat, min_lon = lats.min(), lons.min()
+        while ((lats.max() - min_lat) / self.size + 1) * ((lons.max() - min_lon) / self.size + 1) > MAX_CELLS:
+            self.size *= 2
+        cols = ((lons - min_lon) // self.size).astype(np.int64)
+        num_cols = int(cols.max()) + 1
+        cells = (((lats - min_lat) // self.size).astype(np.int64) * num_cols + cols).astype(np.int32)
+        # 格子内点的先后顺序不影响结果，用较快的非稳定排序
+        order = np.argsort(cells)
+        cells = cells[order]
+        starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+        occupied = cells[starts]
+        self.positions = valid[order]
+        self.bounds = np.r_[starts, len(cells)]
+        self.cell_lats = min_lat + (occupied // num_cols + 0.5) * self.size
+        self.cell_lons = min_lon + (occupied % num_cols + 0.5) * self.size
+        self.vectors = _unit_vectors(lats[order], lons[order])
+
+    def __len__(self):
+        return len(self.cell_lats)
+
+
+class CentroidLocator:
+    """
+    一组中心点（同一层级的地区）上的精确最近邻查询。
+    点和中心点都是单位向量，球面距离最近即点积最大；每个格子只与候选中心点计算点积
+    """
+
+    def __init__(self, lats, lons):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.vectors = _unit_vectors(self.lats, self.lons)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _cell_candidates(self, cell_lats, cell_lons, size):
+        """
+        各格子的候选中心点下标：格子中心到最近中心点的距离为 d、到格子内任一点的最大距离为 r 时，
+        格子内任一点的最近中心点都在格子中心 d+2r 范围内（三角不等式）
+        """
+        distances = haversine_km(cell_lats[:, None], cell_lons[:, None], self.lats[None, :], self.lons[None, :])
+        # 格子中心到四角和四边中点的最大距离，略放大以抵消浮点误差
+        half = size / 2
+        radius = np.zeros(len(cell_lats))
+        for dlat, dlon in ((-half, -half), (-half, half), (half, -half), (half, half),
+                           (0, -half), (0, half), (-half, 0), (half, 0)):
+            radius = np.maximum(radius, haversine_km(cell_lats, cell_lons, cell_lats + dlat, cell_lons + dlon))
+        limit = distances.min(axis=1) + 2 * (radius * 1.001 + 1e-6)
+        return [np.flatnonzero(row <= bound) for row, bound in zip(distances, limit)]
+
+    def nearest(self, cells):
+        """PointCells 中每个点最近的中心点下标和距离（公里），坐标为空的点为 -1 和 NaN"""
+        index = np.full(cells.count, -1, dtype=np.int64)
+        distances = np.full(cells.count, np.nan)
+        if not len(cells) or not len(self):
+            return index, distances
+        best = np.empty(len(cells.positions), dtype=np.int64)
+        best_dot = np.empty(len(cells.positions))
+        candidates = self._cell_candidates(cells.cell_lats, cells.cell_lons, cells.size)
+        for cell, found in enumerate(candidates):
+            lo, hi = cells.bounds[cell], cells.bounds[cell + 1]
+            dots = cells.vectors[lo:hi] @ self.vectors[found].T
+            pick = dots.argmax(axis=1)
+            best[lo:hi] = found[pick]
+            best_dot[lo:hi] = dots[np.arange(hi - lo), pick]
+        index[cells.positions] = best
+        # 弦长换算为球面距离
+        chord = np.sqrt(np.maximum(2.0 - 2.0 * best_dot, 0.0))
+        distances[cells.positions] = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+        return index, distances
+
+
+class RegionLocator:
+    """
+    regions 表各层级中心点的最近地区查询
+
+    locate()   - 每个点在各层级的最近地区id及距离
+    lookup()   - 按地区id取层级、省份编码、坐标
+    """
+
+    def __init__(self, ids, levels, provinces, lats, lons, cell_degrees=CELL_DEGREES):
+        ids = np.asarray(ids, dtype=np.int64)
+        levels = np.asarray(levels, dtype=np.int64)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        self.cell_degrees = cell_degrees
+        # 省份名称编码为整数，province_names[编码] 为名称
+        self.province_names, province_codes = np.unique(np.asarray(provinces, dtype=str), return_inverse=True)
+        # 按id排序保存各地区的属性，lookup() 用二分查找按id取值
+        order = np.argsort(ids, kind='stable')
+        self.ids = ids[order]
+        self.level_of = levels[order]
+        self.province_of = province_codes.astype(np.int64)[order]
+        self.lats_of = lats[order]
+        self.lons_of = lons[order]
+        # id较紧凑时（通常为自增id）用 id -> 下标 的稠密数组代替二分查找
+        self.dense = None
+        if len(ids) and 0 <= self.ids[0] and self.ids[-1] <= 16 * len(ids) + 1024:
+            self.dense = np.full(int(self.ids[-1]) + 1, -1, dtype=np.int64)
+            self.dense[self.ids] = np.arange(len(ids))
+        # 每个层级只包含有坐标的地区
+        self.levels = {}
+        for level in REGION_LEVELS:
+            keep = (levels == level) & ~(np.isnan(lats) | np.isnan(lons))
+            if keep.any():
+                self.levels[level] = (ids[keep], CentroidLocator(lats[keep], lons[keep]))
+
+    @classmethod
+    def from_database(cls, engine, cell_degrees=CELL_DEGREES):
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT id, level, province, latitude, longitude FROM regions")).fetchall()
+        return cls([r[0] for r in rows], [r[1] or 0 for r in rows], [r[2] or '' for r in rows],
+                   [np.nan if r[3] is None else float(r[3]) for r in rows],
+                   [np.nan if r[4] is None else float(r[4]) for r in rows], cell_degrees)
+
+    @classmethod
+    def from_table(cls, table, cell_degrees=CELL_DEGREES):
+        """由 column_store.ColumnTable（CSV或快照中的 regions 表）构建"""
+        columns = table.columns
+        province = columns['province']
+        return cls(columns['id'], np.nan_to_num(np.asarray(columns['level'], dtype=np.float64)).astype(np.int64),
+                   province.decode() if hasattr(province, 'decode') else province,
+                   columns['latitude'], columns['longitude'], cell_degrees)
+
+    def locate(self, lats, lons):
+        """返回 {层级: (最近地区id数组, 距离数组（公里）)}，坐标为空的点id为 -1、距离为NaN"""
+        cells = PointCells(lats, lons, self.cell_degrees)
+        located = {}
+        for level, (ids, locator) in self.levels.items():
+            nearest, distances = locator.nearest(cells)
+            located[level] = (np.where(nearest >= 0, ids[np.maximum(nearest, 0)], -1), distances)
+        return located
+
+    def lookup(self, values, region_ids, default):
+        """按地区id取属性（level_of、province_of、lats_of、lons_of 之一），未知id为 default"""
+        region_ids = np.asarray(region_ids, dtype=np.int64)
+        if self.dense is not None:
+            inside = (region_ids >= 0) & (region_ids < len(self.dense))
+            positions = np.where(inside, self.dense[np.where(inside, region_ids, 0)], -1)
+            found = positions >= 0
+        else:
+            positions = np.minimum(np.searchsorted(self.ids, region_ids), len(self.ids) - 1)
+            found = self.ids[positions] == region_ids
+        result = np.full(len(region_ids), default, dtype=values.dtype)
+        result[found] = values[positions[found]]
+        return result
+
+
+class RegionReconciler:
+    """
+    核对一张表中各点的 region_id 与坐标
+
+    reconcile()  - 计算每个点的最近地区和不一致标记
+    report()     - 汇总不一致情况
+    apply()      - 把不一致记录的 region_id 改为目标层级的最近地区
+    """
+
+    def __init__(self, locator):
+        self.locator = locator
+
+    def reconcile(self, ids, region_ids, lats, lons, level=None):
+        """
+        level 为空时每个点与原地区同一层级比较，否则与指定层级比较；
+        返回 ids, recorded, target, distance_recorded, distance_target, mismatch,
+        recorded_province, nearest_province（省份编码）, province_mismatch 等数组
+        """
+        locator = self.locator
+        ids = np.asarray(ids, dtype=np.int64)
+        recorded = np.nan_to_num(np.asarray(region_ids, dtype=np.float64), nan=-1).astype(np.int64)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        located = locator.locate(lats, lons)
+
+        recorded_level = locator.lookup(locator.level_of, recorded, 0)
+        target_level = recorded_level if level is None else np.full(len(ids), level)
+        target = np.full(len(ids), -1, dtype=np.int64)
+        distance_target = np.full(len(ids), np.nan)
+        for lvl, (nearest, distances) in located.items():
+            rows = target_level == lvl
+            target[rows] = nearest[rows]
+            distance_target[rows] = distances[rows]
+        distance_recorded = haversine_km(lats, lons, locator.lookup(locator.lats_of, recorded, np.nan),
+                                         locator.lookup(locator.lons_of, recorded, np.nan))
+
+        recorded_province = locator.lookup(locator.province_of, recorded, -1)
+        nearest_province = (locator.lookup(locator.province_of, located[1][0], -1) if 1 in located
+                            else recorded_province)
+        has_target = target >= 0
+        return {
+            'ids': ids,
+            'recorded': recorded,
+            'recorded_level': recorded_level,
+            'target': target,
+            'distance_recorded': distance_recorded,
+            'distance_target': distance_target,
+            'mismatch': has_target & (target != recorded),
+            'recorded_province': recorded_province,
+            'nearest_province': nearest_province,
+            'province_mismatch': has_target & (nearest_province >= 0) & (recorded_province != nearest_province),
+        }
+
+    def _province_name(self, code):
+        return str(self.locator.province_names[code]) if code >= 0 else ''
+
+    def report(self, result, top=10):
+        """不一致记录的数量、各层级分布、距离变化和最常见的省份变化"""
+        mismatch = result['mismatch']
+        total = len(mismatch)
+        levels = {}
+        for level, name in REGION_LEVELS.items():
+            rows = result['recorded_level'] == level
+            levels[name] = {'points': int(rows.sum()), 'mismatches': int((mismatch & rows).sum())}
+        province_rows = result['province_mismatch']
+        # 省份变化按 (原省份, 最近省份) 编码对计数；原地区未知时编码为 -1，计数时移到最后一位
+        num = len(self.locator.province_names) + 1
+        pair_codes = (result['recorded_province'][province_rows] % num) * num \
+            + result['nearest_province'][province_rows] % num
+        counts = np.bincount(pair_codes, minlength=num * num)
+        pairs = {}
+        for code in np.argsort(-counts, kind='stable')[:top]:
+            if counts[code]:
+                before, after = divmod(int(code), num)
+                key = f"{self._province_name(before if before < num - 1 else -1)}→{self._province_name(after)}"
+                pairs[key] = int(counts[code])
+        moved = mismatch & ~np.isnan(result['distance_recorded'])
+        return {
+            'points': total,
+            'mismatches': int(mismatch.sum()),
+            'mismatch_rate': float(mismatch.mean()) if total else 0.0,
+            'province_mismatches': int(province_rows.sum()),
+            'levels': levels,
+            'median_distance_recorded_km': float(np.median(result['distance_recorded'][moved])) if moved.any() else None,
+            'median_distance_nearest_km': float(np.median(result['distance_target'][moved])) if moved.any() else None,
+            'province_changes': pairs,
+        }
+
+    def write_mismatches(self, path, result):
+        """把不一致的记录写成CSV"""
+        rows = np.flatnonzero(result['mismatch'])
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'region_id', 'nearest_region_id', 'distance_recorded_km', 'distance_nearest_km',
+                             'recorded_province', 'nearest_province'])
+            for i in rows.tolist():
+                writer.writerow([result['ids'][i], result['recorded'][i], result['target'][i],
+                                 round(float(result['distance_recorded'][i]), 3),
+                                 round(float(result['distance_target'][i]), 3),
+                                 self._province_name(result['recorded_province'][i]),
+                                 self._province_name(result['nearest_province'][i])])
+        return len(rows)
+
+    @staticmethod
+    def apply(engine, table_name, result):
+        """把不一致记录的 region_id 改为最近地区；按目标地区分组，每条 UPDATE 更新一批id，返回更新行数"""
+        q = engine.dialect.identifier_preparer.quote
+        rows = np.flatnonzero(result['mismatch'])
+        targets = result['target'][rows]
+        ids = result['ids'][rows]
+        order = np.argsort(targets, kind='stable')
+        targets, ids = targets[order], ids[order]
+        bounds = np.flatnonzero(np.diff(targets)) + 1
+        updated = 0
+        with engine.begin() as conn:
+            for group_ids, target in zip(np.split(ids, bounds), targets[np.r_[0, bounds]] if len(ids) else []):
+                for start in range(0, len(group_ids), UPDATE_CHUNK):
+                    chunk = ", ".join(str(int(i)) for i in group_ids[start:start + UPDATE_CHUNK])
+                    conn.execute(text(f"UPDATE {q(table_name)} SET {q('region_id')} = :region WHERE {q('id')} IN ({chunk})"),
+                                 {'region': int(target)})
+                updated += len(group_ids)
+        return updated
+
+
+def read_points(engine, table_name, fetch_size=100000):
+    """读取表中各行的 (id, region_id, 纬度, 经度) 数组"""
+    q = engine.dialect.identifier_preparer.quote
+    chunks = []
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(text(
+            f"SELECT {q('id')}, {q('region_id')}, {q('latitude')}, {q('longitude')} FROM {q(table_name)}"))
+        while True:
+            rows = result.fetchmany(fetch_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+    data = np.vstack(chunks) if chunks else np.empty((0, 4))
+    return data[:, 0].astype(np.int64), data[:, 1], data[:, 2], data[:, 3]
+
+
+def _print_report(table_name, report, elapsed):
+    print(f"🧭 {table_name}: {report['points']:,} 个点，region_id 与最近地区不一致 {report['mismatches']:,} 个"
+          f"（{report['mismatch_rate']:.1%}），省份不一致 {report['province_mismatches']:,} 个，耗时 {elapsed:.2f}s")
+    for name, info in report['levels'].items():
+        if info['points']:
+            print(f"    {name}: {info['points']:,} 个点，不一致 {info['mismatches']:,}")
+    if report['median_distance_recorded_km'] is not None:
+        print(f"    不一致记录到原地区中心的中位距离 {report['median_distance_recorded_km']:.1f}km，"
+              f"到最近地区 {report['median_distance_nearest_km']:.1f}km")
+    for pair, count in report['province_changes'].items():
+        print(f"    {pair}: {count:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="核对样本和监测站点的 region_id 与坐标")
+    parser.add_argument('--url', help="数据库连接URL")
+    parser.add_argument('--data-dir', default='data', help="不指定 --url 时读取的CSV目录（只报告）")
+    parser.add_argument('--tables', nargs='+', choices=RECONCILE_TABLES, default=list(RECONCILE_TABLES))
+    parser.add_argument('--level', type=int, choices=sorted(REGION_LEVELS), help="与指定层级的最近地区比较")
+    parser.add_argument('--cell', type=float, default=CELL_DEGREES, help="候选格子大小（度）")
+    parser.add_argument('--output', help="把不一致记录写成CSV（多张表时在文件名中加表名）")
+    parser.add_argument('--apply', action='store_true', help="把不一致记录的 region_id 改为最近地区")
+    parser.add_argument('--synthetic', type=int, default=0, help="用N个随机点测试耗时")
+    args = parser.parse_args()
+    if args.apply and not args.url:
+        parser.error("--apply 需要 --url")
+
+    engine = None
+    if args.url:
+        from sqlalchemy import create_engine
+        engine = create_engine(args.url)
+        regions = RegionLocator.from_database(engine, args.cell)
+    else:
+        from column_store import ColumnTable
+        regions = RegionLocator.from_table(
+            ColumnTable.from_csv(os.path.join(args.data_dir, 'regions.csv'), 'regions'), args.cell)
+    print("🗺️  地区中心点: " + ", ".join(f"{REGION_LEVELS[level]} {len(ids):,}"
+                                        for level, (ids, _) in regions.levels.items()))
+    reconciler = RegionReconciler(regions)
+
+    if args.synthetic:
+        # 与数据生成方式相同：随机地区中心点 ±2°
+        rng = np.random.default_rng(42)
+        picks = rng.integers(0, len(regions.ids), args.synthetic)
+        region_ids = regions.ids[picks]
+        lats = regions.lookup(regions.lats_of, region_ids, np.nan) + rng.uniform(-2, 2, args.synthetic)
+        lons = regions.lookup(regions.lons_of, region_ids, np.nan) + rng.uniform(-2, 2, args.synthetic)
+        start = time.time()
+        result = reconciler.reconcile(np.arange(args.synthetic), region_ids, lats, lons, args.level)
+        _print_report("随机点", reconciler.report(result), time.time() - start)
+        return 0
+
+    for table_name in args.tables:
+        start = time.time()
+        if engine is not None:
+            ids, region_ids, lats, lons = read_points(engine, table_name)
+        else:
+            from column_store import ColumnTable
+            table = ColumnTable.from_csv(os.path.join(args.data_dir, f"{table_name}.csv"), table_name,
+                                         ['id', 'region_id', 'latitude', 'longitude'])
+            ids, region_ids, lats, lons = (table.columns[c] for c in ('id', 'region_id', 'latitude', 'longitude'))
+        loaded = time.time() - start
+        start = time.time()
+        result = reconciler.reconcile(ids, region_ids, lats, lons, args.level)
+        elapsed = time.time() - start
+        print(f"📥 读取 {table_name} 耗时 {loaded:.2f}s")
+        _print_report(table_name, reconciler.report(result), elapsed)
+        if args.output:
+            path = args.output
+            if len(args.tables) > 1:
+                root, ext = os.path.splitext(path)
+                path = f"{root}_{table_name}{ext or '.csv'}"
+            count = reconciler.write_mismatches(path, result)
+            print(f"💾 {count:,} 条不一致记录已写入 {path}")
+        if args.apply:
+            start = time.time()
+            updated = reconciler.apply(engine, table_name, result)
+            print(f"✏️  已更新 {table_name} 的 region_id {updated:,} 行，耗时 {time.time() - start:.2f}s")
+
+    if args.apply:
+        # 按省份的看板汇总依赖 region_id，存在汇总表时整体重建
+        from load_data_to_database import DatabaseLoader
+        from summary_tables import SummaryTables
+        summary = SummaryTables(DatabaseLoader(args.url))
+        if summary.exists():
+            print(f"📊 看板汇总表已重建，耗时 {summary.rebuild():.2f}s")
+        summary.engine.dispose()
+    if engine is not None:
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 统计报告内容生成
+由实际数据计算 statistical_reports 中每份报告的 key_findings 和 charts_data，
+统计范围为报告的 region_scope（省份列表，为空时为全部省份）和 time_period（"开始日期至结束日期"，按采样日期）。
+
+    charts_data   - pH分布（酸性/中性/碱性，分界与 summary_tables.PH_RANGES 一致）、有机质状况（高/中/低）的检测记录数
+    key_findings  - 土壤质量状况（soil_quality_assessment 中优、良的比例）、主要问题（强酸性、强碱性、
+                    有机质低、速效磷钾低中比例最高的一项）、改良建议，以及记录数和pH、有机质均值
+
+计算只读一遍数据：逐块把每条检测记录的可加指标（计数、和）按 (省份, 采样日) 累加为部分汇总，
+读完后再按 (省份, 月份) 合并一次。每份报告按省份合并这些部分汇总：期间内的整月取月汇总，
+首尾不足一月的部分取日汇总；同一省份同一期间的合并结果缓存，供范围重叠的报告共用。
+
+用法:
+    python report_builder.py --url sqlite:///soil_data.db
+    python report_builder.py --url ... --dry-run
+    python report_builder.py --data-dir data --output reports.csv
+    python report_builder.py --data-dir data --synthetic 100000 --dry-run      # 随机报告范围测试速度
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+import soil_quality_scoring as quality
+from summary_tables import PH_RANGES
+
+STRONG_ACID, ACID, NEUTRAL, STRONG_ALKALINE = (upper for upper, _ in PH_RANGES[:4])
+ORGANIC_MATTER_LEVELS = (3.0, 1.5)      # 有机质（%）高、中的下限
+NUTRIENT_LOW = {'available_phosphorus': 10, 'available_potassium': 100}   # mg/kg
+GOOD_GRADES = ('优', '良')
+
+# 每条检测记录贡献的可加指标
+MEASURES = ['records', 'ph_n', 'ph_sum', 'ph_acid', 'ph_neutral', 'ph_alkaline', 'ph_strong_acid',
+            'ph_strong_alkaline', 'om_n', 'om_sum', 'om_high', 'om_mid', 'om_low', 'nutrient_n', 'nutrient_low',
+            'quality_n', 'quality_good']
+
+# 主要问题：(名称, 记录数指标, 计数指标, 改良建议)
+ISSUES = [
+    ("酸化问题突出", 'ph_n', 'ph_strong_acid', quality.SUGGESTIONS['pH值偏酸']),
+    ("碱化问题突出", 'ph_n', 'ph_strong_alkaline', quality.SUGGESTIONS['pH值偏碱']),
+    ("有机质偏低", 'om_n', 'om_low', quality.SUGGESTIONS['有机质含量偏低']),
+    ("养分不平衡", 'nutrient_n', 'nutrient_low', quality.NUTRIENT_SUGGESTION),
+]
+ISSUE_MIN_SHARE = 0.1                   # 比例最高的问题也低于此值时为"无突出问题"
+
+SOURCE_COLUMNS = ['province', 'sampling_date', 'ph_value', 'organic_matter', 'available_phosphorus',
+                  'available_potassium', 'comprehensive_grade']
+CHUNK_ROWS = 500_000
+UPDATE_BATCH = 1000
+
+
+def _numbers(frame, name):
+    return pd.to_numeric(frame[name], errors='coerce').to_numpy(np.float64)
+
+
+def measures(frame):
+    """每条记录的可加指标，(记录数, len(MEASURES))"""
+    ph = _numbers(frame, 'ph_value')
+    om = _numbers(frame, 'organic_matter')
+    phosphorus = _numbers(frame, 'available_phosphorus')
+    potassium = _numbers(frame, 'available_potassium')
+    grade = frame['comprehensive_grade']
+    has_ph, has_om = ~np.isnan(ph), ~np.isnan(om)
+    has_nutrient = ~np.isnan(phosphorus) | ~np.isnan(potassium)
+    # NaN 参与比较结果为 False，不需要另外屏蔽
+    columns = {
+        'records': np.ones(len(frame)),
+        'ph_n': has_ph,
+        'ph_sum': np.where(has_ph, ph, 0),
+        'ph_acid': ph < ACID,
+        'ph_neutral': (ph >= ACID) & (ph < NEUTRAL),
+        'ph_alkaline': ph >= NEUTRAL,
+        'ph_strong_acid': ph < STRONG_ACID,
+        'ph_strong_alkaline': ph >= STRONG_ALKALINE,
+        'om_n': has_om,
+        'om_sum': np.where(has_om, om, 0),
+        'om_high': om >= ORGANIC_MATTER_LEVELS[0],
+        'om_mid': (om >= ORGANIC_MATTER_LEVELS[1]) & (om < ORGANIC_MATTER_LEVELS[0]),
+        'om_low': om < ORGANIC_MATTER_LEVELS[1],
+        'nutrient_n': has_nutrient,
+        'nutrient_low': (phosphorus < NUTRIENT_LOW['available_phosphorus'])
+        | (potassium < NUTRIENT_LOW['available_potassium']),
+        'quality_n': grade.notna().to_numpy(),
+        'quality_good': grade.isin(GOOD_GRADES).to_numpy(),
+    }
+    return np.column_stack([np.asarray(columns[m], dtype=np.float64) for m in MEASURES])
+
+
+def parse_period(time_period):
+    """'YYYY-MM-DD至YYYY-MM-DD' -> (开始, 结束) 的 datetime64[D]；无法解析的一端为 None"""
+    parts = str(time_period or '').split('至')
+    bounds = []
+    for part in (parts[0], parts[-1]):
+        try:
+            bounds.append(np.datetime64(part.strip()[:10], 'D'))
+        except ValueError:
+            bounds.append(None)
+    return tuple(bounds)
+
+
+def parse_scope(region_scope):
+    if isinstance(region_scope, str):
+        try:
+            region_scope = json.loads(region_scope)
+        except ValueError:
+            region_scope = [region_scope]
+    if isinstance(region_scope, str):
+        region_scope = [region_scope]
+    return [str(p) for p in region_scope or []]
+
+
+class PartialAggregates:
+    """
+    按 (省份, 采样日) 和 (省份, 月份) 的部分汇总
+
+    add()     - 累加一块数据
+    finish()  - 读完后整理为稠密数组：days[省份, 日]、months[省份, 月]，日、月从数据的最早日期起算
+    total()   - 一个省份在 [开始, 结束] 内的汇总，由整月和首尾零散日合并，结果缓存
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.provinces = {}
+        self._cache = {}
+        self.merges = self.cache_hits = 0
+
+    def add(self, frame):
+        dates = pd.to_datetime(frame['sampling_date'].astype(str).str[:10], errors='coerce')
+        keep = (frame['province'].notna() & dates.notna()).to_numpy()
+        if not keep.any():
+            return
+        frame = frame[keep]
+        days = dates[keep].to_numpy().astype('datetime64[D]').astype(np.int64)
+        codes, names = pd.factorize(frame['province'].astype(str))
+        province_codes = np.array([self.provinces.setdefault(name, len(self.provinces)) for name in names])
+        grouped = pd.DataFrame(measures(frame), columns=MEASURES)
+        grouped['province'] = province_codes[codes]
+        grouped['day'] = days
+        self.parts.append(grouped.groupby(['province', 'day'], sort=False).sum())
+
+    def finish(self):
+        if self.parts:
+            partial = pd.concat(self.parts).groupby(level=['province', 'day']).sum()
+        else:
+            partial = pd.DataFrame(columns=MEASURES,
+                                   index=pd.MultiIndex.from_arrays([[], []], names=['province', 'day']))
+        self.parts = []
+        province = partial.index.get_level_values('province').to_numpy(np.int64)
+        day = partial.index.get_level_values('day').to_numpy(np.int64)
+        self.first_day = int(day.min()) if len(day) else 0
+        last_day = int(day.max()) if len(day) else -1
+        self.days = np.zeros((len(self.provinces), last_day - self.first_day + 1, len(MEASURES)))
+        self.days[province, day - self.first_day] = partial.to_numpy(np.float64)
+
+        # 每日所属的月份（从最早日期所在月起算）
+        calendar = (self.first_day + np.arange(self.days.shape[1])).astype('datetime64[D]')
+        months = calendar.astype('datetime64[M]').astype(np.int64)
+        self.first_month = int(months[0]) if len(months) else 0
+        self.day_month = months - self.first_month
+        month_count = int(self.day_month[-1]) + 1 if len(months) else 0
+        self.months = np.zeros((len(self.provinces), month_count, len(MEASURES)))
+        np.add.at(self.months, (slice(None), self.day_month), self.days)
+        # 每个月第一天和最后一天在 days 中的下标，按日历计算（首尾月可能超出数据范围）
+        bounds = (np.arange(month_count + 1) + self.first_month).astype('datetime64[M]').astype('datetime64[D]')
+        bounds = bounds.astype(np.int64) - self.first_day
+        self.month_first, self.month_last = bounds[:-1], bounds[1:] - 1
+
+    def total(self, province, start, end):
+        """start、end 为 days 中的下标（含两端，已截到数据范围内）"""
+        key = (province, start, end)
+        if key in self._cache:
+            self.cache_hits += 1
+            return self._cache[key]
+        self.merges += 1
+        days = self.days[province]
+        # 完全落在 [start, end] 内的月份
+        first = int(self.day_month[start]) + (0 if self.month_first[self.day_month[start]] >= start else 1)
+        last = int(self.day_month[end]) - (0 if self.month_last[self.day_month[end]] <= end else 1)
+        if first > last:
+            result = days[start:end + 1].sum(axis=0)
+        else:
+            result = (self.months[province, first:last + 1].sum(axis=0)
+                      + days[start:self.month_first[first]].sum(axis=0)
+                      + days[self.month_last[last] + 1:end + 1].sum(axis=0))
+        self._cache[key] = result
+        return result
+
+    def report_totals(self, provinces, start, end):
+        """provinces 为省份名称（空为全部），start、end 为 datetime64[D] 或 None"""
+        totals = np.zeros(len(MEASURES))
+        if not self.days.shape[1]:
+            return totals
+        lo = 0 if start is None else max(int(start.astype(np.int64)) - self.first_day, 0)
+        hi = self.days.shape[1] - 1 if end is None else min(int(end.astype(np.int64)) - self.first_day,
+                                                             self.days.shape[1] - 1)
+        if lo > hi:
+            return totals
+        codes = self.provinces.values() if not provinces else \
+            [self.provinces[p] for p in provinces if p in self.provinces]
+        for code in codes:
+            totals = totals + self.total(code, lo, hi)
+        return totals
+
+
+def payloads(totals):
+    """由合并后的汇总生成 (key_findings, charts_data)"""
+    t = dict(zip(MEASURES, totals.tolist()))
+    shares = [(t[count] / t[base] if t[base] else 0.0, name, suggestion) for name, base, count, suggestion in ISSUES]
+    share, issue, suggestion = max(shares, key=lambda s: s[0])
+    if share < ISSUE_MIN_SHARE:
+        issue, suggestion = "无突出问题", quality.NO_SUGGESTION
+    findings = {
+        "土壤质量状况": f"{round(100 * t['quality_good'] / t['quality_n'])}%的土壤质量良好" if t['quality_n']
+        else "暂无土壤质量评价",
+        "主要问题": issue if share < ISSUE_MIN_SHARE else f"{issue}（{share:.0%}的检测记录）",
+        "改良建议": suggestion,
+        "检测记录数": int(t['records']),
+        "pH均值": round(t['ph_sum'] / t['ph_n'], 2) if t['ph_n'] else None,
+        "有机质均值": round(t['om_sum'] / t['om_n'], 2) if t['om_n'] else None,
+    }
+    charts = {
+        "pH分布": {"酸性": int(t['ph_acid']), "中性": int(t['ph_neutral']), "碱性": int(t['ph_alkaline'])},
+        "有机质状况": {"高": int(t['om_high']), "中": int(t['om_mid']), "低": int(t['om_low'])},
+    }
+    return json.dumps(findings, ensure_ascii=False), json.dumps(charts, ensure_ascii=False)
+
+
+# ----------------------------------------------------------------------
+# 读取与写入
+# ----------------------------------------------------------------------
+
+def read_database(engine, chunk_rows=CHUNK_ROWS):
+    """样本左连接地区、检测数据和质量评价（与 summary_tables 的样本集合一致），流式按块读取"""
+    q = engine.dialect.identifier_preparer.quote
+    sql = (f"SELECT r.{q('province')}, s.{q('sampling_date')}, t.{q('ph_value')}, t.{q('organic_matter')}, "
+           f"t.{q('available_phosphorus')}, t.{q('available_potassium')}, a.{q('comprehensive_grade')} "
+           f"FROM {q('soil_samples')} s "
+           f"LEFT JOIN {q('regions')} r ON s.{q('region_id')} = r.{q('id')} "
+           f"LEFT JOIN {q('soil_test_data')} t ON s.{q('id')} = t.{q('sample_id')} "
+           f"LEFT JOIN {q('soil_quality_assessment')} a ON s.{q('id')} = a.{q('sample_id')}")
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True)
+        for frame in pd.read_sql(text(sql), conn, chunksize=chunk_rows):
+            yield frame
+
+
+def read_csv(data_dir, chunk_rows=CHUNK_ROWS):
+    regions = pd.read_csv(os.path.join(data_dir, 'regions.csv'), usecols=['id', 'province'])
+    tests = pd.read_csv(os.path.join(data_dir, 'soil_test_data.csv'),
+                        usecols=['sample_id', 'ph_value', 'organic_matter', 'available_phosphorus',
+                                 'available_potassium'])
+    assessment_path = os.path.join(data_dir, 'soil_quality_assessment.csv')
+    assessments = pd.read_csv(assessment_path, usecols=['sample_id', 'comprehensive_grade']) \
+        if os.path.exists(assessment_path) else pd.DataFrame(columns=['sample_id', 'comprehensive_grade'])
+    for samples in pd.read_csv(os.path.join(data_dir, 'soil_samples.csv'),
+                               usecols=['id', 'region_id', 'sampling_date'], chunksize=chunk_rows):
+        frame = (samples.merge(regions.rename(columns={'id': 'region_id'}), on='region_id', how='left')
+                 .merge(tests.rename(columns={'sample_id': 'id'}), on='id', how='left')
+                 .merge(assessments.rename(columns={'sample_id': 'id'}), on='id', how='left'))
+        yield frame[SOURCE_COLUMNS]
+
+
+def load_reports(engine=None, data_dir="data"):
+    columns = ['id', 'region_scope', 'time_period']
+    if engine is None:
+        return pd.read_csv(os.path.join(data_dir, 'statistical_reports.csv'), usecols=columns)
+    q = engine.dialect.identifier_preparer.quote
+    with engine.connect() as conn:
+        return pd.read_sql(text(f"SELECT {', '.join(q(c) for c in columns)} FROM {q('statistical_reports')} "
+                                f"ORDER BY {q('id')}"), conn)
+
+
+def write_reports(engine, reports, batch_size=UPDATE_BATCH):
+    q = engine.dialect.identifier_preparer.quote
+    sql = (f"UPDATE {q('statistical_reports')} SET {q('key_findings')} = :key_findings, "
+           f"{q('charts_data')} = :charts_data WHERE {q('id')} = :id")
+    records = [{'id': int(r.id), 'key_findings': r.key_findings, 'charts_data': r.charts_data}
+               for r in reports.itertuples(index=False)]
+    with engine.begin() as conn:
+        for start in range(0, len(records), batch_size):
+            conn.execute(text(sql), records[start:start + batch_size])
+    return len(records)
+
+
+# ----------------------------------------------------------------------
+# 命令行
+# ----------------------------------------------------------------------
+
+def _synthetic_reports(n, provinces, first_day, day_count, rng):
+    """随机报告范围：1-3个省份，期间为数据范围内的随机区间"""
+    starts = rng.integers(0, max(day_count, 1), n)
+    ends = np.minimum(starts + rng.integers(30, 400, n), max(day_count - 1, 0))
+    def dates(offsets):
+        return (first_day + offsets).astype('datetime64[D]').astype(str)
+
+    names = np.array(sorted(provinces), dtype=object)
+    return pd.DataFrame({
+        'id': np.arange(1, n + 1),
+        'region_scope': [json.dumps(list(rng.choice(names, rng.integers(1, 4), replace=False)), ensure_ascii=False)
+                         for _ in range(n)],
+        'time_period': [f"{a}至{b}" for a, b in zip(dates(starts), dates(ends))],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="由实际数据生成统计报告的 key_findings 和 charts_data")
+    parser.add_argument('--url', help="数据库连接URL")
+    parser.add_argument('--data-dir', default='data', help="不指定 --url 时读取的CSV目录")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="每块读取的行数")
+    parser.add_argument('--output', help="把报告的 id、key_findings、charts_data 写成CSV")
+    parser.add_argument('--dry-run', action='store_true', help="只计算，不更新 statistical_reports")
+    parser.add_argument('--synthetic', type=int, default=0, help="用N份随机范围的报告测试速度")
+    args = parser.parse_args()
+
+    engine = None
+    if args.url:
+        from sqlalchemy import create_engine
+        engine = create_engine(args.url)
+
+    start = time.time()
+    partials = PartialAggregates()
+    rows = 0
+    frames = read_database(engine, args.chunk_rows) if engine is not None else read_csv(args.data_dir, args.chunk_rows)
+    for frame in frames:
+        rows += len(frame)
+        partials.add(frame)
+    partials.finish()
+    print(f"📥 读取 {rows:,} 条记录，部分汇总 {len(partials.provinces):,} 个省份 × {partials.days.shape[1]:,} 天"
+          f"（{partials.months.shape[1]:,} 个月），耗时 {time.time() - start:.2f}s")
+
+    if args.synthetic:
+        reports = _synthetic_reports(args.synthetic, partials.provinces, partials.first_day, partials.days.shape[1],
+                                     np.random.default_rng(42))
+    else:
+        reports = load_reports(engine, args.data_dir)
+    start = time.time()
+    findings, charts = [], []
+    for scope, period in zip(reports['region_scope'], reports['time_period']):
+        key_findings, charts_data = payloads(partials.report_totals(parse_scope(scope), *parse_period(period)))
+        findings.append(key_findings)
+        charts.append(charts_data)
+    reports = reports.assign(key_findings=findings, charts_data=charts)
+    print(f"📊 报告 {len(reports):,} 份，合并部分汇总 {partials.merges:,} 次、复用 {partials.cache_hits:,} 次，"
+          f"耗时 {time.time() - start:.2f}s")
+
+    if engine is not None and not args.dry_run and not args.synthetic:
+        print(f"    💾 更新 statistical_reports {write_reports(engine, reports):,} 份")
+    if args.output:
+        reports[['id', 'key_findings', 'charts_data']].to_csv(args.output, index=False, encoding='utf-8')
+        print(f"💾 已写入 {args.output}")
+    if engine is not None:
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 const express = require('express');
 const cors = require('cors');
 const DatabaseService = require('./utils/database.js');
+const TileStore = require('./utils/tileStore.js');
 
 const app = express();
 const PORT = 3000;
@@ -120,6 +121,42 @@ app.get('/api/statistics-overview', async (req, res) => {
   }
 });
 
+// 获取热力图瓦片元数据（缩放级别范围、字段说明）
+app.get('/api/tiles/metadata', (req, res) => {
+  try {
+    res.json(TileStore.getMetadata());
+  } catch (error) {
+    console.error('获取瓦片元数据失败:', error);
+    res.status(404).json({ error: '瓦片文件不存在，请先运行 tile_pyramid.py' });
+  }
+});
+
+// 获取热力图瓦片（预先计算的网格统计，gzip压缩的JSON）
+app.get('/api/tiles/:z/:x/:y', (req, res) => {
+  try {
+    const z = parseInt(req.params.z);
+    const x = parseInt(req.params.x);
+    const y = parseInt(req.params.y);
+    if ([z, x, y].some(Number.isNaN)) {
+      return res.status(400).json({ error: '瓦片坐标无效' });
+    }
+    const tile = TileStore.getTile(z, x, y);
+    if (!tile) {
+      // 该范围内没有样本
+      return res.status(204).end();
+    }
+    res.set({
+      'Content-Type': 'application/json; charset=utf-8',
+      'Content-Encoding': 'gzip',
+      'Cache-Control': 'public, max-age=3600'
+    });
+    res.send(tile);
+  } catch (error) {
+    console.error('获取热力图瓦片失败:', error);
+    res.status(404).json({ error: '获取热力图瓦片失败' });
+  }
+});
+
 // 健康检查接口
 app.get('/api/health', (req, res) => {
   res.json({ status: 'ok', message: '土壤数据API服务正常运行' });
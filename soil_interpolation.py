@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 土壤属性空间插值
+把 soil_samples 坐标上的 soil_test_data 检测值（pH、有机质、碱解氮、有效磷、速效钾、含盐量）
+插值为覆盖某个省份（或指定经纬度范围）的规则格网，每个格子的值只由最近的 k 个样本计算。
+
+    idw      - 反距离加权，权重为 1/d^p
+    kriging  - 局部普通克里金：先由样本对拟合球状变异函数（块金、偏基台、变程），
+               每个格子用最近的 k 个样本解 (k+1)×(k+1) 的克里金方程组，同一瓦片的方程组批量求解
+
+格网按瓦片（默认128×128个格子）划分，在进程池中并行计算；近邻查询用 spatial_index.PointIndex
+（R树）取瓦片范围扩展若干距离内的候选样本，再精确计算距离，候选不足以保证结果正确时扩大范围重查。
+格网为经纬度格网（EPSG:4326），第0行在北；格子大小按范围中心纬度由公里换算为度。
+
+用法:
+    python soil_interpolation.py --url sqlite:///soil_data.db --province 四川省 --resolution 1
+    python soil_interpolation.py --url ... --bbox 26 97 34.5 108.6 --method kriging --workers 8
+    python soil_interpolation.py --synthetic 100000 --bbox 26 97 34.5 108.6 --method kriging   # 随机点测试耗时
+    python soil_interpolation.py --url ... --bbox 18 73 54 135 --raster rasters/soil --date 2025-06   # 全国，写入分块栅格
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from spatial_index import KM_PER_DEGREE, PointIndex
+from tile_pyramid import TILE_ATTRIBUTES
+
+INTERPOLATION_ATTRIBUTES = list(TILE_ATTRIBUTES)
+METHODS = ('idw', 'kriging')
+DEFAULT_NEIGHBORS = {'idw': 12, 'kriging': 16}
+TILE_CELLS = 128
+QUERY_CELLS = 16
+
+# 一次计算的 格子数×候选样本数 上限，控制距离矩阵的内存
+DISTANCE_BLOCK = 4_000_000
+
+# 拟合变异函数时最多使用的样本数（样本对数为其平方量级）和距离分组数
+VARIOGRAM_MAX_POINTS = 2000
+VARIOGRAM_LAGS = 15
+
+
+def _local_xy(lats, lons, lat0):
+    """以 lat0 处的经线长度把经纬度换算为平面公里坐标（瓦片范围内误差可忽略）"""
+    return lons * KM_PER_DEGREE * math.cos(math.radians(lat0)), lats * KM_PER_DEGREE
+
+
+# ----------------------------------------------------------------------
+# 格网
+# ----------------------------------------------------------------------
+
+class GridSpec:
+    """经纬度规则格网：左上角 (west, north)，格子大小 (dlon, dlat) 度，第0行在北"""
+
+    def __init__(self, min_lat, min_lon, max_lat, max_lon, resolution_km):
+        self.resolution_km = resolution_km
+        center_lat = (min_lat + max_lat) / 2
+        self.dlat = resolution_km / KM_PER_DEGREE
+        self.dlon = resolution_km / (KM_PER_DEGREE * max(math.cos(math.radians(center_lat)), 1e-6))
+        self.width = max(1, math.ceil((max_lon - min_lon) / self.dlon))
+        self.height = max(1, math.ceil((max_lat - min_lat) / self.dlat))
+        self.west = min_lon
+        self.north = min_lat + self.height * self.dlat
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    @property
+    def bounds(self):
+        """(min_lat, min_lon, max_lat, max_lon)"""
+        return self.north - self.height * self.dlat, self.west, self.north, self.west + self.width * self.dlon
+
+    def cell_centers(self, row0, row1, col0, col1):
+        """窗口内各格子中心的经纬度（按行展开的一维数组）"""
+        lats = self.north - (np.arange(row0, row1) + 0.5) * self.dlat
+        lons = self.west + (np.arange(col0, col1) + 0.5) * self.dlon
+        lon_grid, lat_grid = np.meshgrid(lons, lats)
+        return lat_grid.ravel(), lon_grid.ravel()
+
+    def tiles(self, size=TILE_CELLS):
+        """按 size×size 划分的窗口 (row0, row1, col0, col1)"""
+        return [(r, min(r + size, self.height), c, min(c + size, self.width))
+                for r in range(0, self.height, size) for c in range(0, self.width, size)]
+
+    def metadata(self):
+        return {
+            'crs': 'EPSG:4326',
+            'west': self.west,
+            'north': self.north,
+            'dlon': self.dlon,
+            'dlat': self.dlat,
+            'width': self.width,
+            'height': self.height,
+            'resolution_km': self.resolution_km,
+        }
+
+
+# ----------------------------------------------------------------------
+# 变异函数
+# ----------------------------------------------------------------------
+
+class Variogram:
+    """球状变异函数 γ(h) = 块金 + 偏基台 × (1.5h/a - 0.5(h/a)^3)，h ≥ a 时为 块金 + 偏基台"""
+
+    def __init__(self, nugget, partial_sill, range_km):
+        self.nugget = nugget
+        self.partial_sill = partial_sill
+        self.range_km = range_km
+
+    @staticmethod
+    def _shape(h, range_km):
+        r = np.minimum(h / range_km, 1.0)
+        return r * (1.5 - 0.5 * r * r)
+
+    def __call__(self, h):
+        gamma = self.nugget + self.partial_sill * self._shape(h, self.range_km)
+        # γ(0) = 0，块金只体现在不同位置之间
+        return np.where(h > 0, gamma, 0.0)
+
+    @classmethod
+    def fit(cls, x, y, values, lags=VARIOGRAM_LAGS, max_points=VARIOGRAM_MAX_POINTS, seed=42):
+        """
+        由样本拟合：计算分组的经验半方差，再对每个候选变程用加权最小二乘求块金和偏基台（非负），
+        取残差最小的一组
+        """
+        if len(values) > max_points:
+            pick = np.random.default_rng(seed).choice(len(values), max_points, replace=False)
+            x, y, values = x[pick], y[pick], values[pick]
+        i, j = np.triu_indices(len(values), k=1)
+        distances = np.hypot(x[i] - x[j], y[i] - y[j])
+        semivariance = 0.5 * (values[i] - values[j]) ** 2
+        variance = float(np.var(values)) if len(values) else 0.0
+        if not len(distances) or distances.max() <= 0 or variance <= 0:
+            return cls(0.0, max(variance, 1e-12), 1.0)
+
+        # 只使用最大距离一半以内的样本对
+        max_lag = distances.max() / 2
+        keep = distances <= max_lag
+        edges = np.linspace(0, max_lag, lags + 1)
+        bins = np.clip(np.searchsorted(edges, distances[keep], side='right') - 1, 0, lags - 1)
+        counts = np.bincount(bins, minlength=lags)
+        used = counts > 0
+        lag_h = (np.bincount(bins, weights=distances[keep], minlength=lags)[used] / counts[used])
+        lag_gamma = (np.bincount(bins, weights=semivariance[keep], minlength=lags)[used] / counts[used])
+        weights = counts[used].astype(np.float64)
+
+        best = None
+        for range_km in np.linspace(max_lag / lags, max_lag * 1.5, 60):
+            shape = cls._shape(lag_h, range_km)
+            design = np.column_stack([np.ones_like(shape), shape]) * np.sqrt(weights)[:, None]
+            target = lag_gamma * np.sqrt(weights)
+            (nugget, partial_sill), *_ = np.linalg.lstsq(design, target, rcond=None)
+            if nugget < 0:
+                nugget = 0.0
+                partial_sill = float(np.dot(design[:, 1], target) / np.dot(design[:, 1], design[:, 1]))
+            partial_sill = max(partial_sill, 0.0)
+            residual = float(np.sum((design @ np.array([nugget, partial_sill]) - target) ** 2))
+            if best is None or residual < best[0]:
+                best = (residual, nugget, partial_sill, range_km)
+        _, nugget, partial_sill, range_km = best
+        if partial_sill <= 0:
+            # 纯块金（无空间相关），克里金退化为邻域均值
+            partial_sill = max(variance * 1e-6, 1e-12)
+        return cls(float(nugget), float(partial_sill), float(range_km))
+
+    def to_dict(self):
+        return {'model': 'spherical', 'nugget': self.nugget, 'partial_sill': self.partial_sill,
+                'range_km': self.range_km}
+
+
+# ----------------------------------------------------------------------
+# 近邻查询
+# ----------------------------------------------------------------------
+
+class NeighborSearch:
+    """
+    批量k近邻：取一批格子外包矩形向外扩展 margin 公里内的候选样本，计算平面距离；
+    矩形外的样本与批内任一格子的距离都大于 margin，所以第k近距离不超过 margin 的格子结果是精确的，
+    其余格子把 margin 加倍后重查
+    """
+
+    def __init__(self, lats, lons, values=None):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.values = values
+        self.index = PointIndex(np.arange(len(self.lats)), self.lats, self.lons)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def query(self, lats, lons, k):
+        """返回 (样本下标 m×k, 距离（公里） m×k)，每行按距离升序"""
+        m, n = len(lats), len(self.lats)
+        k = min(k, n)
+        positions = np.zeros((m, k), dtype=np.int64)
+        distances = np.full((m, k), np.inf)
+        if not k or not m:
+            return positions, distances
+        lat0 = float(np.mean(lats))
+        cell_x, cell_y = _local_xy(lats, lons, lat0)
+        # 与 PointIndex.nearest 一样按平均密度估计初始范围
+        margin = max(self.index.span_km * math.sqrt(k / n), 0.01)
+        pending = np.arange(m)
+        while len(pending):
+            p_lats, p_lons = lats[pending], lons[pending]
+            max_abs_lat = min(max(abs(p_lats.min()), abs(p_lats.max())) + margin / KM_PER_DEGREE, 89.9)
+            dlat = margin / KM_PER_DEGREE
+            dlon = margin / (KM_PER_DEGREE * math.cos(math.radians(max_abs_lat)))
+            candidates = self.index.bbox(p_lats.min() - dlat, p_lons.min() - dlon,
+                                         p_lats.max() + dlat, p_lons.max() + dlon)
+            everything = len(candidates) == n
+            if len(candidates) < k and not everything:
+                margin *= 2
+                continue
+            cand_x, cand_y = _local_xy(self.lats[candidates], self.lons[candidates], lat0)
+            done = np.zeros(len(pending), dtype=bool)
+            block = max(1, DISTANCE_BLOCK // len(candidates))
+            for start in range(0, len(pending), block):
+                rows = pending[start:start + block]
+                d = np.hypot(cell_x[rows, None] - cand_x[None, :], cell_y[rows, None] - cand_y[None, :])
+                nearest = np.argpartition(d, k - 1, axis=1)[:, :k] if k < len(candidates) \
+                    else np.broadcast_to(np.arange(k), (len(rows), k))
+                nearest_d = np.take_along_axis(d, nearest, axis=1)
+                order = np.argsort(nearest_d, axis=1)
+                positions[rows] = candidates[np.take_along_axis(nearest, order, axis=1)]
+                distances[rows] = np.take_along_axis(nearest_d, order, axis=1)
+                done[start:start + block] = everything | (distances[rows, -1] <= margin)
+            pending = pending[~done]
+            margin *= 2
+        return positions, distances
+
+
+# ----------------------------------------------------------------------
+# 插值方法
+# ----------------------------------------------------------------------
+
+def idw_estimate(distances, values, power=2.0):
+    """反距离加权；格子与样本重合时直接取样本值"""
+    exact = distances[:, 0] < 1e-9
+    weights = 1.0 / np.maximum(distances, 1e-9) ** power
+    estimate = np.sum(weights * values, axis=1) / np.sum(weights, axis=1)
+    estimate[exact] = values[exact, 0]
+    return estimate
+
+
+def neighbor_pair_distances(neighbor_x, neighbor_y):
+    """每个格子的 k 个近邻样本两两之间的距离（m×k×k），同一组近邻的各指标共用"""
+    return np.hypot(neighbor_x[:, :, None] - neighbor_x[:, None, :], neighbor_y[:, :, None] - neighbor_y[:, None, :])
+
+
+def kriging_estimate(pair, distances, values, variogram):
+    """
+    局部普通克里金，批量求解 m 个 (k+1)×(k+1) 方程组:
+        [Γ  1] [λ]   [γ0]
+        [1ᵀ 0] [μ] = [1 ]
+    pair 为近邻样本两两之间的距离；返回 (估计值, 克里金方差)
+    """
+    m, k = values.shape
+    lhs = np.ones((m, k + 1, k + 1))
+    lhs[:, :k, :k] = variogram(pair)
+    lhs[:, k, k] = 0.0
+    rhs = np.ones((m, k + 1))
+    rhs[:, :k] = variogram(distances)
+    try:
+        solution = np.linalg.solve(lhs, rhs[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        # 重合的样本点使方程组奇异时改用伪逆
+        solution = np.einsum('mij,mj->mi', np.linalg.pinv(lhs), rhs)
+    weights = solution[:, :k]
+    estimate = np.sum(weights * values, axis=1)
+    variance = np.sum(solution * rhs, axis=1)
+    return estimate, np.maximum(variance, 0.0)
+
+
+# ----------------------------------------------------------------------
+# 插值引擎
+# ----------------------------------------------------------------------
+
+class SoilInterpolator:
+    """
+    读取样本检测值，对格网逐瓦片插值
+
+    read_points() / set_points() - 样本坐标及 INTERPOLATION_ATTRIBUTES 各列的值
+    prepare(grid)                - 每个指标建立只含非空样本的近邻索引，克里金时拟合变异函数
+    run(grid)                    - 并行计算全部瓦片，返回 指标 -> 二维数组（float32，无样本覆盖处为NaN）；
+                                   指定 raster_store.RasterStore 时各进程把瓦片直接写入栅格，不在内存中拼接整幅格网
+    """
+
+    def __init__(self, method='idw', neighbors=None, power=2.0, tile_cells=TILE_CELLS, workers=4,
+                 max_distance_km=None, attributes=None):
+        if method not in METHODS:
+            raise ValueError(f"未知的插值方法: {method}")
+        self.method = method
+        self.neighbors = neighbors or DEFAULT_NEIGHBORS[method]
+        self.power = power
+        self.tile_cells = tile_cells
+        self.workers = workers
+        self.max_distance_km = max_distance_km
+        self.attributes = list(attributes or INTERPOLATION_ATTRIBUTES)
+        self.searches = {}
+        self.variograms = {}
+
+    def read_points(self, engine, fetch_size=100000):
+        """读取样本坐标及检测指标（样本连接检测数据），返回点数"""
+        attrs = ", ".join(f"t.{a}" for a in self.attributes)
+        sql = (f"SELECT s.latitude, s.longitude, {attrs} FROM soil_samples s "
+               f"JOIN soil_test_data t ON s.id = t.sample_id "
+               f"WHERE s.latitude IS NOT NULL AND s.longitude IS NOT NULL")
+        chunks = []
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(text(sql))
+            while True:
+                rows = result.fetchmany(fetch_size)
+                if not rows:
+                    break
+                chunks.append(np.array([[np.nan if v is None else float(v) for v in row] for row in rows]))
+        data = np.vstack(chunks) if chunks else np.empty((0, 2 + len(self.attributes)))
+        self.set_points(data[:, 0], data[:, 1], data[:, 2:])
+        return len(data)
+
+    def set_points(self, lats, lons, values):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+
+    @staticmethod
+    def region_extent(engine, province, margin_km=10.0):
+        """省份内样本的经纬度范围，四周各扩展 margin_km"""
+        with engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT MIN(s.latitude), MIN(s.longitude), MAX(s.latitude), MAX(s.longitude) "
+                "FROM soil_samples s JOIN regions r ON s.region_id = r.id WHERE r.province LIKE :p"
+            ), {'p': f"%{province}%"}).first()
+        if row is None or row[0] is None:
+            raise KeyError(f"省份 {province} 没有带坐标的样本")
+        min_lat, min_lon, max_lat, max_lon = (float(v) for v in row)
+        dlat = margin_km / KM_PER_DEGREE
+        dlon = margin_km / (KM_PER_DEGREE * math.cos(math.radians((min_lat + max_lat) / 2)))
+        return min_lat - dlat, min_lon - dlon, max_lat + dlat, max_lon + dlon
+
+    def prepare(self, grid):
+        """
+        建立近邻索引：非空样本相同的指标（通常是全部指标）共用一个索引，近邻只查一次；
+        克里金用格网范围（四周扩展一半宽度）内的样本拟合各指标的变异函数
+        """
+        self.searches = {}
+        groups = {}
+        for i, attr in enumerate(self.attributes):
+            groups.setdefault(np.isnan(self.values[:, i]).tobytes(), []).append(i)
+        for columns in groups.values():
+            valid = ~np.isnan(self.values[:, columns[0]])
+            names = tuple(self.attributes[i] for i in columns)
+            self.searches[names] = NeighborSearch(self.lats[valid], self.lons[valid], self.values[valid][:, columns])
+
+        if self.method == 'kriging':
+            min_lat, min_lon, max_lat, max_lon = grid.bounds
+            pad_lat, pad_lon = (max_lat - min_lat) / 2, (max_lon - min_lon) / 2
+            nearby = ((self.lats >= min_lat - pad_lat) & (self.lats <= max_lat + pad_lat)
+                      & (self.lons >= min_lon - pad_lon) & (self.lons <= max_lon + pad_lon))
+            lat0 = (min_lat + max_lat) / 2
+            for i, attr in enumerate(self.attributes):
+                valid = ~np.isnan(self.values[:, i])
+                fit = valid & nearby if np.count_nonzero(valid & nearby) >= 30 else valid
+                x, y = _local_xy(self.lats[fit], self.lons[fit], lat0)
+                self.variograms[attr] = Variogram.fit(x, y, self.values[fit, i])
+
+    def _interpolate_block(self, lats, lons):
+        """一小块格子（中心经纬度）的全部指标值，返回 {指标: 一维数组}"""
+        lat0 = float(np.mean(lats))
+        result = {}
+        for names, search in self.searches.items():
+            if not len(search):
+                result.update({attr: np.full(len(lats), np.nan) for attr in names})
+                continue
+            positions, distances = search.query(lats, lons, self.neighbors)
+            if self.method == 'kriging':
+                pair = neighbor_pair_distances(*_local_xy(search.lats[positions], search.lons[positions], lat0))
+            for column, attr in enumerate(names):
+                values = search.values[positions, column]
+                if self.method == 'idw':
+                    estimate = idw_estimate(distances, values, self.power)
+                else:
+                    estimate, _ = kriging_estimate(pair, distances, values, self.variograms[attr])
+                if self.max_distance_km is not None:
+                    estimate[distances[:, 0] > self.max_distance_km] = np.nan
+                result[attr] = estimate
+        return result
+
+    def interpolate_tile(self, grid, window):
+        """
+        计算一个窗口内全部指标的值，返回 {指标: 二维数组}；
+        窗口再按 QUERY_CELLS 分块查询近邻，使每块的候选样本只覆盖块附近
+        """
+        row0, row1, col0, col1 = window
+        result = {attr: np.empty((row1 - row0, col1 - col0), dtype=np.float32) for attr in self.attributes}
+        for r in range(row0, row1, QUERY_CELLS):
+            for c in range(col0, col1, QUERY_CELLS):
+                r1, c1 = min(r + QUERY_CELLS, row1), min(c + QUERY_CELLS, col1)
+                block = self._interpolate_block(*grid.cell_centers(r, r1, c, c1))
+                for attr, values in block.items():
+                    result[attr][r - row0:r1 - row0, c - col0:c1 - col0] = values.reshape(r1 - r, c1 - c)
+        return result
+
+    def run(self, grid, raster=None, date=None):
+        """
+        并行计算全部瓦片；raster 不为空时瓦片按栅格的块大小划分并由各进程直接写入 (指标, date)，返回 None
+        """
+        if not self.searches:
+            self.prepare(grid)
+        if raster is not None:
+            grids = None
+            windows = grid.tiles(raster.chunk)
+        else:
+            grids = {attr: np.full(grid.shape, np.nan, dtype=np.float32) for attr in self.attributes}
+            windows = grid.tiles(self.tile_cells)
+
+        def store(window, values):
+            row0, row1, col0, col1 = window
+            for attr, array in values.items():
+                grids[attr][row0:row1, col0:col1] = array
+
+        if self.workers <= 1 or len(windows) == 1:
+            for window in windows:
+                values = self.interpolate_tile(grid, window)
+                if raster is not None:
+                    _write_raster(raster, date, window, values)
+                else:
+                    store(window, values)
+            return grids
+        # 每个工作进程初始化时接收一次样本和索引，任务只传窗口坐标
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self, grid, raster, date)) as executor:
+            for window, values in zip(windows, executor.map(_interpolate_window, windows,
+                                                            chunksize=max(1, len(windows) // (self.workers * 8)))):
+                if values is not None:
+                    store(window, values)
+        return grids
+
+    def describe(self):
+        info = {'method': self.method, 'neighbors': self.neighbors, 'attributes': self.attributes}
+        if self.method == 'idw':
+            info['power'] = self.power
+        else:
+            info['variograms'] = {attr: v.to_dict() for attr, v in self.variograms.items()}
+        if self.max_distance_km is not None:
+            info['max_distance_km'] = self.max_distance_km
+        return info
+
+
+# 工作进程中的插值引擎和格网
+_worker_state = {}
+
+
+def _init_worker(interpolator, grid, raster=None, date=None):
+    _worker_state['interpolator'] = interpolator
+    _worker_state['grid'] = grid
+    _worker_state['raster'] = raster
+    _worker_state['date'] = date
+
+
+def _interpolate_window(window):
+    values = _worker_state['interpolator'].interpolate_tile(_worker_state['grid'], window)
+    if _worker_state['raster'] is None:
+        return values
+    _write_raster(_worker_state['raster'], _worker_state['date'], window, values)
+    return None
+
+
+def _write_raster(raster, date, window, values):
+    row0, _, col0, _ = window
+    for attr, array in values.items():
+        raster.write_window(attr, date, row0, col0, array)
+
+
+def save_grids(path, grid, grids, info):
+    """保存为 .npz：各指标一个数组，metadata 为格网地理参考和插值参数（JSON）"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    metadata = dict(grid.metadata(), interpolation=info)
+    np.savez_compressed(path, metadata=np.array(json.dumps(metadata, ensure_ascii=False)), **grids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把样本检测值插值为格网")
+    parser.add_argument('--url', help="数据库连接URL")
+    parser.add_argument('--province', help="插值范围为该省份样本的范围")
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('MIN_LAT', 'MIN_LON', 'MAX_LAT', 'MAX_LON'),
+                        help="插值范围")
+    parser.add_argument('--resolution', type=float, default=1.0, help="格子大小（公里）")
+    parser.add_argument('--method', choices=METHODS, default='idw', help="插值方法")
+    parser.add_argument('--neighbors', type=int, help="每个格子使用的最近样本数")
+    parser.add_argument('--power', type=float, default=2.0, help="反距离加权的幂")
+    parser.add_argument('--max-distance', type=float, help="最近样本超过该距离（公里）的格子置为空值")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help="进程数")
+    parser.add_argument('--output', help="结果文件（.npz）")
+    parser.add_argument('--raster', help="写入分块栅格目录（raster_store），并生成金字塔")
+    parser.add_argument('--date', help="写入栅格时的日期标签")
+    parser.add_argument('--synthetic', type=int, default=0, help="在 --bbox 范围内用N个随机样本测试耗时")
+    args = parser.parse_args()
+
+    interpolator = SoilInterpolator(args.method, args.neighbors, args.power, workers=args.workers,
+                                    max_distance_km=args.max_distance)
+    if args.synthetic:
+        if not args.bbox:
+            parser.error("--synthetic 需要 --bbox")
+        rng = np.random.default_rng(42)
+        min_lat, min_lon, max_lat, max_lon = args.bbox
+        lats = rng.uniform(min_lat, max_lat, args.synthetic)
+        lons = rng.uniform(min_lon, max_lon, args.synthetic)
+        trend = np.sin(np.radians(lats) * 40) + np.cos(np.radians(lons) * 30)
+        values = trend[:, None] * np.arange(1, len(INTERPOLATION_ATTRIBUTES) + 1) \
+            + rng.normal(0, 0.2, (args.synthetic, len(INTERPOLATION_ATTRIBUTES)))
+        interpolator.set_points(lats, lons, values)
+        extent = args.bbox
+    else:
+        if not args.url:
+            parser.error("需要 --url 或 --synthetic")
+        engine = create_engine(args.url)
+        count = interpolator.read_points(engine)
+        print(f"📥 读取样本 {count:,} 个")
+        if args.province:
+            extent = SoilInterpolator.region_extent(engine, args.province)
+        elif args.bbox:
+            extent = args.bbox
+        else:
+            parser.error("需要 --province 或 --bbox")
+        engine.dispose()
+
+    grid = GridSpec(*extent, args.resolution)
+    print(f"🗺️  格网 {grid.width}×{grid.height}（{grid.width * grid.height:,} 个格子，{args.resolution:g}km），"
+          f"{len(grid.tiles())} 个瓦片，方法 {args.method}")
+    start = time.time()
+    interpolator.prepare(grid)
+    for attr, variogram in interpolator.variograms.items():
+        print(f"    {attr}: 块金 {variogram.nugget:.4g}  偏基台 {variogram.partial_sill:.4g}  "
+              f"变程 {variogram.range_km:.1f}km")
+    prepared = time.time() - start
+    start = time.time()
+    if args.raster:
+        from raster_store import RasterStore
+        raster = RasterStore.create(args.raster, grid.metadata(), INTERPOLATION_ATTRIBUTES)
+        interpolator.run(grid, raster, args.date)
+        print(f"✅ 插值完成：准备 {prepared:.2f}s，计算 {time.time() - start:.2f}s（{args.workers} 个进程）")
+        start = time.time()
+        for attr in interpolator.attributes:
+            raster.build_overviews(attr, args.date)
+        print(f"💾 已写入 {args.raster}，金字塔 {raster.levels - 1} 层，耗时 {time.time() - start:.2f}s")
+        return 0
+    grids = interpolator.run(grid)
+    print(f"✅ 插值完成：准备 {prepared:.2f}s，计算 {time.time() - start:.2f}s（{args.workers} 个进程）")
+    for attr, array in grids.items():
+        if np.isnan(array).all():
+            print(f"    {attr:<22} 无数据")
+        else:
+            print(f"    {attr:<22} 最小 {np.nanmin(array):.3f}  平均 {np.nanmean(array):.3f}  最大 {np.nanmax(array):.3f}")
+    if args.output:
+        save_grids(args.output, grid, grids, interpolator.describe())
+        print(f"💾 已保存到 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
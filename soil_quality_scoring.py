@@ -0,0 +1,587 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 土壤质量评分
+由每个样本的检测值（soil_test_data）和微量元素（trace_elements）计算 soil_quality_assessment 的各项评分，
+代替生成数据时的随机分数。
+
+    单项指标   - 隶属函数把检测值换算为 0.1-1 的隶属度：
+                 rising  (a, b)        越多越好，x≤a 为最低隶属度，x≥b 为1
+                 falling (a, b)        越少越好，x≤a 为1，x≥b 为最低隶属度
+                 optimum (a, b, c, d)  [b, c] 内为1，向 a、d 线性降到最低隶属度
+                 pH 的适宜区间 [b, c] 取自 soil_types.optimal_ph_min/optimal_ph_max，两侧各放宽 PH_TOLERANCE
+    分项评分   - ph_score、organic_matter_score、nutrient_score、physical_property_score 为各自指标隶属度的
+                 加权平均×100；缺少的指标（如未做微量元素检测）不参与，权重按其余指标重新归一
+    综合评分   - fertility_score 为四个分项评分的加权和，comprehensive_grade 按 GRADE_BOUNDS 由它划分
+    限制因子   - 隶属度低于 LIMIT_MEMBERSHIP 的指标，按偏低/偏高给出限制因子和对应的改良建议
+
+隶属函数参数、权重可以用 --rules 指定的JSON文件覆盖，并可按土壤类型（type_code 或 type_name）单独设置：
+
+    {"membership": {"organic_matter": ["rising", [1.0, 3.5]]},
+     "soil_types": {"水稻土": {"bulk_density": ["optimum", [0.8, 1.0, 1.3, 1.5]]}},
+     "weights": {"nutrient_score": {"available_phosphorus": 0.3}},
+     "fertility_weights": {"nutrient_score": 0.4}}
+
+每个样本的输入（检测值、土壤类型、评价日期）与评分规则一起计算64位哈希，保存在 _quality_input_hashes；
+再次运行时只重新评分哈希变化或尚无评估记录的样本。规则变化时所有样本的哈希都会变化，全部重新评分。
+
+用法:
+    python soil_quality_scoring.py --url sqlite:///soil_data.db
+    python soil_quality_scoring.py --url ... --rules quality_rules.json --full     # 忽略哈希，全部重新评分
+    python soil_quality_scoring.py --data-dir data --output quality.csv           # 只读CSV，结果写成CSV
+    python soil_quality_scoring.py --synthetic 5000000                            # 随机数据测试吞吐量
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+TEST_FIELDS = ['ph_value', 'organic_matter', 'total_nitrogen', 'available_nitrogen', 'available_phosphorus',
+               'available_potassium', 'cation_exchange_capacity', 'salinity', 'moisture_content',
+               'bulk_density', 'porosity']
+TRACE_FIELDS = ['iron', 'manganese', 'zinc', 'copper', 'boron', 'molybdenum']
+
+# 指标 -> (隶属函数, 参数)；ph_value 的参数由土壤类型的适宜pH给出
+MEMBERSHIP_RULES = {
+    'ph_value': ('optimum', None),
+    'organic_matter': ('rising', (0.6, 3.0)),             # %
+    'total_nitrogen': ('rising', (500, 1500)),            # mg/kg
+    'available_nitrogen': ('rising', (30, 120)),          # mg/kg
+    'available_phosphorus': ('rising', (5, 30)),          # mg/kg
+    'available_potassium': ('rising', (50, 200)),         # mg/kg
+    'cation_exchange_capacity': ('rising', (5, 20)),      # cmol/kg
+    'salinity': ('falling', (1.0, 4.0)),                  # g/kg
+    'moisture_content': ('optimum', (8, 15, 28, 40)),     # %
+    'bulk_density': ('optimum', (0.9, 1.1, 1.35, 1.6)),   # g/cm³
+    'porosity': ('optimum', (35, 45, 55, 65)),            # %
+    'iron': ('rising', (4.5, 20)),                        # 有效态 mg/kg
+    'manganese': ('rising', (5, 15)),
+    'zinc': ('rising', (0.5, 2.0)),
+    'copper': ('rising', (0.2, 1.0)),
+    'boron': ('rising', (0.25, 1.0)),
+    'molybdenum': ('rising', (0.1, 0.3)),
+}
+
+# 分项评分 -> {指标: 权重}
+SCORE_WEIGHTS = {
+    'ph_score': {'ph_value': 1.0},
+    'organic_matter_score': {'organic_matter': 1.0},
+    'nutrient_score': {
+        'total_nitrogen': 0.15, 'available_nitrogen': 0.2, 'available_phosphorus': 0.2,
+        'available_potassium': 0.2, 'zinc': 0.05, 'boron': 0.05, 'iron': 0.04, 'manganese': 0.04,
+        'copper': 0.04, 'molybdenum': 0.03,
+    },
+    'physical_property_score': {
+        'bulk_density': 0.3, 'porosity': 0.2, 'moisture_content': 0.15, 'cation_exchange_capacity': 0.2,
+        'salinity': 0.15,
+    },
+}
+FERTILITY_WEIGHTS = {'ph_score': 0.2, 'organic_matter_score': 0.25, 'nutrient_score': 0.35,
+                     'physical_property_score': 0.2}
+
+# 与生成数据时的等级划分一致
+GRADE_BOUNDS = ((85, '优'), (75, '良'), (65, '中'))
+LOWEST_GRADE = '差'
+
+MIN_MEMBERSHIP = 0.1
+LIMIT_MEMBERSHIP = 0.6           # 隶属度低于此值的指标列为限制因子
+PH_TOLERANCE = 1.5               # 适宜pH区间两侧降到最低隶属度的宽度
+DEFAULT_OPTIMAL_PH = (6.0, 7.5)  # 未知土壤类型使用
+
+# 指标 -> (偏低时的限制因子, 偏高时的限制因子)
+FACTOR_LABELS = {
+    'ph_value': ('pH值偏酸', 'pH值偏碱'),
+    'organic_matter': ('有机质含量偏低', None),
+    'total_nitrogen': ('全氮含量偏低', None),
+    'available_nitrogen': ('碱解氮偏低', None),
+    'available_phosphorus': ('有效磷偏低', None),
+    'available_potassium': ('速效钾偏低', None),
+    'cation_exchange_capacity': ('保肥能力弱', None),
+    'salinity': (None, '盐分含量偏高'),
+    'moisture_content': ('土壤偏干', '土壤过湿'),
+    'bulk_density': ('土壤过于疏松', '土壤紧实板结'),
+    'porosity': ('孔隙度偏低', '孔隙度偏高'),
+    'iron': ('有效铁缺乏', None),
+    'manganese': ('有效锰缺乏', None),
+    'zinc': ('有效锌缺乏', None),
+    'copper': ('有效铜缺乏', None),
+    'boron': ('有效硼缺乏', None),
+    'molybdenum': ('有效钼缺乏', None),
+}
+SUGGESTIONS = {
+    'pH值偏酸': "合理施用石灰，调节土壤pH值",
+    'pH值偏碱': "施用石膏或酸性肥料，调节土壤pH值",
+    '有机质含量偏低': "增施有机肥，提高土壤有机质含量",
+    '保肥能力弱': "增施有机肥，提高土壤有机质含量",
+    '盐分含量偏高': "灌水洗盐，降低土壤盐分",
+    '土壤偏干': "完善灌溉设施，保持土壤水分",
+    '土壤过湿': "开沟排水，降低土壤湿度",
+    '土壤过于疏松': "镇压保墒，改善土壤结构",
+    '土壤紧实板结': "深耕松土，改善土壤结构",
+    '孔隙度偏低': "深耕松土，改善土壤结构",
+    '孔隙度偏高': "镇压保墒，改善土壤结构",
+}
+NUTRIENT_SUGGESTION = "科学施肥，平衡土壤养分"
+NO_FACTOR = "无明显限制因子"
+NO_SUGGESTION = "轮作倒茬，维护土壤生态平衡"
+
+ASSESSOR = '系统评分'
+HASH_TABLE = '_quality_input_hashes'
+CHUNK_ROWS = 500_000
+WRITE_BATCH = 5000
+
+
+def _numbers(frame, name):
+    if name not in frame:
+        return np.full(len(frame), np.nan)
+    return pd.to_numeric(frame[name], errors='coerce').to_numpy(np.float64)
+
+
+def trapezoid(shape, params):
+    """把三种隶属函数统一为梯形参数 (a, b, c, d)"""
+    if shape == 'rising':
+        return (params[0], params[1], np.inf, np.inf)
+    if shape == 'falling':
+        return (-np.inf, -np.inf, params[0], params[1])
+    if shape == 'optimum':
+        return tuple(params)
+    raise ValueError(f"未知的隶属函数 {shape}")
+
+
+def membership(values, params, floor=MIN_MEMBERSHIP):
+    """梯形隶属度；params 为 (a, b, c, d) 或每行一组参数的 (n, 4) 数组，空值返回 NaN"""
+    a, b, c, d = np.moveaxis(np.asarray(params, dtype=np.float64), -1, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rise = np.where(values < b, np.clip((values - a) / (b - a), 0, 1), 1.0)
+        fall = np.where(values > c, np.clip((d - values) / (d - c), 0, 1), 1.0)
+    m = floor + (1 - floor) * np.minimum(rise, fall)
+    return np.where(np.isnan(values), np.nan, m)
+
+
+class QualityScorer:
+    """
+    向量化的土壤质量评分
+
+    soil_types 为 soil_types 表（至少含 id、optimal_ph_min、optimal_ph_max），rules 为 --rules 的JSON内容。
+    每个指标的梯形参数按土壤类型展开为 (类型数+1, 4) 的表，最后一行给未知土壤类型；
+    评分时按行的土壤类型取参数，所有样本一次计算。
+    """
+
+    def __init__(self, soil_types, rules=None):
+        rules = rules or {}
+        self.weights = {group: dict(fields, **rules.get('weights', {}).get(group, {}))
+                        for group, fields in SCORE_WEIGHTS.items()}
+        self.fertility_weights = dict(FERTILITY_WEIGHTS, **rules.get('fertility_weights', {}))
+        self.fields = [f for f in MEMBERSHIP_RULES if any(f in w for w in self.weights.values())]
+
+        type_ids = pd.to_numeric(soil_types['id']).to_numpy(np.int64) if len(soil_types) else np.zeros(0, np.int64)
+        self.type_map = np.full(int(type_ids.max()) + 2 if len(type_ids) else 1, len(type_ids), dtype=np.int64)
+        self.type_map[type_ids] = np.arange(len(type_ids))
+
+        defaults = {field: trapezoid(*rule) for field, rule in MEMBERSHIP_RULES.items() if rule[1] is not None}
+        for field, (shape, params) in rules.get('membership', {}).items():
+            defaults[field] = trapezoid(shape, params)
+        overrides = rules.get('soil_types', {})
+        ph_min = _numbers(soil_types, 'optimal_ph_min')
+        ph_max = _numbers(soil_types, 'optimal_ph_max')
+
+        self.params = {}
+        for field in self.fields:
+            table = np.empty((len(type_ids) + 1, 4))
+            if field == 'ph_value' and field not in rules.get('membership', {}):
+                lo = np.where(np.isnan(ph_min), DEFAULT_OPTIMAL_PH[0], ph_min)
+                hi = np.where(np.isnan(ph_max), DEFAULT_OPTIMAL_PH[1], ph_max)
+                table[:-1] = np.column_stack([lo - PH_TOLERANCE, lo, hi, hi + PH_TOLERANCE])
+                table[-1] = (DEFAULT_OPTIMAL_PH[0] - PH_TOLERANCE, *DEFAULT_OPTIMAL_PH,
+                             DEFAULT_OPTIMAL_PH[1] + PH_TOLERANCE)
+            else:
+                table[:] = defaults[field]
+            self.params[field] = table
+        for i, row in enumerate(soil_types.to_dict('records')):
+            custom = overrides.get(str(row.get('type_code'))) or overrides.get(str(row.get('type_name'))) or {}
+            for field, (shape, params) in custom.items():
+                if field in self.params:
+                    self.params[field][i] = trapezoid(shape, params)
+
+        # 规则指纹：参数表或权重任何变化都会改变所有样本的输入哈希
+        digest = hashlib.md5(json.dumps({
+            'params': {f: t.tolist() for f, t in self.params.items()},
+            'type_ids': type_ids.tolist(),
+            'weights': self.weights,
+            'fertility_weights': self.fertility_weights,
+            'limit': LIMIT_MEMBERSHIP,
+            'floor': MIN_MEMBERSHIP,
+        }, sort_keys=True).encode('utf-8')).digest()
+        self.fingerprint = np.frombuffer(digest[:8], dtype=np.uint64)[0]
+
+        # 各土壤类型参数相同的指标只保留一组，评分时不必按行展开
+        self.uniform = {f for f, t in self.params.items() if (t == t[0]).all()}
+
+        # 限制因子按 (指标, 偏低/偏高) 编号，每行的限制因子组合编码为一个整数
+        self.factors = [(field, side, label) for field in self.fields
+                        for side, label in enumerate(FACTOR_LABELS.get(field, (None, None))) if label]
+        self._texts = {}
+
+    def type_rows(self, soil_type_ids):
+        ids = np.nan_to_num(soil_type_ids, nan=-1).astype(np.int64)
+        inside = (ids >= 0) & (ids < len(self.type_map))
+        return np.where(inside, self.type_map[np.clip(ids, 0, len(self.type_map) - 1)], len(self.type_map) - 1)
+
+    def input_hashes(self, frame):
+        """每个样本评分输入的64位哈希（含规则指纹）"""
+        inputs = pd.DataFrame({f: _numbers(frame, f) for f in ['soil_type_id'] + self.fields})
+        inputs['assessment_date'] = assessment_dates(frame)
+        hashes = pd.util.hash_pandas_object(inputs, index=False).to_numpy(np.uint64)
+        return hashes ^ self.fingerprint
+
+    def _factor_texts(self, codes):
+        """限制因子组合编码 -> (限制因子, 改良建议)"""
+        unique, inverse = np.unique(codes, return_inverse=True)
+        for code in unique.tolist():
+            if code in self._texts:
+                continue
+            labels = [label for bit, (_, _, label) in enumerate(self.factors) if code >> bit & 1]
+            suggestions = []
+            for label in labels:
+                suggestion = SUGGESTIONS.get(label, NUTRIENT_SUGGESTION)
+                if suggestion not in suggestions:
+                    suggestions.append(suggestion)
+            self._texts[code] = ("; ".join(labels) or NO_FACTOR, "；".join(suggestions) or NO_SUGGESTION)
+        texts = [self._texts[code] for code in unique.tolist()]
+        return (np.asarray([t[0] for t in texts], dtype=object)[inverse],
+                np.asarray([t[1] for t in texts], dtype=object)[inverse])
+
+    def score(self, frame):
+        """frame 每行一个样本，返回 soil_quality_assessment 格式（不含 id、assessor、created_at）的 DataFrame"""
+        rows = self.type_rows(_numbers(frame, 'soil_type_id'))
+        memberships = {}
+        codes = np.zeros(len(frame), dtype=np.int64)
+        bits = {(field, side): bit for bit, (field, side, _) in enumerate(self.factors)}
+        for field in self.fields:
+            values = _numbers(frame, field)
+            params = self.params[field][0] if field in self.uniform else self.params[field][rows]
+            m = membership(values, params)
+            memberships[field] = m
+            limited = m < LIMIT_MEMBERSHIP
+            for side, above in ((0, False), (1, True)):
+                if (field, side) in bits:
+                    edge = params[..., 2] if above else params[..., 1]
+                    hit = limited & ((values > edge) if above else (values < edge))
+                    codes |= hit.astype(np.int64) << bits[(field, side)]
+
+        result = {'sample_id': _numbers(frame, 'sample_id').astype(np.int64)}
+        total = np.zeros(len(frame))
+        total_weight = np.zeros(len(frame))
+        for group, weights in self.weights.items():
+            weighted = np.zeros(len(frame))
+            weight_sum = np.zeros(len(frame))
+            for field, weight in weights.items():
+                m = memberships.get(field)
+                if m is None or not weight:
+                    continue
+                present = ~np.isnan(m)
+                weighted += np.where(present, m * weight, 0)
+                weight_sum += present * weight
+            with np.errstate(invalid='ignore', divide='ignore'):
+                score = np.round(weighted / weight_sum * 100, 2)
+            result[group] = score
+            group_weight = self.fertility_weights.get(group, 0)
+            present = ~np.isnan(score)
+            total += np.where(present, score * group_weight, 0)
+            total_weight += present * group_weight
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fertility = np.round(total / total_weight, 2)
+
+        thresholds = np.array([bound for bound, _ in GRADE_BOUNDS])
+        grades = np.array([grade for _, grade in GRADE_BOUNDS] + [LOWEST_GRADE], dtype=object)
+        # thresholds 从高到低，-fertility 升序查找得到等级下标
+        grade_index = np.searchsorted(-thresholds, -np.nan_to_num(fertility, nan=-np.inf), side='right')
+        factors, suggestions = self._factor_texts(codes)
+        return pd.DataFrame({
+            'sample_id': result['sample_id'],
+            'fertility_score': fertility,
+            'ph_score': result['ph_score'],
+            'organic_matter_score': result['organic_matter_score'],
+            'nutrient_score': result['nutrient_score'],
+            'physical_property_score': result['physical_property_score'],
+            'comprehensive_grade': grades[grade_index],
+            'limiting_factors': factors,
+            'improvement_suggestions': suggestions,
+            'assessment_date': assessment_dates(frame),
+        })
+
+
+def assessment_dates(frame):
+    """评价日期取检测日期，没有时取采样日期，统一为 YYYY-MM-DD"""
+    dates = frame['test_date'] if 'test_date' in frame else pd.Series(None, index=frame.index, dtype=object)
+    if 'sampling_date' in frame:
+        dates = dates.where(dates.notna(), frame['sampling_date'])
+    # 日期取值很少，只对不同的取值做字符串截取
+    codes, uniques = pd.factorize(dates)
+    uniques = np.append(np.asarray(uniques.astype(str).str[:10], dtype=object), None)
+    return uniques[codes]
+
+
+# ----------------------------------------------------------------------
+# 读取与写入
+# ----------------------------------------------------------------------
+
+def load_soil_types(engine=None, data_dir="data"):
+    columns = ['id', 'type_code', 'type_name', 'optimal_ph_min', 'optimal_ph_max']
+    if engine is None:
+        return pd.read_csv(os.path.join(data_dir, 'soil_types.csv'), usecols=columns)
+    q = engine.dialect.identifier_preparer.quote
+    with engine.connect() as conn:
+        return pd.read_sql(text(f"SELECT {', '.join(q(c) for c in columns)} FROM {q('soil_types')}"), conn)
+
+
+def _latest_per_sample(frame):
+    """同一样本有多次检测（或多条微量元素记录）时取最后一条"""
+    return frame.drop_duplicates('sample_id', keep='last')
+
+
+def read_database(engine, chunk_rows=CHUNK_ROWS):
+    """按 sample_id 顺序流式读取样本、检测数据和微量元素，每块内每个样本一行"""
+    q = engine.dialect.identifier_preparer.quote
+    columns = ([f"t.{q('sample_id')}", f"s.{q('soil_type_id')}", f"s.{q('crop_id')}", f"s.{q('sampling_date')}",
+                f"t.{q('test_date')}"]
+               + [f"t.{q(c)}" for c in TEST_FIELDS] + [f"e.{q(c)}" for c in TRACE_FIELDS])
+    sql = (f"SELECT {', '.join(columns)} FROM {q('soil_test_data')} t "
+           f"JOIN {q('soil_samples')} s ON s.{q('id')} = t.{q('sample_id')} "
+           f"LEFT JOIN {q('trace_elements')} e ON e.{q('sample_id')} = t.{q('sample_id')} "
+           f"ORDER BY t.{q('sample_id')}, t.{q('id')}, e.{q('id')}")
+    carry = None
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True)
+        for frame in pd.read_sql(text(sql), conn, chunksize=chunk_rows):
+            if carry is not None:
+                frame = pd.concat([carry, frame], ignore_index=True)
+            # 最后一个样本的记录可能延续到下一块
+            last = frame['sample_id'].iloc[-1]
+            tail = (frame['sample_id'] == last).to_numpy()
+            carry = frame[tail]
+            if tail.all():
+                continue
+            yield _latest_per_sample(frame[~tail])
+    if carry is not None and len(carry):
+        yield _latest_per_sample(carry)
+
+
+def read_csv(data_dir, chunk_rows=CHUNK_ROWS):
+    samples = pd.read_csv(os.path.join(data_dir, 'soil_samples.csv'),
+                          usecols=['id', 'soil_type_id', 'crop_id', 'sampling_date'])
+    tests = pd.read_csv(os.path.join(data_dir, 'soil_test_data.csv'), usecols=['id', 'sample_id', 'test_date'] + TEST_FIELDS)
+    frame = tests.sort_values(['sample_id', 'id'], kind='stable').drop(columns='id')
+    frame = frame.merge(samples.rename(columns={'id': 'sample_id'}), on='sample_id', how='inner')
+    trace_path = os.path.join(data_dir, 'trace_elements.csv')
+    if os.path.exists(trace_path):
+        trace = pd.read_csv(trace_path, usecols=['id', 'sample_id'] + TRACE_FIELDS)
+        trace = _latest_per_sample(trace.sort_values(['sample_id', 'id'], kind='stable')).drop(columns='id')
+        frame = frame.merge(trace, on='sample_id', how='left')
+    frame = _latest_per_sample(frame)
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+class QualityWriter:
+    """
+    增量写入 soil_quality_assessment
+
+    load()     - 读入上次评分时各样本的输入哈希和现有评估记录的id
+    changed()  - 哈希变化或尚无评估记录的样本
+    write()    - 删除这些样本原有的评估记录后按原id（新样本分配新id）插入，并更新哈希
+    """
+
+    def __init__(self, engine, batch_size=WRITE_BATCH):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.hash_ids = np.zeros(0, dtype=np.int64)
+        self.hash_values = np.zeros(0, dtype=np.uint64)
+        self.assessed_ids = np.zeros(0, dtype=np.int64)
+        self.assessment_ids = np.zeros(0, dtype=np.int64)
+        self.next_id = 1
+        self.scored_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def _q(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def load(self):
+        q = self._q
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {q(HASH_TABLE)} ("
+                "sample_id BIGINT NOT NULL, input_hash BIGINT NOT NULL, scored_at VARCHAR(19) NULL, "
+                "PRIMARY KEY (sample_id))"))
+            hashes = conn.execute(text(
+                f"SELECT {q('sample_id')}, {q('input_hash')} FROM {q(HASH_TABLE)} ORDER BY {q('sample_id')}")).fetchall()
+            assessed = conn.execute(text(
+                f"SELECT {q('sample_id')}, MIN({q('id')}) FROM {q('soil_quality_assessment')} "
+                f"GROUP BY {q('sample_id')} ORDER BY {q('sample_id')}")).fetchall()
+            self.next_id = int(conn.execute(text(
+                f"SELECT COALESCE(MAX({q('id')}), 0) FROM {q('soil_quality_assessment')}")).scalar()) + 1
+        if hashes:
+            ids, values = zip(*hashes)
+            self.hash_ids = np.asarray(ids, dtype=np.int64)
+            self.hash_values = np.asarray(values, dtype=np.int64).view(np.uint64)
+        if assessed:
+            ids, rows = zip(*assessed)
+            self.assessed_ids = np.asarray(ids, dtype=np.int64)
+            self.assessment_ids = np.asarray(rows, dtype=np.int64)
+
+    @staticmethod
+    def _find(sorted_ids, ids):
+        """返回 (下标, 是否存在)"""
+        pos = np.clip(np.searchsorted(sorted_ids, ids), 0, max(len(sorted_ids) - 1, 0))
+        found = (sorted_ids[pos] == ids) if len(sorted_ids) else np.zeros(len(ids), dtype=bool)
+        return pos, found
+
+    def changed(self, sample_ids, hashes):
+        pos, found = self._find(self.hash_ids, sample_ids)
+        same = found & (self.hash_values[pos] == hashes) if len(self.hash_values) else found
+        _, assessed = self._find(self.assessed_ids, sample_ids)
+        return ~(same & assessed)
+
+    def write(self, scores, hashes):
+        """scores 为 QualityScorer.score 的结果，返回写入的行数"""
+        if not len(scores):
+            return 0
+        q = self._q
+        sample_ids = scores['sample_id'].to_numpy(np.int64)
+        pos, found = self._find(self.assessed_ids, sample_ids)
+        ids = np.where(found, self.assessment_ids[pos] if len(self.assessment_ids) else 0, 0)
+        new = ~found
+        ids[new] = np.arange(self.next_id, self.next_id + int(new.sum()))
+        self.next_id += int(new.sum())
+
+        rows = scores.assign(id=ids, assessor=ASSESSOR, created_at=self.scored_at)
+        columns = ['id'] + [c for c in rows.columns if c != 'id']
+        records = rows[columns].astype(object).where(rows[columns].notna(), None).to_dict('records')
+        insert_sql = (f"INSERT INTO {q('soil_quality_assessment')} ({', '.join(q(c) for c in columns)}) "
+                      f"VALUES ({', '.join(f':{c}' for c in columns)})")
+        hash_sql = (f"INSERT INTO {q(HASH_TABLE)} ({q('sample_id')}, {q('input_hash')}, {q('scored_at')}) "
+                    "VALUES (:sample_id, :input_hash, :scored_at)")
+        signed = hashes.view(np.int64)
+        with self.engine.begin() as conn:
+            for start in range(0, len(records), self.batch_size):
+                chunk = sample_ids[start:start + self.batch_size]
+                in_sql = ", ".join(str(i) for i in chunk.tolist())
+                conn.execute(text(f"DELETE FROM {q('soil_quality_assessment')} WHERE {q('sample_id')} IN ({in_sql})"))
+                conn.execute(text(f"DELETE FROM {q(HASH_TABLE)} WHERE {q('sample_id')} IN ({in_sql})"))
+                conn.execute(text(insert_sql), records[start:start + self.batch_size])
+                conn.execute(text(hash_sql), [
+                    {'sample_id': s, 'input_hash': h, 'scored_at': self.scored_at}
+                    for s, h in zip(chunk.tolist(), signed[start:start + self.batch_size].tolist())])
+        return len(records)
+
+
+# ----------------------------------------------------------------------
+# 命令行
+# ----------------------------------------------------------------------
+
+def _synthetic_frames(n, chunk_rows, type_count, rng):
+    """随机数据：取值范围与生成数据一致，20%的样本没有微量元素"""
+    ranges = {
+        'ph_value': (4.5, 9.0), 'organic_matter': (0.8, 4.5), 'total_nitrogen': (500, 2500),
+        'available_phosphorus': (5, 80), 'available_potassium': (50, 300), 'available_nitrogen': (20, 150),
+        'cation_exchange_capacity': (8, 35), 'salinity': (0.1, 5.0), 'moisture_content': (10, 40),
+        'bulk_density': (1.1, 1.6), 'porosity': (35, 60), 'iron': (10, 300), 'manganese': (5, 150),
+        'zinc': (0.5, 15), 'copper': (0.2, 8), 'boron': (0.1, 2.0), 'molybdenum': (0.05, 1.5),
+    }
+    for start in range(0, n, chunk_rows):
+        size = min(chunk_rows, n - start)
+        frame = {'sample_id': np.arange(start + 1, start + size + 1),
+                 'soil_type_id': rng.integers(1, type_count + 1, size),
+                 'test_date': '2024-05-01'}
+        without_trace = rng.random(size) < 0.2
+        for field, (lo, hi) in ranges.items():
+            values = rng.uniform(lo, hi, size).round(2)
+            if field in TRACE_FIELDS:
+                values[without_trace] = np.nan
+            frame[field] = values
+        yield pd.DataFrame(frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="由检测数据计算土壤质量评分并写入 soil_quality_assessment")
+    parser.add_argument('--url', help="数据库连接URL")
+    parser.add_argument('--data-dir', default='data', help="不指定 --url 时读取的CSV目录")
+    parser.add_argument('--rules', help="覆盖隶属函数和权重的JSON文件")
+    parser.add_argument('--full', action='store_true', help="忽略输入哈希，全部样本重新评分")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="每块读取的行数")
+    parser.add_argument('--output', help="把评分结果写成CSV")
+    parser.add_argument('--dry-run', action='store_true', help="只统计，不写入数据库")
+    parser.add_argument('--synthetic', type=int, default=0, help="用N个随机样本测试吞吐量")
+    args = parser.parse_args()
+
+    rules = None
+    if args.rules:
+        with open(args.rules, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+
+    engine = writer = None
+    if args.url and not args.synthetic:
+        from sqlalchemy import create_engine
+        engine = create_engine(args.url)
+    soil_types = load_soil_types(engine, args.data_dir)
+    scorer = QualityScorer(soil_types, rules)
+    if engine is not None and not args.dry_run:
+        writer = QualityWriter(engine)
+        writer.load()
+
+    if args.synthetic:
+        frames = _synthetic_frames(args.synthetic, args.chunk_rows, len(soil_types), np.random.default_rng(42))
+    elif engine is not None:
+        frames = read_database(engine, args.chunk_rows)
+    else:
+        frames = read_csv(args.data_dir, args.chunk_rows)
+
+    start = time.time()
+    total = scored = written = 0
+    grades = {}
+    collected = []
+    for frame in frames:
+        total += len(frame)
+        if writer is not None and not args.full:
+            hashes = scorer.input_hashes(frame)
+            changed = writer.changed(frame['sample_id'].to_numpy(np.int64), hashes)
+            frame, hashes = frame[changed], hashes[changed]
+        elif writer is not None:
+            hashes = scorer.input_hashes(frame)
+        if not len(frame):
+            continue
+        scores = scorer.score(frame)
+        scored += len(scores)
+        for grade, count in scores['comprehensive_grade'].value_counts().items():
+            grades[grade] = grades.get(grade, 0) + int(count)
+        if writer is not None:
+            written += writer.write(scores, hashes)
+        if args.output:
+            collected.append(scores)
+    elapsed = time.time() - start
+
+    print(f"🧮 样本 {total:,} 个，重新评分 {scored:,} 个，耗时 {elapsed:.2f}s"
+          f"（{total / max(elapsed, 1e-9) * 60 / 1e6:,.1f} 百万样本/分钟）")
+    if grades:
+        order = [grade for _, grade in GRADE_BOUNDS] + [LOWEST_GRADE]
+        print("    等级: " + "  ".join(f"{g} {grades.get(g, 0):,}" for g in order))
+    if writer is not None:
+        print(f"    💾 写入 soil_quality_assessment {written:,} 条")
+    if args.output:
+        result = pd.concat(collected, ignore_index=True) if collected else pd.DataFrame()
+        result.to_csv(args.output, index=False, encoding='utf-8')
+        print(f"💾 已写入 {args.output}")
+    if engine is not None:
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 空间索引
+为土壤样本和监测站点的坐标提供 视口范围 / 半径 / 最近邻 查询。
+
+    geohash 列   - 装载时由经纬度计算并写入 soil_samples、monitoring_stations 的 geohash 列，
+                   同一前缀的点在空间上相邻，SQL可以按前缀区间做索引范围扫描
+    PointIndex   - 内存中的STR打包R树（NumPy数组实现），千万级点的查询在毫秒级完成
+
+用法:
+    python spatial_index.py --url sqlite:///soil_data.db --bbox 30 110 32 112
+    python spatial_index.py --url ... --station ST0001 --radius 20
+    python spatial_index.py --synthetic 10000000        # 用随机点测试建树和查询耗时
+"""
+
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9          # 约 4.8m × 4.8m
+EARTH_RADIUS_KM = 6371.0088
+# 与 haversine_km 使用同一地球半径，否则预筛矩形会比圆小
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# 预筛矩形的相对余量，抵消浮点舍入
+BBOX_MARGIN = 1e-6
+
+# 建立内存索引的表
+SPATIAL_TABLES = ('soil_samples', 'monitoring_stations')
+
+
+# ----------------------------------------------------------------------
+# geohash
+# ----------------------------------------------------------------------
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """经纬度编码为geohash（经度、纬度交替二分，每5位一个字符）"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value = value * 2 + 1
+                lon_lo = mid
+            else:
+                value *= 2
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = value * 2 + 1
+                lat_lo = mid
+            else:
+                value *= 2
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def geohash_bbox(geohash):
+    """geohash 对应的矩形 (min_lat, min_lon, max_lat, max_lon)"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+def geohash_from_text(lat_text, lon_text):
+    """装载时的派生列：由CSV中的经纬度文本计算geohash，坐标缺失时为NULL"""
+    if not lat_text or not lon_text:
+        return None
+    return geohash_encode(float(lat_text), float(lon_text))
+
+
+def geohash_cell_size(precision):
+    """某一精度的geohash格子的 (纬度跨度, 经度跨度)"""
+    lat_bits = precision * 5 // 2
+    lon_bits = precision * 5 - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_cover(min_lat, min_lon, max_lat, max_lon, max_cells=32):
+    """
+    覆盖矩形的geohash前缀集合：选择格子数不超过 max_cells 的最高精度，
+    每个前缀对应SQL中的一个区间 geohash BETWEEN 前缀 AND 前缀+'zzz...'
+    """
+    precision = 1
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        dlat, dlon = geohash_cell_size(p)
+        rows = math.floor(max_lat / dlat) - math.floor(min_lat / dlat) + 1
+        cols = math.floor(max_lon / dlon) - math.floor(min_lon / dlon) + 1
+        if rows * cols <= max_cells:
+            precision = p
+            break
+    dlat, dlon = geohash_cell_size(precision)
+    cells = set()
+    lat = min_lat
+    while lat <= max_lat + dlat:
+        lon = min_lon
+        while lon <= max_lon + dlon:
+            cells.add(geohash_encode(min(lat, max_lat), min(lon, max_lon), precision))
+            lon += dlon
+        lat += dlat
+    return sorted(cells)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """球面距离（公里），参数可以是标量或NumPy数组"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def radius_bbox(lat, lon, radius_km):
+    """
+    包含以 (lat, lon) 为圆心、radius_km 为半径的圆的经纬度矩形
+
+    圆在靠近极点一侧的经度跨度最大，经度半宽按矩形内绝对值最大的纬度计算；
+    圆覆盖极点时经度不做限制
+    """
+    dlat = radius_km / KM_PER_DEGREE * (1 + BBOX_MARGIN)
+    edge_lat = abs(lat) + dlat
+    if edge_lat >= 90:
+        dlon = 180.0
+    else:
+        dlon = min(radius_km / (KM_PER_DEGREE * math.cos(math.radians(edge_lat))) * (1 + BBOX_MARGIN), 180.0)
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+# ----------------------------------------------------------------------
+# STR打包R树
+# ----------------------------------------------------------------------
+
+def _str_order(x, y, node_size):
+    """Sort-Tile-Recursive 排序：先按x切成若干竖条，条内按y排序，相邻的 node_size 个元素打包为一个节点"""
+    n = len(x)
+    if not n:
+        return np.empty(0, dtype=np.int64)
+    leaves = math.ceil(n / node_size)
+    slices = math.ceil(math.sqrt(leaves))
+    # 每个竖条包含整数个节点，节点不跨竖条
+    per_slice = math.ceil(leaves / slices) * node_size
+    by_x = np.argsort(x, kind='stable')
+    order = np.empty(n, dtype=np.int64)
+    for start in range(0, n, per_slice):
+        part = by_x[start:start + per_slice]
+        order[start:start + len(part)] = part[np.argsort(y[part], kind='stable')]
+    return order
+
+
+def _pack(min_x, min_y, max_x, max_y, node_size):
+    """把一层的元素每 node_size 个打包为上一层节点，返回上一层的外包矩形和子节点区间"""
+    n = len(min_x)
+    starts = np.arange(0, n, node_size)
+    ends = np.minimum(starts + node_size, n)
+    return (np.minimum.reduceat(min_x, starts), np.minimum.reduceat(min_y, starts),
+            np.maximum.reduceat(max_x, starts), np.maximum.reduceat(max_y, starts), starts, ends)
+
+
+def _expand(starts, ends):
+    """把若干 [start, end) 区间展开为下标数组"""
+    counts = ends - starts
+    total = int(counts.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(total)
+
+
+class PointIndex:
+    """
+    点集上的静态R树
+
+    点按STR顺序重排后连续存放，每层节点保存外包矩形和子节点区间，
+    查询时逐层用NumPy向量化筛选与查询矩形相交的节点
+    """
+
+    def __init__(self, ids, lats, lons, node_size=64):
+        ids = np.asarray(ids, dtype=np.int64)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        valid = ~(np.isnan(lats) | np.isnan(lons))
+        ids, lats, lons = ids[valid], lats[valid], lons[valid]
+        self.node_size = node_size
+        order = _str_order(lons, lats, node_size)
+        self.ids, self.lats, self.lons = ids[order], lats[order], lons[order]
+        # levels[0] 为叶子层（子区间指向点），levels[-1] 为根层
+        self.levels = []
+        if not len(self.ids):
+            return
+        # 点集覆盖范围（公里），用于估计最近邻查询的初始半径
+        self.span_km = max(np.ptp(self.lats), np.ptp(self.lons), 1e-6) * KM_PER_DEGREE
+        level = _pack(self.lons, self.lats, self.lons, self.lats, node_size)
+        self.levels.append(level)
+        while len(level[0]) > 1:
+            min_x, min_y, max_x, max_y, starts, ends = level
+            order = _str_order((min_x + max_x) / 2, (min_y + max_y) / 2, node_size)
+            # 重排当前层节点，使上一层的子节点区间连续
+            level = tuple(a[order] for a in level)
+            self.levels[-1] = level
+            level = _pack(*level[:4], node_size)
+            self.levels.append(level)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _bbox_positions(self, min_lat, min_lon, max_lat, max_lon):
+        """与矩形相交的点在重排数组中的下标"""
+        if not self.levels:
+            return np.empty(0, dtype=np.int64)
+        nodes = np.arange(len(self.levels[-1][0]))
+        for min_x, min_y, max_x, max_y, starts, ends in reversed(self.levels):
+            hit = nodes[(min_x[nodes] <= max_lon) & (max_x[nodes] >= min_lon)
+                        & (min_y[nodes] <= max_lat) & (max_y[nodes] >= min_lat)]
+            nodes = _expand(starts[hit], ends[hit])
+        lats, lons = self.lats[nodes], self.lons[nodes]
+        return nodes[(lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)]
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """矩形（视口）内的点id"""
+        return self.ids[self._bbox_positions(min_lat, min_lon, max_lat, max_lon)]
+
+    def radius(self, lat, lon, radius_km):
+        """距 (lat, lon) 不超过 radius_km 公里的点，返回 (id数组, 距离数组)，按距离升序"""
+        positions = self._bbox_positions(*radius_bbox(lat, lon, radius_km))
+        distances = haversine_km(lat, lon, self.lats[positions], self.lons[positions])
+        keep = distances <= radius_km
+        positions, distances = positions[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return self.ids[positions[order]], distances[order]
+
+    def nearest(self, lat, lon, k=10):
+        """距 (lat, lon) 最近的 k 个点，返回 (id数组, 距离数组)"""
+        if not len(self.ids):
+            return self.ids[:0], np.empty(0)
+        k = min(k, len(self.ids))
+        # 按平均密度估计初始半径，候选不足时加倍
+        radius_km = max(self.span_km * math.sqrt(k / len(self.ids)), 0.01)
+        while True:
+            positions = self._bbox_positions(*radius_bbox(lat, lon, radius_km))
+            if len(positions) >= k or len(positions) == len(self.ids):
+                break
+            radius_km *= 2
+        # 矩形内的第k近距离可能超过矩形的内切圆，按该距离再查一次保证结果精确
+        distances = haversine_km(lat, lon, self.lats[positions], self.lons[positions])
+        kth = np.partition(distances, k - 1)[k - 1]
+        if kth > radius_km:
+            ids, distances = self.radius(lat, lon, kth)
+            return ids[:k], distances[:k]
+        order = np.argsort(distances, kind='stable')[:k]
+        return self.ids[positions[order]], distances[order]
+
+
+# ----------------------------------------------------------------------
+# 数据库中的样本与站点
+# ----------------------------------------------------------------------
+
+class SpatialIndex:
+    """soil_samples 和 monitoring_stations 的内存空间索引，以及按geohash列的SQL范围查询"""
+
+    def __init__(self, engine, node_size=64):
+        self.engine = engine
+        self.node_size = node_size
+        self.indexes = {}
+
+    def _q(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def build(self, tables=SPATIAL_TABLES, fetch_size=100000):
+        """从数据库读取坐标建立内存索引，返回 {表名: 点数}"""
+        for table_name in tables:
+            ids, lats, lons = [], [], []
+            with self.engine.connect() as conn:
+                result = conn.execution_options(stream_results=True).execute(text(
+                    f"SELECT {self._q('id')}, {self._q('latitude')}, {self._q('longitude')} "
+                    f"FROM {self._q(table_name)} "
+                    f"WHERE {self._q('latitude')} IS NOT NULL AND {self._q('longitude')} IS NOT NULL"))
+                while True:
+                    rows = result.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for row_id, lat, lon in rows:
+                        ids.append(row_id)
+                        lats.append(float(lat))
+                        lons.append(float(lon))
+            self.indexes[table_name] = PointIndex(ids, lats, lons, self.node_size)
+        return {t: len(index) for t, index in self.indexes.items()}
+
+    def bbox(self, table_name, min_lat, min_lon, max_lat, max_lon):
+        return self.indexes[table_name].bbox(min_lat, min_lon, max_lat, max_lon)
+
+    def radius(self, table_name, lat, lon, radius_km):
+        return self.indexes[table_name].radius(lat, lon, radius_km)
+
+    def nearest(self, table_name, lat, lon, k=10):
+        return self.indexes[table_name].nearest(lat, lon, k)
+
+    def station_location(self, station_code):
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                f"SELECT {self._q('latitude')}, {self._q('longitude')} FROM {self._q('monitoring_stations')} "
+                f"WHERE {self._q('station_code')} = :code"), {'code': station_code}).first()
+        if row is None or row[0] is None:
+            raise KeyError(f"站点 {station_code} 不存在或没有坐标")
+        return float(row[0]), float(row[1])
+
+    def samples_near_station(self, station_code, radius_km):
+        """某个监测站点 radius_km 公里内的样本，返回 (样本id数组, 距离数组)"""
+        lat, lon = self.station_location(station_code)
+        return self.radius('soil_samples', lat, lon, radius_km)
+
+    def bbox_sql(self, table_name, min_lat, min_lon, max_lat, max_lon, max_cells=32):
+        """
+        不依赖内存索引的SQL视口查询：按geohash前缀区间扫描索引，再用经纬度精确过滤。
+        返回 (SQL, 参数)
+        """
+        prefixes = geohash_cover(min_lat, min_lon, max_lat, max_lon, max_cells)
+        params = {'min_lat': min_lat, 'max_lat': max_lat, 'min_lon': min_lon, 'max_lon': max_lon}
+        ranges = []
+        for i, prefix in enumerate(prefixes):
+            params[f"lo{i}"] = prefix
+            params[f"hi{i}"] = prefix + 'z' * (GEOHASH_PRECISION - len(prefix))
+            ranges.append(f"{self._q('geohash')} BETWEEN :lo{i} AND :hi{i}")
+        lat, lon = self._q('latitude'), self._q('longitude')
+        sql = (f"SELECT {self._q('id')} FROM {self._q(table_name)} WHERE ({' OR '.join(ranges)}) "
+               f"AND {lat} BETWEEN :min_lat AND :max_lat AND {lon} BETWEEN :min_lon AND :max_lon")
+        return sql, params
+
+
+def _benchmark(n, queries=200, checks=20):
+    """随机点上的建树和查询耗时，并抽取 checks 次查询与逐点计算的结果核对，返回不一致的数量"""
+    rng = np.random.default_rng(42)
+    lats = rng.uniform(18, 53, n)
+    lons = rng.uniform(73, 135, n)
+    start = time.time()
+    index = PointIndex(np.arange(n), lats, lons)
+    print(f"🌲 {n:,} 个点建树耗时 {time.time() - start:.2f}s，{len(index.levels)} 层")
+    centers = rng.uniform((20, 80), (50, 130), (queries, 2))
+    for name, run in (
+        ('视口 0.5°×0.5°', lambda lat, lon: index.bbox(lat, lon, lat + 0.5, lon + 0.5)),
+        ('半径 10km', lambda lat, lon: index.radius(lat, lon, 10)),
+        ('最近 10 个', lambda lat, lon: index.nearest(lat, lon, 10)),
+    ):
+        start = time.time()
+        found = 0
+        for lat, lon in centers:
+            result = run(lat, lon)
+            found += len(result[0] if isinstance(result, tuple) else result)
+        elapsed = (time.time() - start) / queries * 1000
+        print(f"  {name}: 平均 {elapsed:.2f}ms/次，平均返回 {found / queries:,.0f} 个点")
+    radius_misses, nearest_misses = _verify(index, np.arange(n), lats, lons, centers[:checks])
+    print(f"🔍 对照逐点haversine检查 {min(checks, queries)} 次查询: 半径查询漏检 {radius_misses} 个点，"
+          f"最近邻不一致 {nearest_misses} 次")
+    return radius_misses + nearest_misses
+
+
+def _verify(index, ids, lats, lons, centers, radius_km=10, k=10):
+    """用逐点计算haversine距离的结果核对半径和最近邻查询，返回 (半径查询漏检的点数, 最近邻距离不一致的查询数)"""
+    radius_misses = nearest_misses = 0
+    for lat, lon in centers:
+        distances = haversine_km(lat, lon, lats, lons)
+        expected = set(ids[distances <= radius_km].tolist())
+        found = set(index.radius(lat, lon, radius_km)[0].tolist())
+        radius_misses += len(expected - found)
+        kth = np.sort(distances)[:k]
+        if not np.allclose(index.nearest(lat, lon, k)[1], kth, rtol=0, atol=1e-9):
+            nearest_misses += 1
+    return radius_misses, nearest_misses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="样本和监测站点的空间查询")
+    parser.add_argument('--url', help="数据库连接URL")
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('MIN_LAT', 'MIN_LON', 'MAX_LAT', 'MAX_LON'),
+                        help="查询矩形范围内的样本")
+    parser.add_argument('--station', help="查询该站点附近的样本")
+    parser.add_argument('--radius', type=float, default=10.0, help="半径（公里）")
+    parser.add_argument('--nearest', type=int, default=0, help="查询站点最近的N个样本")
+    parser.add_argument('--synthetic', type=int, default=0, help="用N个随机点测试性能")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        return 1 if _benchmark(args.synthetic) else 0
+    if not args.url:
+        parser.error("需要 --url 或 --synthetic")
+
+    from sqlalchemy import create_engine
+    engine = create_engine(args.url)
+    index = SpatialIndex(engine)
+    start = time.time()
+    counts = index.build()
+    print("🌲 建立空间索引: " + ", ".join(f"{t} {n:,}" for t, n in counts.items())
+          + f"，耗时 {time.time() - start:.2f}s")
+
+    if args.bbox:
+        start = time.time()
+        ids = index.bbox('soil_samples', *args.bbox)
+        print(f"🗺️  矩形内样本 {len(ids):,} 个（内存索引 {(time.time() - start) * 1000:.2f}ms）")
+        sql, params = index.bbox_sql('soil_samples', *args.bbox)
+        start = time.time()
+        with engine.connect() as conn:
+            sql_ids = {row_id for (row_id,) in conn.execute(text(sql), params)}
+        print(f"   geohash区间扫描 {len(sql_ids):,} 个（SQL {(time.time() - start) * 1000:.2f}ms）")
+    if args.station:
+        lat, lon = index.station_location(args.station)
+        ids, distances = index.radius('soil_samples', lat, lon, args.radius)
+        print(f"📍 站点 {args.station} ({lat:.4f}, {lon:.4f}) {args.radius:g}km 内样本 {len(ids):,} 个")
+        if args.nearest:
+            ids, distances = index.nearest('soil_samples', lat, lon, args.nearest)
+            for row_id, distance in zip(ids, distances):
+                print(f"    样本 {row_id}: {distance:.2f}km")
+    engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 数据库表结构定义
+与 generate_csv_data.py 生成的CSV文件一一对应，供数据装载器使用
+"""
+
+import re
+
+# 每张表的定义：
+#   columns      - [(列名, 列类型)]，列顺序与CSV表头一致
+#   primary_key  - 主键列
+#   indexes      - {索引名: [列名, ...]}
+#   foreign_keys - [(列名, 引用表, 引用列)]
+#   partition_column - （可选）按月RANGE分区的日期列，用于随时间增长、查询按日期窗口过滤的表
+#   domains      - （可选）{列名: [取值, ...]}，业务上固定的取值集合，schema_profiler 据此生成ENUM
+#   ranges       - （可选）{列名: (最小值, 最大值)}，整数列业务上的取值范围，schema_profiler 据此收窄整数类型
+TABLE_SCHEMAS = {
+    'regions': {
+        'columns': [
+            ('id', 'INT'),
+            ('region_code', 'VARCHAR(20)'),
+            ('province', 'VARCHAR(50)'),
+            ('city', 'VARCHAR(50)'),
+            ('county', 'VARCHAR(50)'),
+            ('level', 'INT'),
+            ('parent_id', 'INT'),
+            ('latitude', 'DOUBLE'),
+            ('longitude', 'DOUBLE'),
+            ('created_at', 'DATETIME'),
+            ('updated_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_regions_province': ['province'],
+            'idx_regions_parent': ['parent_id'],
+        },
+        'foreign_keys': [('parent_id', 'regions', 'id')],
+        'ranges': {'level': (1, 5)},
+    },
+    'soil_types': {
+        'columns': [
+            ('id', 'INT'),
+            ('type_code', 'VARCHAR(20)'),
+            ('type_name', 'VARCHAR(50)'),
+            ('description', 'TEXT'),
+            ('optimal_ph_min', 'DECIMAL(4,2)'),
+            ('optimal_ph_max', 'DECIMAL(4,2)'),
+            ('typical_regions', 'VARCHAR(255)'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_soil_types_name': ['type_name'],
+        },
+        'foreign_keys': [],
+    },
+    'crop_types': {
+        'columns': [
+            ('id', 'INT'),
+            ('crop_code', 'VARCHAR(20)'),
+            ('crop_name', 'VARCHAR(100)'),
+            ('category', 'VARCHAR(50)'),
+            ('suitable_ph_min', 'DECIMAL(4,2)'),
+            ('suitable_ph_max', 'DECIMAL(4,2)'),
+            ('growing_season', 'VARCHAR(100)'),
+            ('nutrient_requirements', 'JSON'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_crop_types_category': ['category'],
+        },
+        'foreign_keys': [],
+    },
+    'fertilizer_products': {
+        'columns': [
+            ('id', 'INT'),
+            ('product_code', 'VARCHAR(20)'),
+            ('product_name', 'VARCHAR(100)'),
+            ('manufacturer', 'VARCHAR(100)'),
+            ('fertilizer_type', 'VARCHAR(50)'),
+            ('nitrogen_content', 'DECIMAL(5,2)'),
+            ('phosphorus_content', 'DECIMAL(5,2)'),
+            ('potassium_content', 'DECIMAL(5,2)'),
+            ('trace_elements', 'JSON'),
+            ('application_method', 'VARCHAR(50)'),
+            ('price_per_ton', 'DECIMAL(10,2)'),
+            ('shelf_life', 'INT'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_fertilizer_products_type': ['fertilizer_type'],
+        },
+        'foreign_keys': [],
+    },
+    'data_dictionary': {
+        'columns': [
+            ('id', 'INT'),
+            ('dict_type', 'VARCHAR(50)'),
+            ('dict_code', 'VARCHAR(100)'),
+            ('dict_label', 'VARCHAR(100)'),
+            ('dict_value', 'VARCHAR(100)'),
+            ('dict_sort', 'INT'),
+            ('css_class', 'VARCHAR(100)'),
+            ('list_class', 'VARCHAR(100)'),
+            ('is_default', 'CHAR(1)'),
+            ('status', 'CHAR(1)'),
+            ('created_at', 'DATETIME'),
+            ('updated_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_data_dictionary_type': ['dict_type'],
+        },
+        'foreign_keys': [],
+    },
+    'users': {
+        'columns': [
+            ('id', 'INT'),
+            ('username', 'VARCHAR(50)'),
+            ('password_hash', 'VARCHAR(64)'),
+            ('email', 'VARCHAR(100)'),
+            ('phone', 'VARCHAR(20)'),
+            ('real_name', 'VARCHAR(50)'),
+            ('organization', 'VARCHAR(100)'),
+            ('role', 'VARCHAR(20)'),
+            ('region_id', 'INT'),
+            ('permissions', 'JSON'),
+            ('last_login_time', 'DATETIME'),
+            ('login_count', 'INT'),
+            ('status', 'VARCHAR(20)'),
+            ('created_at', 'DATETIME'),
+            ('updated_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_users_username': ['username'],
+            'idx_users_region': ['region_id'],
+        },
+        'foreign_keys': [('region_id', 'regions', 'id')],
+    },
+    'monitoring_stations': {
+        'columns': [
+            ('id', 'INT'),
+            ('station_code', 'VARCHAR(20)'),
+            ('station_name', 'VARCHAR(200)'),
+            ('region_id', 'INT'),
+            ('latitude', 'DOUBLE'),
+            ('longitude', 'DOUBLE'),
+            ('altitude', 'INT'),
+            ('station_type', 'VARCHAR(20)'),
+            ('soil_type_id', 'INT'),
+            ('establishment_date', 'DATE'),
+            ('equipment_list', 'JSON'),
+            ('monitoring_frequency', 'VARCHAR(20)'),
+            ('responsible_person', 'VARCHAR(50)'),
+            ('contact_info', 'VARCHAR(50)'),
+            ('status', 'VARCHAR(20)'),
+            ('created_at', 'DATETIME'),
+            ('geohash', 'VARCHAR(12)'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_monitoring_stations_code': ['station_code'],
+            'idx_monitoring_stations_region': ['region_id'],
+            'idx_monitoring_stations_geohash': ['geohash', 'latitude', 'longitude', 'id'],
+        },
+        'derived_columns': {'geohash': ('geohash', ['latitude', 'longitude'])},
+        'foreign_keys': [
+            ('region_id', 'regions', 'id'),
+            ('soil_type_id', 'soil_types', 'id'),
+        ],
+        # 海拔（米）
+        'ranges': {'altitude': (-500, 9000)},
+    },
+    'soil_samples': {
+        'columns': [
+            ('id', 'INT'),
+            ('sample_code', 'VARCHAR(30)'),
+            ('region_id', 'INT'),
+            ('soil_type_id', 'INT'),
+            ('latitude', 'DOUBLE'),
+            ('longitude', 'DOUBLE'),
+            ('altitude', 'INT'),
+            ('sampling_date', 'DATE'),
+            ('sampling_depth', 'INT'),
+            ('land_use_type', 'VARCHAR(20)'),
+            ('crop_id', 'INT'),
+            ('sampler_name', 'VARCHAR(50)'),
+            ('created_at', 'DATETIME'),
+            ('geohash', 'VARCHAR(12)'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            # 看板查询（utils/database.js）的覆盖索引：按地区/土壤类型统计、按采样日期范围和排序，
+            # 显式包含id，使与soil_test_data的关联只读索引
+            'idx_soil_samples_region': ['region_id', 'id'],
+            'idx_soil_samples_soil_type': ['soil_type_id', 'id'],
+            'idx_soil_samples_date': ['sampling_date', 'region_id', 'soil_type_id', 'id'],
+            # 地图视口查询按geohash前缀区间扫描，索引内带坐标用于精确过滤
+            'idx_soil_samples_geohash': ['geohash', 'latitude', 'longitude', 'id'],
+        },
+        # 装载时由其他列计算的派生列 {列名: (派生函数名, 来源列)}，见 csv_stream_reader.DERIVED_FUNCTIONS
+        'derived_columns': {'geohash': ('geohash', ['latitude', 'longitude'])},
+        'foreign_keys': [
+            ('region_id', 'regions', 'id'),
+            ('soil_type_id', 'soil_types', 'id'),
+            ('crop_id', 'crop_types', 'id'),
+        ],
+        'partition_column': 'sampling_date',
+        # 海拔（米）、采样深度（厘米）
+        'ranges': {'altitude': (-500, 9000), 'sampling_depth': (0, 200)},
+    },
+    'soil_test_data': {
+        'columns': [
+            ('id', 'INT'),
+            ('sample_id', 'INT'),
+            ('ph_value', 'DECIMAL(4,2)'),
+            ('organic_matter', 'DECIMAL(6,2)'),
+            ('total_nitrogen', 'DECIMAL(10,2)'),
+            ('available_phosphorus', 'DECIMAL(10,2)'),
+            ('available_potassium', 'DECIMAL(10,2)'),
+            ('available_nitrogen', 'DECIMAL(10,2)'),
+            ('cation_exchange_capacity', 'DECIMAL(10,2)'),
+            ('salinity', 'DECIMAL(6,2)'),
+            ('moisture_content', 'DECIMAL(6,2)'),
+            ('bulk_density', 'DECIMAL(4,2)'),
+            ('porosity', 'DECIMAL(6,2)'),
+            ('test_date', 'DATE'),
+            ('test_institution', 'VARCHAR(100)'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            # 看板按样本关联后只读取pH和四项养分，覆盖索引避免回表
+            'idx_soil_test_data_sample': ['sample_id', 'ph_value', 'organic_matter', 'total_nitrogen',
+                                          'available_phosphorus', 'available_potassium'],
+            'idx_soil_test_data_ph': ['ph_value'],
+        },
+        'foreign_keys': [('sample_id', 'soil_samples', 'id')],
+    },
+    'trace_elements': {
+        'columns': [
+            ('id', 'INT'),
+            ('sample_id', 'INT'),
+            ('iron', 'DECIMAL(10,2)'),
+            ('manganese', 'DECIMAL(10,2)'),
+            ('zinc', 'DECIMAL(10,2)'),
+            ('copper', 'DECIMAL(10,2)'),
+            ('boron', 'DECIMAL(10,2)'),
+            ('molybdenum', 'DECIMAL(10,2)'),
+            ('chlorine', 'DECIMAL(10,2)'),
+            ('sulfur', 'DECIMAL(10,2)'),
+            ('calcium', 'DECIMAL(10,2)'),
+            ('magnesium', 'DECIMAL(10,2)'),
+            ('test_date', 'DATE'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_trace_elements_sample': ['sample_id'],
+        },
+        'foreign_keys': [('sample_id', 'soil_samples', 'id')],
+    },
+    'soil_quality_assessment': {
+        'columns': [
+            ('id', 'INT'),
+            ('sample_id', 'INT'),
+            ('fertility_score', 'DECIMAL(5,2)'),
+            ('ph_score', 'DECIMAL(5,2)'),
+            ('organic_matter_score', 'DECIMAL(5,2)'),
+            ('nutrient_score', 'DECIMAL(5,2)'),
+            ('physical_property_score', 'DECIMAL(5,2)'),
+            ('comprehensive_grade', 'VARCHAR(10)'),
+            ('limiting_factors', 'TEXT'),
+            ('improvement_suggestions', 'TEXT'),
+            ('assessment_date', 'DATE'),
+            ('assessor', 'VARCHAR(50)'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_soil_quality_assessment_sample': ['sample_id'],
+            'idx_soil_quality_assessment_grade': ['comprehensive_grade'],
+        },
+        'foreign_keys': [('sample_id', 'soil_samples', 'id')],
+        'domains': {'comprehensive_grade': ['优', '良', '中', '差']},
+    },
+    'crop_suitability': {
+        'columns': [
+            ('id', 'INT'),
+            ('sample_id', 'INT'),
+            ('crop_id', 'INT'),
+            ('suitability_score', 'DECIMAL(5,2)'),
+            ('suitability_level', 'VARCHAR(20)'),
+            ('limiting_factors', 'JSON'),
+            ('yield_potential', 'DECIMAL(10,2)'),
+            ('risk_assessment', 'VARCHAR(100)'),
+            ('management_recommendations', 'TEXT'),
+            ('assessment_date', 'DATE'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_crop_suitability_sample': ['sample_id'],
+            'idx_crop_suitability_crop': ['crop_id'],
+        },
+        'foreign_keys': [
+            ('sample_id', 'soil_samples', 'id'),
+            ('crop_id', 'crop_types', 'id'),
+        ],
+        # 与 crop_suitability.LEVEL_BOUNDS 的等级一致
+        'domains': {'suitability_level': ['高度适宜', '中度适宜', '勉强适宜', '不适宜']},
+    },
+    'fertilizer_plans': {
+        'columns': [
+            ('id', 'INT'),
+            ('sample_id', 'INT'),
+            ('crop_id', 'INT'),
+            ('plan_name', 'VARCHAR(200)'),
+            ('target_yield', 'DECIMAL(10,2)'),
+            ('base_fertilizer', 'JSON'),
+            ('topdressing_plan', 'JSON'),
+            ('total_cost', 'DECIMAL(10,2)'),
+            ('expected_benefit', 'DECIMAL(10,2)'),
+            ('application_instructions', 'TEXT'),
+            ('created_date', 'DATE'),
+            ('creator', 'VARCHAR(50)'),
+            ('status', 'VARCHAR(20)'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_fertilizer_plans_sample': ['sample_id'],
+            'idx_fertilizer_plans_crop': ['crop_id'],
+        },
+        'foreign_keys': [
+            ('sample_id', 'soil_samples', 'id'),
+            ('crop_id', 'crop_types', 'id'),
+        ],
+    },
+    'historical_monitoring_data': {
+        'columns': [
+            ('id', 'INT'),
+            ('station_id', 'INT'),
+            ('monitoring_date', 'DATE'),
+            ('ph_value', 'DECIMAL(4,2)'),
+            ('organic_matter', 'DECIMAL(6,2)'),
+            ('available_nitrogen', 'DECIMAL(10,2)'),
+            ('available_phosphorus', 'DECIMAL(10,2)'),
+            ('available_potassium', 'DECIMAL(10,2)'),
+            ('moisture_content', 'DECIMAL(6,2)'),
+            ('temperature', 'DECIMAL(6,2)'),
+            ('salinity', 'DECIMAL(6,2)'),
+            ('compaction_degree', 'DECIMAL(6,2)'),
+            ('weather_conditions', 'VARCHAR(20)'),
+            ('crop_growth_stage', 'VARCHAR(20)'),
+            ('data_quality', 'VARCHAR(20)'),
+            ('remarks', 'TEXT'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            # 覆盖看板的站点历史曲线查询
+            'idx_historical_monitoring_data_station': ['station_id', 'monitoring_date', 'ph_value',
+                                                       'organic_matter', 'moisture_content', 'temperature'],
+        },
+        'foreign_keys': [('station_id', 'monitoring_stations', 'id')],
+        'partition_column': 'monitoring_date',
+    },
+    'operation_logs': {
+        'columns': [
+            ('id', 'INT'),
+            ('user_id', 'INT'),
+            ('operation_type', 'VARCHAR(20)'),
+            ('target_table', 'VARCHAR(50)'),
+            ('target_id', 'INT'),
+            ('operation_description', 'VARCHAR(255)'),
+            ('ip_address', 'VARCHAR(45)'),
+            ('user_agent', 'VARCHAR(500)'),
+            ('operation_time', 'DATETIME'),
+            ('execution_time', 'DECIMAL(8,3)'),
+            ('result_status', 'VARCHAR(10)'),
+            ('error_message', 'TEXT'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_operation_logs_user': ['user_id'],
+            'idx_operation_logs_time': ['operation_time'],
+        },
+        'foreign_keys': [('user_id', 'users', 'id')],
+        'partition_column': 'operation_time',
+    },
+    'statistical_reports': {
+        'columns': [
+            ('id', 'INT'),
+            ('report_code', 'VARCHAR(30)'),
+            ('report_title', 'VARCHAR(200)'),
+            ('report_type', 'VARCHAR(50)'),
+            ('region_scope', 'JSON'),
+            ('time_period', 'VARCHAR(50)'),
+            ('data_source', 'VARCHAR(100)'),
+            ('analysis_method', 'VARCHAR(50)'),
+            ('key_findings', 'JSON'),
+            ('charts_data', 'JSON'),
+            ('conclusions', 'TEXT'),
+            ('recommendations', 'TEXT'),
+            ('generated_date', 'DATE'),
+            ('generator', 'VARCHAR(50)'),
+            ('review_status', 'VARCHAR(20)'),
+            ('download_count', 'INT'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_statistical_reports_type': ['report_type'],
+        },
+        'foreign_keys': [],
+    },
+    'anomaly_data': {
+        'columns': [
+            ('id', 'INT'),
+            ('data_source', 'VARCHAR(50)'),
+            ('source_id', 'INT'),
+            ('anomaly_type', 'VARCHAR(20)'),
+            ('anomaly_field', 'VARCHAR(50)'),
+            ('original_value', 'VARCHAR(50)'),
+            ('expected_range', 'VARCHAR(50)'),
+            ('severity_level', 'VARCHAR(10)'),
+            ('detection_method', 'VARCHAR(20)'),
+            ('detection_date', 'DATE'),
+            ('handled_status', 'VARCHAR(20)'),
+            ('handler', 'VARCHAR(50)'),
+            ('handle_date', 'DATE'),
+            ('handle_method', 'TEXT'),
+            ('remarks', 'TEXT'),
+            ('created_at', 'DATETIME'),
+        ],
+        'primary_key': 'id',
+        'indexes': {
+            'idx_anomaly_data_source': ['data_source', 'source_id'],
+            'idx_anomaly_data_status': ['handled_status'],
+        },
+        'foreign_keys': [],
+    },
+}
+
+# 按外键依赖关系排列的装载顺序（与 generate_csv_data.py 的生成顺序一致）
+TABLE_LOAD_ORDER = [
+    'regions',
+    'soil_types',
+    'crop_types',
+    'fertilizer_products',
+    'data_dictionary',
+    'users',
+    'monitoring_stations',
+    'soil_samples',
+    'soil_test_data',
+    'trace_elements',
+    'soil_quality_assessment',
+    'crop_suitability',
+    'fertilizer_plans',
+    'historical_monitoring_data',
+    'operation_logs',
+    'statistical_reports',
+    'anomaly_data',
+]
+
+# 允许保存空字符串的文本类列类型
+TEXT_TYPES = ('VARCHAR', 'CHAR', 'TEXT', 'ENUM')
+
+# anomaly_data 的取值，generate_csv_data.py 与 anomaly_detection.py 共用
+# data_source：来源表 -> 记录的名称；人工录入的异常没有来源表
+ANOMALY_SOURCES = {
+    'soil_test_data': 'soil_test_data',
+    'historical_monitoring_data': 'monitoring_data',
+}
+ANOMALY_MANUAL_SOURCE = 'manual_input'
+# anomaly_field：列名 -> 记录的名称，未列出的列按列名记录
+ANOMALY_FIELDS = {
+    'available_nitrogen': 'nitrogen',
+    'available_phosphorus': 'phosphorus',
+    'available_potassium': 'potassium',
+}
+
+
+def column_names(table_name):
+    """返回表的列名列表"""
+    return [name for name, _ in TABLE_SCHEMAS[table_name]['columns']]
+
+
+def column_types(table_name):
+    """返回 {列名: 列类型} 映射"""
+    return dict(TABLE_SCHEMAS[table_name]['columns'])
+
+
+def is_text_type(col_type):
+    """判断列类型是否为文本类型"""
+    return col_type.upper().startswith(TEXT_TYPES)
+
+
+def decimal_spec(col_type):
+    """解析 DECIMAL(p,s)，返回 (p, s)"""
+    precision, _, scale = col_type[col_type.index('(') + 1:col_type.rindex(')')].partition(',')
+    return int(precision), int(scale or 0)
+
+
+def enum_values(col_type):
+    """解析 ENUM('a', 'b') 中的取值"""
+    return [m.replace("''", "'") for m in re.findall(r"'((?:[^']|'')*)'", col_type)]
+
+
+def anomaly_field(column):
+    """返回列在 anomaly_data.anomaly_field 中记录的名称"""
+    return ANOMALY_FIELDS.get(column, column)
+
+
+def partition_column(table_name):
+    """返回表的按月分区列，不分区的表返回None"""
+    return TABLE_SCHEMAS[table_name].get('partition_column')
+
+
+def render_column_type(col_type, dialect):
+    """将通用列类型转换为目标数据库方言的类型"""
+    if col_type.upper().startswith('ENUM') and dialect != 'mysql':
+        # 只有MySQL有内联ENUM类型，其他数据库使用等长的VARCHAR
+        return f"VARCHAR({max(len(v) for v in enum_values(col_type))})"
+    if dialect == 'postgresql':
+        upper = col_type.upper()
+        if upper == 'DATETIME':
+            return 'TIMESTAMP'
+        if upper == 'DOUBLE':
+            return 'DOUBLE PRECISION'
+        if upper == 'TINYINT':
+            return 'SMALLINT'
+        if upper == 'JSON':
+            return 'JSONB'
+    return col_type
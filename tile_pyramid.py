@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+土壤数据管理系统 - 热力图瓦片金字塔
+把土壤样本及其检测指标（pH、有机质、碱解氮、有效磷、速效钾、含盐量）按Web墨卡托瓦片分格汇总，
+每个瓦片划分为 32×32 个格子，每个格子保存点数以及各指标的 计数/均值/最小值/最大值。
+
+    - 只在最高层级扫描一次原始点，低层级由高一层级的格子合并得到
+    - 按分区层级（默认第6级）的瓦片并行构建，各分区最后合并出更低的层级
+    - 结果写入单个瓦片文件，前端按 z/x/y 逐个瓦片读取（server.js 的 /api/tiles/:z/:x/:y）
+
+瓦片文件格式（小端）:
+    8字节标识 SOILTIL1 | uint32 元数据长度 | 元数据JSON |
+    索引项 × N（uint8 z, uint32 x, uint32 y, uint64 偏移, uint32 长度，按 z/x/y 排序）| 瓦片数据（gzip压缩的JSON）
+
+用法:
+    python tile_pyramid.py --url sqlite:///soil_data.db --output static/tiles/soil_heatmap.tiles
+    python tile_pyramid.py --output static/tiles/soil_heatmap.tiles --show 6 52 26
+"""
+
+import argparse
+import gzip
+import json
+import math
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+TILE_ATTRIBUTES = ['ph_value', 'organic_matter', 'available_nitrogen', 'available_phosphorus',
+                   'available_potassium', 'salinity']
+CELLS_PER_TILE = 32            # 256像素的瓦片，每个格子8像素
+MIN_ZOOM = 3
+MAX_ZOOM = 14
+PARTITION_ZOOM = 6
+MAX_LATITUDE = 85.05112878     # Web墨卡托的纬度范围
+
+TILE_MAGIC = b'SOILTIL1'
+INDEX_ENTRY = struct.Struct('<BIIQI')
+
+
+def mercator_cells(lats, lons, zoom):
+    """经纬度转换为某一层级的全局格子坐标 (gx, gy)"""
+    scale = (1 << zoom) * CELLS_PER_TILE
+    lat = np.radians(np.clip(lats, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (lons + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    gx = np.clip((x * scale).astype(np.int64), 0, scale - 1)
+    gy = np.clip((y * scale).astype(np.int64), 0, scale - 1)
+    return gx, gy
+
+
+# ----------------------------------------------------------------------
+# 格子汇总
+# ----------------------------------------------------------------------
+
+class CellStats:
+    """
+    一组格子的汇总值（列式数组）
+
+    gx, gy  - 全局格子坐标
+    count   - 点数
+    n/sum/min/max - 各指标（按 TILE_ATTRIBUTES 排列的二维数组）的非空值个数、和、最小值、最大值
+    """
+
+    def __init__(self, gx, gy, count, n, total, low, high):
+        self.gx, self.gy = gx, gy
+        self.count, self.n, self.sum, self.min, self.max = count, n, total, low, high
+
+    def __len__(self):
+        return len(self.gx)
+
+    @classmethod
+    def from_points(cls, gx, gy, values):
+        """每个点作为一个格子；values 为 点数×指标数 的数组，缺失值为NaN"""
+        present = ~np.isnan(values)
+        return cls(gx, gy, np.ones(len(gx), dtype=np.int64), present.astype(np.int64),
+                   np.where(present, values, 0.0), values, values)
+
+    def grouped(self, shift=0):
+        """
+        合并相同坐标的格子；shift>0 时先把坐标右移（向低层级合并，每级一位）。
+        最小值、最大值用 fmin/fmax，忽略缺失值
+        """
+        gx, gy = self.gx >> shift, self.gy >> shift
+        if not len(gx):
+            return CellStats(gx, gy, self.count, self.n, self.sum, self.min, self.max)
+        order = np.lexsort((gy, gx))
+        gx, gy = gx[order], gy[order]
+        starts = np.flatnonzero(np.r_[True, (gx[1:] != gx[:-1]) | (gy[1:] != gy[:-1])])
+        return CellStats(
+            gx[starts], gy[starts],
+            np.add.reduceat(self.count[order], starts),
+            np.add.reduceat(self.n[order], starts, axis=0),
+            np.add.reduceat(self.sum[order], starts, axis=0),
+            np.fmin.reduceat(self.min[order], starts, axis=0),
+            np.fmax.reduceat(self.max[order], starts, axis=0),
+        )
+
+    @staticmethod
+    def concat(parts):
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            empty = np.empty(0, dtype=np.int64)
+            matrix = np.empty((0, len(TILE_ATTRIBUTES)))
+            return CellStats(empty, empty, empty, matrix.astype(np.int64), matrix, matrix, matrix)
+        return CellStats(*(np.concatenate([getattr(p, a) for p in parts])
+                           for a in ('gx', 'gy', 'count', 'n', 'sum', 'min', 'max')))
+
+    def take(self, index):
+        return CellStats(self.gx[index], self.gy[index], self.count[index], self.n[index],
+                         self.sum[index], self.min[index], self.max[index])
+
+    def tiles(self):
+        """按瓦片拆分：产出 ((x, y), 瓦片内的格子)"""
+        tx, ty = self.gx // CELLS_PER_TILE, self.gy // CELLS_PER_TILE
+        order = np.lexsort((ty, tx))
+        tx, ty = tx[order], ty[order]
+        starts = np.flatnonzero(np.r_[True, (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1])]) if len(tx) else []
+        bounds = list(starts) + [len(order)]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            yield (int(tx[start]), int(ty[start])), self.take(order[start:end])
+
+
+def tile_fields():
+    """瓦片中每个格子的字段顺序（写入瓦片文件元数据）"""
+    fields = ['cx', 'cy', 'count']
+    for attr in TILE_ATTRIBUTES:
+        fields += [f"{attr}_n", f"{attr}_mean", f"{attr}_min", f"{attr}_max"]
+    return fields
+
+
+def encode_tile(zoom, x, y, cells):
+    """一个瓦片编码为gzip压缩的JSON：每个格子一行，字段顺序见 tile_fields()，缺失值为null"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = cells.sum / cells.n
+    columns = [cells.gx % CELLS_PER_TILE, cells.gy % CELLS_PER_TILE, cells.count]
+    for i in range(len(TILE_ATTRIBUTES)):
+        columns += [cells.n[:, i], np.round(mean[:, i], 3),
+                    np.round(cells.min[:, i], 3), np.round(cells.max[:, i], 3)]
+    rows = []
+    for row in zip(*(c.tolist() for c in columns)):
+        rows.append([None if isinstance(v, float) and math.isnan(v) else v for v in row])
+    data = json.dumps({'z': zoom, 'x': x, 'y': y, 'cells': rows}, separators=(',', ':')).encode('utf-8')
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+# ----------------------------------------------------------------------
+# 构建
+# ----------------------------------------------------------------------
+
+class TilePyramidBuilder:
+    """
+    从数据库读取样本点，构建 min_zoom..max_zoom 的瓦片金字塔
+
+    partition_zoom - 并行分区的层级：每个分区瓦片内的点独立构建 max_zoom..partition_zoom，
+                     更低的层级由各分区的结果合并得到
+    """
+
+    def __init__(self, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, partition_zoom=PARTITION_ZOOM, workers=4):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.partition_zoom = min(max(partition_zoom, min_zoom), max_zoom)
+        self.workers = workers
+        self.lats = self.lons = self.values = None
+
+    def read_points(self, engine, fetch_size=100000):
+        """读取样本坐标及检测指标（样本左连接检测数据），返回点数"""
+        attrs = ", ".join(f"t.{a}" for a in TILE_ATTRIBUTES)
+        sql = (f"SELECT s.latitude, s.longitude, {attrs} FROM soil_samples s "
+               f"LEFT JOIN soil_test_data t ON s.id = t.sample_id "
+               f"WHERE s.latitude IS NOT NULL AND s.longitude IS NOT NULL")
+        chunks = []
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(text(sql))
+            while True:
+                rows = result.fetchmany(fetch_size)
+                if not rows:
+                    break
+                chunks.append(np.array([[np.nan if v is None else float(v) for v in row] for row in rows]))
+        data = np.vstack(chunks) if chunks else np.empty((0, 2 + len(TILE_ATTRIBUTES)))
+        self.set_points(data[:, 0], data[:, 1], data[:, 2:])
+        return len(data)
+
+    def set_points(self, lats, lons, values):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+
+    def _build_partition(self, point_index):
+        """一个分区：最高层级从点汇总，逐级向下合并到分区层级，返回 (瓦片列表, 分区层级的格子)"""
+        gx, gy = mercator_cells(self.lats[point_index], self.lons[point_index], self.max_zoom)
+        cells = CellStats.from_points(gx, gy, self.values[point_index]).grouped()
+        tiles = []
+        for zoom in range(self.max_zoom, self.partition_zoom - 1, -1):
+            if zoom < self.max_zoom:
+                cells = cells.grouped(shift=1)
+            if zoom >= self.min_zoom:
+                tiles += [(zoom, x, y, encode_tile(zoom, x, y, c)) for (x, y), c in cells.tiles()]
+        return tiles, cells
+
+    def build(self):
+        """构建全部瓦片，返回 [(z, x, y, 数据)]"""
+        gx, gy = mercator_cells(self.lats, self.lons, self.partition_zoom)
+        partition = (gx // CELLS_PER_TILE) * (1 << self.partition_zoom) + gy // CELLS_PER_TILE
+        order = np.argsort(partition, kind='stable')
+        bounds = np.flatnonzero(np.r_[True, partition[order][1:] != partition[order][:-1]]) if len(order) else []
+        groups = np.split(order, bounds[1:]) if len(order) else []
+
+        tiles = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(self._build_partition, groups))
+        for partition_tiles, _ in results:
+            tiles += partition_tiles
+
+        # 分区层级以下由各分区的格子合并
+        cells = CellStats.concat([c for _, c in results])
+        for zoom in range(self.partition_zoom - 1, self.min_zoom - 1, -1):
+            cells = cells.grouped(shift=1)
+            tiles += [(zoom, x, y, encode_tile(zoom, x, y, c)) for (x, y), c in cells.tiles()]
+        tiles.sort(key=lambda t: t[:3])
+        return tiles
+
+
+# ----------------------------------------------------------------------
+# 瓦片文件
+# ----------------------------------------------------------------------
+
+def write_tile_store(path, tiles, metadata):
+    """写入瓦片文件（先写临时文件再替换，读取方不会读到写了一半的文件）"""
+    meta = json.dumps(dict(metadata, tiles=len(tiles)), ensure_ascii=False).encode('utf-8')
+    header_size = len(TILE_MAGIC) + 4 + len(meta) + INDEX_ENTRY.size * len(tiles)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(TILE_MAGIC)
+        f.write(struct.pack('<I', len(meta)))
+        f.write(meta)
+        offset = header_size
+        for zoom, x, y, data in tiles:
+            f.write(INDEX_ENTRY.pack(zoom, x, y, offset, len(data)))
+            offset += len(data)
+        for *_, data in tiles:
+            f.write(data)
+    os.replace(tmp_path, path)
+    return offset
+
+
+class TileStore:
+    """读取瓦片文件：启动时只加载索引，按需读取单个瓦片"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(TILE_MAGIC)) != TILE_MAGIC:
+                raise ValueError(f"{path} 不是瓦片文件")
+            (meta_len,) = struct.unpack('<I', f.read(4))
+            self.metadata = json.loads(f.read(meta_len))
+            raw = f.read(INDEX_ENTRY.size * self.metadata['tiles'])
+        self.index = {}
+        for zoom, x, y, offset, length in INDEX_ENTRY.iter_unpack(raw):
+            self.index[(zoom, x, y)] = (offset, length)
+
+    def get_raw(self, zoom, x, y):
+        """gzip压缩的瓦片数据，不存在时返回None"""
+        entry = self.index.get((zoom, x, y))
+        if entry is None:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(entry[0])
+            return f.read(entry[1])
+
+    def get(self, zoom, x, y):
+        data = self.get_raw(zoom, x, y)
+        return None if data is None else json.loads(gzip.decompress(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建热力图瓦片金字塔")
+    parser.add_argument('--url', help="数据库连接URL")
+    parser.add_argument('--output', default=os.path.join('static', 'tiles', 'soil_heatmap.tiles'), help="瓦片文件路径")
+    parser.add_argument('--min-zoom', type=int, default=MIN_ZOOM)
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    parser.add_argument('--partition-zoom', type=int, default=PARTITION_ZOOM, help="并行分区的层级")
+    parser.add_argument('--workers', type=int, default=4, help="并行构建的线程数")
+    parser.add_argument('--show', nargs=3, type=int, metavar=('Z', 'X', 'Y'), help="显示已构建的某个瓦片")
+    args = parser.parse_args()
+
+    if args.show:
+        store = TileStore(args.output)
+        tile = store.get(*args.show)
+        if tile is None:
+            print("⚠️  瓦片不存在")
+            return 1
+        print(f"🧩 瓦片 {args.show}: {len(tile['cells'])} 个格子，{sum(c[2] for c in tile['cells']):,} 个点")
+        return 0
+    if not args.url:
+        parser.error("需要 --url")
+
+    builder = TilePyramidBuilder(args.min_zoom, args.max_zoom, args.partition_zoom, args.workers)
+    engine = create_engine(args.url)
+    start = time.time()
+    points = builder.read_points(engine)
+    engine.dispose()
+    print(f"📥 读取 {points:,} 个样本点，耗时 {time.time() - start:.2f}s")
+
+    start = time.time()
+    tiles = builder.build()
+    print(f"🧩 生成 {len(tiles):,} 个瓦片（第 {args.min_zoom}-{args.max_zoom} 级），耗时 {time.time() - start:.2f}s")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    size = write_tile_store(args.output, tiles, {
+        'format': 'soil-heatmap', 'attributes': TILE_ATTRIBUTES, 'fields': tile_fields(),
+        'cells_per_tile': CELLS_PER_TILE,
+        'min_zoom': args.min_zoom, 'max_zoom': args.max_zoom, 'points': points,
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    print(f"💾 瓦片文件已写入: {args.output}（{size / 1024 / 1024:.1f} MB）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
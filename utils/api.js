@@ -153,6 +153,23 @@ class SoilDataAPI {
       return [];
     }
   }
+
+  // 获取热力图瓦片，瓦片范围内没有样本时返回 null
+  async getHeatmapTile(z, x, y) {
+    return new Promise((resolve) => {
+      uni.request({
+        url: `${baseUrl}/tiles/${z}/${x}/${y}`,
+        method: 'GET',
+        success: (res) => {
+          resolve(res.statusCode === 200 ? res.data : null);
+        },
+        fail: (error) => {
+          console.error('❌ 获取热力图瓦片失败:', error);
+          resolve(null);
+        }
+      });
+    });
+  }
 }
 
 // 创建API实例
@@ -17,8 +17,37 @@ const dbConfig = {
 // 创建连接池
 const pool = mysql.createPool(dbConfig);
 
+// 看板汇总表（由 summary_tables.py 在装载时维护）中某项指标的均值
+const summaryAvg = (metric) => `${metric}_sum / NULLIF(${metric}_n, 0)`;
+
 // 数据库查询封装
 class DatabaseService {
+  // 汇总表是否与业务表一致：summary_state 中 summary_version 追上 load_version
+  // （没有标记、装载时未维护汇总表或重建失败时均视为过期）
+  async summaryFresh() {
+    try {
+      const [rows] = await pool.execute(
+        'SELECT load_version, summary_version FROM summary_state WHERE id = 1'
+      );
+      return rows.length > 0 && Number(rows[0].summary_version) >= Number(rows[0].load_version);
+    } catch (err) {
+      return false;
+    }
+  }
+
+  // 查询看板汇总表；汇总表不存在、为空或早于最近一次装载时返回 null，由调用方改用明细查询
+  async querySummary(sql, params = []) {
+    try {
+      if (!(await this.summaryFresh())) {
+        return null;
+      }
+      const [rows] = await pool.execute(sql, params);
+      return rows.length > 0 ? rows : null;
+    } catch (err) {
+      return null;
+    }
+  }
+
   // 获取土壤样本数据（用于地图显示）
   async getSoilSamples(filters = {}) {
     try {
@@ -205,7 +234,19 @@ class DatabaseService {
         LIMIT 10
       `;
       
-      const [rows] = await pool.execute(sql);
+      const rows = await this.querySummary(`
+        SELECT
+          bucket as province,
+          ${summaryAvg('total_nitrogen')} as avg_nitrogen,
+          ${summaryAvg('available_phosphorus')} as avg_phosphorus,
+          ${summaryAvg('available_potassium')} as avg_potassium,
+          ${summaryAvg('organic_matter')} as avg_organic,
+          row_count as sample_count
+        FROM summary_province
+        WHERE row_count > 0
+        ORDER BY row_count DESC
+        LIMIT 10
+      `) || (await pool.execute(sql))[0];
       return rows.map(row => ({
         province: row.province,
         nitrogen: parseFloat(row.avg_nitrogen) || 0,
@@ -239,7 +280,12 @@ class DatabaseService {
         ORDER BY MIN(t.ph_value)
       `;
       
-      const [rows] = await pool.execute(sql);
+      const rows = await this.querySummary(`
+        SELECT bucket as ph_range, ph_value_n as count
+        FROM summary_ph_range
+        WHERE ph_value_n > 0
+        ORDER BY ph_value_sum / ph_value_n
+      `) || (await pool.execute(sql))[0];
       return rows.map(row => ({
         name: row.ph_range,
         value: row.count
@@ -264,7 +310,12 @@ class DatabaseService {
         ORDER BY count DESC
       `;
       
-      const [rows] = await pool.execute(sql);
+      const rows = await this.querySummary(`
+        SELECT bucket as texture, sample_count as count
+        FROM summary_soil_type
+        WHERE sample_count > 0
+        ORDER BY sample_count DESC
+      `) || (await pool.execute(sql))[0];
       return rows.map(row => ({
         name: row.texture,
         value: row.count
@@ -293,7 +344,19 @@ class DatabaseService {
         ORDER BY month
       `;
       
-      const [rows] = await pool.execute(sql, [months]);
+      // 汇总表按整月统计，起始月份整月计入
+      const rows = await this.querySummary(`
+        SELECT
+          bucket as month,
+          ${summaryAvg('total_nitrogen')} as avg_nitrogen,
+          ${summaryAvg('available_phosphorus')} as avg_phosphorus,
+          ${summaryAvg('available_potassium')} as avg_potassium,
+          ${summaryAvg('organic_matter')} as avg_organic,
+          row_count as sample_count
+        FROM summary_month
+        WHERE bucket >= DATE_FORMAT(DATE_SUB(NOW(), INTERVAL ? MONTH), '%Y-%m')
+        ORDER BY bucket
+      `, [months]) || (await pool.execute(sql, [months]))[0];
       return rows.map(row => ({
         month: row.month,
         nitrogen: parseFloat(row.avg_nitrogen) || 0,
@@ -367,7 +430,11 @@ class DatabaseService {
   // 获取统计概况数据
   async getStatisticsOverview() {
     try {
-      const [sampleCount] = await pool.execute('SELECT COUNT(*) as count FROM soil_samples');
+      // 样本总数和平均pH优先读取汇总表
+      const total = await this.querySummary(
+        `SELECT sample_count as count, ${summaryAvg('ph_value')} as avg_ph FROM summary_total`
+      );
+      const sampleCount = total || (await pool.execute('SELECT COUNT(*) as count FROM soil_samples'))[0];
       
       // 安全地查询省份数量
       let provinceCount = [{ count: 0 }];
@@ -393,11 +460,13 @@ class DatabaseService {
         }
       
       // 安全地查询平均pH值
-      let avgPh = [{ avg_ph: 7.0 }];
-      try {
-        [avgPh] = await pool.execute('SELECT AVG(ph_value) as avg_ph FROM soil_test_data WHERE ph_value IS NOT NULL');
-      } catch (err) {
-        console.warn('soil_test_data表不存在，使用默认值');
+      let avgPh = total || [{ avg_ph: 7.0 }];
+      if (!total) {
+        try {
+          [avgPh] = await pool.execute('SELECT AVG(ph_value) as avg_ph FROM soil_test_data WHERE ph_value IS NOT NULL');
+        } catch (err) {
+          console.warn('soil_test_data表不存在，使用默认值');
+        }
       }
 
       return {
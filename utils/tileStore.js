@@ -0,0 +1,78 @@
+// 热力图瓦片文件读取（文件由 tile_pyramid.py 生成）
+// 格式：8字节标识 SOILTIL1 | uint32 元数据长度 | 元数据JSON | 索引项 × N | 瓦片数据（gzip压缩的JSON）
+// 索引项：uint8 z, uint32 x, uint32 y, uint64 偏移, uint32 长度（小端）
+const fs = require('fs');
+const path = require('path');
+
+const TILE_MAGIC = 'SOILTIL1';
+const INDEX_ENTRY_SIZE = 21;
+const DEFAULT_TILE_FILE = path.join(__dirname, '..', 'static', 'tiles', 'soil_heatmap.tiles');
+
+class TileStore {
+  constructor(filePath = process.env.SOIL_TILE_FILE || DEFAULT_TILE_FILE) {
+    this.filePath = filePath;
+    this.index = null;
+    this.metadata = null;
+    this.mtime = 0;
+  }
+
+  // 只加载元数据和索引；瓦片文件被重新生成后自动重新加载
+  load() {
+    const stat = fs.statSync(this.filePath);
+    if (this.index && stat.mtimeMs === this.mtime) {
+      return;
+    }
+    const fd = fs.openSync(this.filePath, 'r');
+    try {
+      const head = Buffer.alloc(12);
+      fs.readSync(fd, head, 0, 12, 0);
+      if (head.toString('latin1', 0, 8) !== TILE_MAGIC) {
+        throw new Error(`${this.filePath} 不是瓦片文件`);
+      }
+      const metaLength = head.readUInt32LE(8);
+      const meta = Buffer.alloc(metaLength);
+      fs.readSync(fd, meta, 0, metaLength, 12);
+      const metadata = JSON.parse(meta.toString('utf8'));
+      const raw = Buffer.alloc(metadata.tiles * INDEX_ENTRY_SIZE);
+      fs.readSync(fd, raw, 0, raw.length, 12 + metaLength);
+      const index = new Map();
+      for (let i = 0; i < metadata.tiles; i++) {
+        const offset = i * INDEX_ENTRY_SIZE;
+        const z = raw.readUInt8(offset);
+        const x = raw.readUInt32LE(offset + 1);
+        const y = raw.readUInt32LE(offset + 5);
+        index.set(`${z}/${x}/${y}`, [Number(raw.readBigUInt64LE(offset + 9)), raw.readUInt32LE(offset + 17)]);
+      }
+      this.metadata = metadata;
+      this.index = index;
+      this.mtime = stat.mtimeMs;
+    } finally {
+      fs.closeSync(fd);
+    }
+  }
+
+  getMetadata() {
+    this.load();
+    return this.metadata;
+  }
+
+  // 返回gzip压缩的瓦片数据，瓦片不存在（该范围内没有样本）时返回 null
+  getTile(z, x, y) {
+    this.load();
+    const entry = this.index.get(`${z}/${x}/${y}`);
+    if (!entry) {
+      return null;
+    }
+    const [offset, length] = entry;
+    const data = Buffer.alloc(length);
+    const fd = fs.openSync(this.filePath, 'r');
+    try {
+      fs.readSync(fd, data, 0, length, offset);
+    } finally {
+      fs.closeSync(fd);
+    }
+    return data;
+  }
+}
+
+module.exports = new TileStore();